@@ -1,11 +1,16 @@
 """SwaggerToSdk core tools.
 """
 from enum import Enum, unique
+from functools import lru_cache
+import hashlib
 import json
 import logging
 import os
 import re
+import shutil
+import statistics
 import tempfile
+from threading import Lock
 from pathlib import Path
 
 import requests
@@ -28,16 +33,102 @@ CONFIG_FILE = 'swagger_to_sdk_config.json'
 
 DEFAULT_COMMIT_MESSAGE = 'Generated from {hexsha}'
 
+# Where SwaggerToSdk keeps data between runs. Can be overriden by this environment variable.
+CACHE_DIR_ENV = 'SWAGGER_TO_SDK_CACHE_DIR'
+
+# If set, GitHub API base url to use instead of api.github.com (i.e. a fake GitHub)
+GITHUB_API_URL_ENV = "SWAGGER_TO_SDK_GITHUB_API_URL"
+
+# How many generation durations are kept per project
+_HISTORY_SIZE = 10
+_HISTORY_LOCK = Lock()
+
+_GITHUB_CLIENTS = {}
+_GITHUB_CLIENTS_LOCK = Lock()
+
+
+def get_cache_dir(*subfolders):
+    """Get (and create) the folder where SwaggerToSdk keeps data between runs."""
+    cache_dir = Path(os.environ.get(CACHE_DIR_ENV) or Path.home() / ".swaggertosdk", *subfolders)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+class GenerationHistory:
+    """Durations of the previous generations of each project, stored as JSON in the cache dir.
+    """
+    def __init__(self, history_path=None):
+        self.history_path = Path(history_path or get_cache_dir() / "generation_history.json")
+
+    def load(self):
+        try:
+            with open(self.history_path, 'r') as history_fd:
+                return json.load(history_fd)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, project, duration):
+        with _HISTORY_LOCK:
+            history = self.load()
+            durations = history.setdefault(str(project), [])
+            durations.append(duration)
+            del durations[:-_HISTORY_SIZE]
+            temp_path = self.history_path.with_suffix(".{}.tmp".format(os.getpid()))
+            with open(temp_path, 'w') as history_fd:
+                json.dump(history, history_fd, indent=2)
+            temp_path.replace(self.history_path)
+
+    def estimate(self, project):
+        """Estimated duration in seconds of this project generation, None if never generated."""
+        durations = self.load().get(str(project))
+        if not durations:
+            return None
+        return statistics.median(durations)
+
 
 def build_file_content():
-    autorest_version = autorest_latest_version_finder()
-    autorest_bootstrap_version = autorest_bootstrap_version_finder()
+    return dict(get_toolchain_versions())
+
+
+def _autorest_bin_stat():
+    """Return the autorest path in PATH and its mtime, used to invalidate the toolchain cache."""
+    autorest_bin = shutil.which("autorest")
+    try:
+        autorest_mtime = os.stat(autorest_bin).st_mtime if autorest_bin else None
+    except OSError:
+        autorest_mtime = None
+    return autorest_bin, autorest_mtime
+
+
+@lru_cache(maxsize=1)
+def _toolchain_versions(autorest_bin, autorest_mtime):
+    del autorest_bin, autorest_mtime  # Cache keys only
+    _LOGGER.info("Probing Autorest toolchain versions")
     return {
-        'autorest': autorest_version,
-        'autorest_bootstrap': autorest_bootstrap_version,
+        'autorest': autorest_latest_version_finder(),
+        'autorest_bootstrap': autorest_bootstrap_version_finder(),
     }
 
 
+def get_toolchain_versions():
+    """Get the Autorest toolchain versions.
+
+    Probing starts node/npm, so this is computed once per process and recomputed
+    only if the autorest binary path or mtime changes.
+    """
+    return _toolchain_versions(*_autorest_bin_stat())
+
+
+def get_toolchain_fingerprint():
+    """A stable hash of the toolchain versions, to be used in cache keys."""
+    versions = json.dumps(get_toolchain_versions(), sort_keys=True, default=str)
+    return hashlib.sha256(versions.encode()).hexdigest()
+
+
+def clear_toolchain_cache():
+    _toolchain_versions.cache_clear()
+
+
 def get_repo_tag_meta(meta_conf):
     repotag = meta_conf.get("repotag")
     if repotag:
@@ -175,6 +266,20 @@ def read_config(sdk_git_folder, config_file):
     with open(config_path, 'r') as config_fd:
         return json.loads(config_fd.read())
 
+def get_github_client(gh_token):
+    """Github client, using SWAGGER_TO_SDK_GITHUB_API_URL as API url if set.
+
+    The client is shared by the jobs, its last response gives the remaining API quota.
+    """
+    base_url = os.environ.get(GITHUB_API_URL_ENV)
+    with _GITHUB_CLIENTS_LOCK:
+        if (gh_token, base_url) not in _GITHUB_CLIENTS:
+            if base_url:
+                _GITHUB_CLIENTS[(gh_token, base_url)] = Github(gh_token, base_url=base_url)
+            else:
+                _GITHUB_CLIENTS[(gh_token, base_url)] = Github(gh_token)
+        return _GITHUB_CLIENTS[(gh_token, base_url)]
+
 def read_config_from_github(sdk_id, branch="master", gh_token=None):
     raw_link = str(get_configuration_github_path(sdk_id, branch))
     _LOGGER.debug("Will try to download: %s", raw_link)
@@ -189,10 +294,14 @@ def read_config_from_github(sdk_id, branch="master", gh_token=None):
         ))
     return json.loads(response.text)
 
-def extract_conf_from_readmes(swagger_files_in_pr, restapi_git_folder, sdk_git_id, config):
+def extract_conf_from_readmes(swagger_files_in_pr, restapi_git_folder, sdk_git_id, config, readme_confs=None):
+    """Add to config the projects of these readmes for this SDK.
+
+    :param dict readme_confs: If given, cache of the readme swagger-to-sdk sections, to share between SDKs.
+    """
     readme_files_in_pr = {readme for readme in swagger_files_in_pr if getattr(readme, "name", readme).lower().endswith("readme.md")}
     for readme_file in readme_files_in_pr:
-        build_swaggertosdk_conf_from_json_readme(readme_file, sdk_git_id, config, base_folder=restapi_git_folder)
+        build_swaggertosdk_conf_from_json_readme(readme_file, sdk_git_id, config, base_folder=restapi_git_folder, readme_confs=readme_confs)
 
 def get_readme_path(readme_file, base_folder='.'):
     """Get a readable Readme path.
@@ -207,7 +316,7 @@ def get_readme_path(readme_file, base_folder='.'):
             base_folder='.'
         return str(Path(base_folder) / Path(readme_file))
 
-def build_swaggertosdk_conf_from_json_readme(readme_file, sdk_git_id, config, base_folder='.'):
+def build_swaggertosdk_conf_from_json_readme(readme_file, sdk_git_id, config, base_folder='.', readme_confs=None):
     """Get the JSON conf of this README, and create SwaggerToSdk conf.
 
     Readme path can be any readme syntax accepted by autorest.
@@ -216,13 +325,20 @@ def build_swaggertosdk_conf_from_json_readme(readme_file, sdk_git_id, config, ba
     :param str readme_file: A path that Autorest accepts. Raw GH link or absolute path.
     :param str sdk_dit_id: Repo ID. IF org/login is provided, will be stripped.
     :config dict config: Config where to update the "projects" key.
+    :param dict readme_confs: If given, cache of the swagger-to-sdk sections by readme path, Autorest is
+     called only for the readmes not in it.
     """
     readme_full_path = get_readme_path(readme_file, base_folder)
-    with tempfile.TemporaryDirectory() as temp_dir:
-        readme_as_conf = autorest_swagger_to_sdk_conf(
-            readme_full_path,
-            temp_dir
-        )
+    if readme_confs is not None and readme_full_path in readme_confs:
+        readme_as_conf = readme_confs[readme_full_path]
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            readme_as_conf = autorest_swagger_to_sdk_conf(
+                readme_full_path,
+                temp_dir
+            )
+        if readme_confs is not None:
+            readme_confs[readme_full_path] = readme_as_conf
     sdk_git_short_id = sdk_git_id.split("/")[-1].lower()
     _LOGGER.info("Looking for tag {} in readme {}".format(sdk_git_short_id, readme_file))
     for swagger_to_sdk_conf in readme_as_conf:
@@ -25,7 +25,7 @@ _LOGGER = logging.getLogger(__name__)
 
 
 def generate_sdk(sdk_git_id, base_branch_name,
-                 autorest_bin=None):
+                 autorest_bin=None, plan=False):
     """Main method of the the file"""
 
     # On Travis, local folder is restapi git folder
@@ -34,6 +34,37 @@ def generate_sdk(sdk_git_id, base_branch_name,
     config = read_config_from_github(sdk_git_id, base_branch_name)
     global_conf = config["meta"]
 
+    swagger_files_in_pr = get_files_in_commit(restapi_git_folder)
+    _LOGGER.info("Files in PR: %s ", swagger_files_in_pr)
+    swagger_files_in_pr = get_readme_files_from_file_list(swagger_files_in_pr, restapi_git_folder)
+    _LOGGER.info("Readmes in PR: %s ", swagger_files_in_pr)
+
+    # Look for configuration in Readme
+    extract_conf_from_readmes(swagger_files_in_pr, restapi_git_folder, sdk_git_id, config)
+
+    def skip_callback(project, local_conf):
+        if not swagger_files_in_pr:
+            return True # Travis with no files found, always skip
+
+        markdown_relative_path, optional_relative_paths = get_input_paths(global_conf, local_conf)
+
+        if swagger_files_in_pr and not (
+                markdown_relative_path in swagger_files_in_pr or
+                any(input_file in swagger_files_in_pr for input_file in optional_relative_paths)):
+            _LOGGER.info(f"In project {project} no files involved in this PR")
+            return True
+        return False
+
+    from . import SwaggerToSdkNewCLI
+
+    if plan:
+        # SDK is not cloned, clone path is only used to solve relative paths
+        clone_dir = Path(tempfile.gettempdir()) / Path(global_conf.get("advanced_options", {}).get("clone_dir", "sdk"))
+        generation_plan = SwaggerToSdkNewCLI.plan_libraries(config, skip_callback, restapi_git_folder,
+                                                            clone_dir, autorest_bin)
+        print(SwaggerToSdkNewCLI.format_plan(generation_plan))
+        return generation_plan
+
     # No token is provided to clone SDK. Do NOT try to clone a private it will fail.
     with tempfile.TemporaryDirectory() as temp_dir:
 
@@ -44,28 +75,6 @@ def generate_sdk(sdk_git_id, base_branch_name,
 
             sdk_repo = Repo(str(sdk_folder))
 
-            swagger_files_in_pr = get_files_in_commit(restapi_git_folder)
-            _LOGGER.info("Files in PR: %s ", swagger_files_in_pr)
-            swagger_files_in_pr = get_readme_files_from_file_list(swagger_files_in_pr, restapi_git_folder)
-            _LOGGER.info("Readmes in PR: %s ", swagger_files_in_pr)
-
-            # Look for configuration in Readme
-            extract_conf_from_readmes(swagger_files_in_pr, restapi_git_folder, sdk_git_id, config)
-
-            def skip_callback(project, local_conf):
-                if not swagger_files_in_pr:
-                    return True # Travis with no files found, always skip
-
-                markdown_relative_path, optional_relative_paths = get_input_paths(global_conf, local_conf)
-
-                if swagger_files_in_pr and not (
-                        markdown_relative_path in swagger_files_in_pr or
-                        any(input_file in swagger_files_in_pr for input_file in optional_relative_paths)):
-                    _LOGGER.info(f"In project {project} no files involved in this PR")
-                    return True
-                return False
-
-            from . import SwaggerToSdkNewCLI
             SwaggerToSdkNewCLI.build_libraries(config, skip_callback, restapi_git_folder,
                                             sdk_repo, temp_dir, autorest_bin)
 
@@ -99,6 +108,9 @@ def main(argv):
     parser.add_argument('--autorest',
                         dest='autorest_bin',
                         help='Force the Autorest to be executed. Must be a executable command.')
+    parser.add_argument('--plan',
+                        dest='plan', action='store_true',
+                        help='Print the projects that would be generated, and estimated durations, without generating.')
     parser.add_argument("-v", "--verbose",
                         dest="verbose", action="store_true",
                         help="Verbosity in INFO mode")
@@ -118,4 +130,5 @@ def main(argv):
 
     generate_sdk(args.sdk_git_id,
                  args.base_branch,
-                 args.autorest_bin)
+                 args.autorest_bin,
+                 args.plan)
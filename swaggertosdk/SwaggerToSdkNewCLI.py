@@ -1,40 +1,75 @@
 """Swagger to SDK"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
 import shutil
+import subprocess
 import logging
 import json
 from pathlib import Path
 import tempfile
+import time
 
 from git import Repo, GitCommandError
+from github import GithubException, UnknownObjectException
 
 from .SwaggerToSdkCore import (
     read_config_from_github,
     DEFAULT_COMMIT_MESSAGE,
     get_input_paths,
     extract_conf_from_readmes,
-    get_readme_files_from_git_object,
     build_file_content,
     solve_relative_path,
-    this_conf_will_generate_for_this_pr
+    this_conf_will_generate_for_this_pr,
+    GenerationHistory,
+    get_github_client,
+    get_toolchain_fingerprint,
 )
 from .autorest_tools import (
+    build_autorest_cmd_line,
     execute_simple_command,
     generate_code,
     merge_options,
 )
+from .branch_locks import BranchLockManager
+from .generation_ledger import GenerationLedger, get_ledger_key
+from .swagger_graph import (
+    SwaggerGraph,
+    get_impacted_readme_files,
+    is_tag_impacted,
+)
 from azure_devtools.ci_tools.git_tools import (
     checkout_and_create_branch,
-    do_commit,
 )
 from azure_devtools.ci_tools.github_tools import (
     configure_user,
+    get_files,
     manage_git_folder,
 )
 
 
 _LOGGER = logging.getLogger(__name__)
 
+# Environment variable listing the output dirs of the projects generated in this batch
+OUTPUT_DIRS_ENV = "SWAGGER_TO_SDK_OUTPUT_DIRS"
+
+# Hashes of the last generated code, written next to build.json
+BUILD_MANIFEST_FILE = "build_manifest.json"
+
+# How many times a push is tried again after being rejected because origin moved
+_PUSH_RETRIES = 3
+
+ProjectPlan = namedtuple(
+    'ProjectPlan',
+    ['project', 'cmd_line', 'output_dir', 'estimated_duration']
+)
+
+# A SDK to generate, see generate_sdk_from_git_object for the meaning of the fields
+SdkTarget = namedtuple(
+    'SdkTarget',
+    ['sdk_git_id', 'branch_name', 'base_branch_names', 'fallback_base_branch_name', 'sdk_tag']
+)
 
 def move_wrapper_files_or_dirs(src_root, dst_root, global_conf, local_conf):
     """Save wrapper files somewhere for replace them after generation.
@@ -71,17 +106,8 @@ def delete_extra_files(sdk_root, global_conf, local_conf):
                 shutil.rmtree(str(file_path))
 
 
-def move_autorest_files(client_generated_path, sdk_root, global_conf, local_conf):
-    """Update data from generated to final folder.
-
-    This is one only if output_dir is set, otherwise it's considered generated in place
-    and does not required moving
-    """
-    dest = local_conf.get('output_dir', None)
-    if not dest:
-        return
-    destination_folder = get_local_path_dir(sdk_root, dest)
-
+def get_generated_path(client_generated_path, global_conf, local_conf):
+    """Folder of the generated code to move to output_dir, using generated_relative_base_directory."""
     generated_relative_base_directory = local_conf.get('generated_relative_base_directory') or \
         global_conf.get('generated_relative_base_directory')
 
@@ -102,29 +128,116 @@ def move_autorest_files(client_generated_path, sdk_root, global_conf, local_conf
             _LOGGER.critical(err_msg)
             raise ValueError(err_msg)
 
+    return client_generated_path
+
+
+def move_autorest_files(client_generated_path, sdk_root, global_conf, local_conf):
+    """Update data from generated to final folder.
+
+    This is one only if output_dir is set, otherwise it's considered generated in place
+    and does not required moving
+    """
+    dest = local_conf.get('output_dir', None)
+    if not dest:
+        return
+    destination_folder = get_local_path_dir(sdk_root, dest)
+    client_generated_path = get_generated_path(client_generated_path, global_conf, local_conf)
+
     shutil.rmtree(str(destination_folder))
     # This does not work in Windows if generatd and dest are not in the same drive
     # client_generated_path.replace(destination_folder)
     shutil.move(client_generated_path, destination_folder)
 
 
-def write_build_file(sdk_root, local_conf):
+def write_build_file(sdk_root, local_conf, manifest=None):
     build_dir = local_conf.get('build_dir')
     if build_dir:
         build_folder = get_local_path_dir(sdk_root, build_dir)
         build_file = Path(build_folder, "build.json")
         with open(build_file, 'w') as build_fd:
             json.dump(build_file_content(), build_fd, indent=2)
+        if manifest is not None:
+            with open(Path(build_folder, BUILD_MANIFEST_FILE), 'w') as manifest_fd:
+                json.dump(manifest, manifest_fd, indent=2, sort_keys=True)
+
+
+def build_manifest(generated_path, global_conf, local_conf):
+    """Hashes of the generated code, and of the conf that post-processes it."""
+    post_processing_conf = {
+        "after_scripts": local_conf.get("after_scripts") or [],
+        "wrapper_filesOrDirs": merge_options(global_conf, local_conf, "wrapper_filesOrDirs") or [],
+        "delete_filesOrDirs": merge_options(global_conf, local_conf, "delete_filesOrDirs") or [],
+    }
+    files = {}
+    for file_path in sorted(generated_path.rglob("*")):
+        if file_path.is_file():
+            files[file_path.relative_to(generated_path).as_posix()] = hashlib.sha256(file_path.read_bytes()).hexdigest()
+    return {
+        "conf": hashlib.sha256(json.dumps(post_processing_conf, sort_keys=True).encode()).hexdigest(),
+        "files": files,
+    }
+
+
+def read_manifest(sdk_root, local_conf):
+    """Manifest of the last generation of this project, or None."""
+    build_dir = local_conf.get('build_dir')
+    if not build_dir:
+        return None
+    try:
+        with open(Path(sdk_root, build_dir, BUILD_MANIFEST_FILE), 'r') as manifest_fd:
+            return json.load(manifest_fd)
+    except (OSError, ValueError):
+        return None
 
 
-def execute_after_script(sdk_root, global_conf, local_conf):
-    after_scripts = merge_options(global_conf, local_conf, "after_scripts", keep_list_order=True) or []
+def execute_after_script(sdk_root, global_conf, local_conf, cancel_token=None):
+    """Execute the after_scripts of this project.
+
+    Meta after_scripts are not executed here, see execute_meta_after_script.
+    """
+    after_scripts = local_conf.get("after_scripts") or []
+    _execute_scripts(after_scripts, sdk_root, global_conf, cancel_token=cancel_token)
+
+
+def execute_meta_after_script(sdk_root, global_conf, output_dirs, cancel_token=None):
+    """Execute the meta after_scripts once for all the projects generated in this batch.
+
+    The output_dir of each generated project is available to the scripts in the
+    SWAGGER_TO_SDK_OUTPUT_DIRS environment variable (space separated, relative to SDK root).
+    """
+    after_scripts = global_conf.get("after_scripts") or []
+    _execute_scripts(after_scripts, sdk_root, global_conf, {OUTPUT_DIRS_ENV: " ".join(output_dirs)}, cancel_token)
+
+
+def _execute_scripts(after_scripts, sdk_root, global_conf, extra_envs=None, cancel_token=None):
     local_envs = dict(os.environ)
     local_envs.update(global_conf.get("envs", {}))
+    local_envs.update(extra_envs or {})
 
     for script in after_scripts:
         _LOGGER.info("Execute after script: %s", script)
-        execute_simple_command(script, cwd=sdk_root, shell=True, env=local_envs)
+        execute_simple_command(script, cwd=sdk_root, shell=True, env=local_envs, cancel_token=cancel_token)
+
+
+def get_output_dir(local_conf):
+    """Output dir of this project, relative to SDK root.
+
+    A project without output_dir is generated in place, so the whole SDK is concerned.
+    """
+    return local_conf.get("output_dir") or "."
+
+
+def get_written_paths(local_conf):
+    """Paths this project writes, relative to SDK root, or None if it could write anywhere.
+
+    A project generated in place, or with after_scripts, could write anywhere in the SDK.
+    """
+    if not local_conf.get("output_dir") or local_conf.get("after_scripts"):
+        return None
+    written_paths = [local_conf["output_dir"]]
+    if local_conf.get("build_dir"):
+        written_paths.append(local_conf["build_dir"])
+    return written_paths
 
 
 def get_local_path_dir(root, relative_path):
@@ -137,62 +250,261 @@ def get_local_path_dir(root, relative_path):
     return build_folder
 
 
-def build_project(temp_dir, project, absolute_markdown_path, sdk_folder, global_conf, local_conf, autorest_bin=None):
+def build_project(temp_dir, project, absolute_markdown_path, sdk_folder, global_conf, local_conf, autorest_bin=None, cancel_token=None):
+    """Generate this project in the SDK folder.
+
+    If the project has an output_dir and a build_dir, and the generated code is identical to
+    the build manifest of the last generation, the SDK folder is not touched and this returns False.
+    If cancel_token is cancelled, running processes are killed and GenerationCancelled is raised.
+    """
+    start_time = time.monotonic()
     absolute_generated_path = Path(temp_dir, project)
     absolute_save_path = Path(temp_dir, "save")
-    move_wrapper_files_or_dirs(sdk_folder, absolute_save_path, global_conf, local_conf)
+    generated_in_place = "output_dir" not in local_conf
+    if generated_in_place:
+        move_wrapper_files_or_dirs(sdk_folder, absolute_save_path, global_conf, local_conf)
     generate_code(absolute_markdown_path,
                   global_conf,
                   local_conf,
-                  absolute_generated_path if "output_dir" in local_conf else None,
-                  autorest_bin)
+                  None if generated_in_place else absolute_generated_path,
+                  autorest_bin,
+                  cancel_token)
+    manifest = None
+    if local_conf.get("output_dir") and local_conf.get("build_dir"):
+        manifest = build_manifest(
+            get_generated_path(absolute_generated_path, global_conf, local_conf),
+            global_conf,
+            local_conf
+        )
+        if manifest == read_manifest(sdk_folder, local_conf):
+            _LOGGER.info("Generated code of %s is identical to the last generation, skip post-processing", project)
+            GenerationHistory().record(project, time.monotonic() - start_time)
+            return False
+    if not generated_in_place:
+        move_wrapper_files_or_dirs(sdk_folder, absolute_save_path, global_conf, local_conf)
     move_autorest_files(absolute_generated_path, sdk_folder, global_conf, local_conf)
     move_wrapper_files_or_dirs(absolute_save_path, sdk_folder, global_conf, local_conf)
     delete_extra_files(sdk_folder, global_conf, local_conf)
-    write_build_file(sdk_folder, local_conf)
-    execute_after_script(sdk_folder, global_conf, local_conf)
+    write_build_file(sdk_folder, local_conf, manifest)
+    execute_after_script(sdk_folder, global_conf, local_conf, cancel_token)
+    GenerationHistory().record(project, time.monotonic() - start_time)
+    return True
+
+
+def plan_project(project, absolute_markdown_path, global_conf, local_conf, autorest_bin=None):
+    """What build_project would do, without executing anything."""
+    output_folder = Path("<temp_dir>", project) if "output_dir" in local_conf else None
+    cmd_line = build_autorest_cmd_line(
+        absolute_markdown_path,
+        global_conf,
+        local_conf,
+        output_folder,
+        autorest_bin or shutil.which("autorest") or "autorest"
+    )
+    return ProjectPlan(
+        project,
+        cmd_line,
+        local_conf.get("output_dir"),
+        GenerationHistory().estimate(project)
+    )
+
+
+def format_plan(plan):
+    """Human readable version of a list of ProjectPlan."""
+    lines = []
+    for project_plan in plan:
+        lines.append("Project {}".format(project_plan.project))
+        lines.append("  Output dir: {}".format(project_plan.output_dir or "(generated in place)"))
+        if project_plan.estimated_duration is None:
+            lines.append("  Estimated duration: unknown")
+        else:
+            lines.append("  Estimated duration: {:.0f}s".format(project_plan.estimated_duration))
+        lines.append("  Autorest: {}".format(" ".join(project_plan.cmd_line)))
+    known_durations = [p.estimated_duration for p in plan if p.estimated_duration is not None]
+    lines.append("Total: {} project(s), estimated duration {:.0f}s ({} without history)".format(
+        len(plan),
+        sum(known_durations),
+        len(plan) - len(known_durations)
+    ))
+    return "\n".join(lines)
+
+
+def solve_global_conf(global_conf, sdk_root):
+    """Solve in place the relative paths of the "meta" conf."""
+    global_conf["autorest_options"] = solve_relative_path(global_conf.get("autorest_options", {}), sdk_root)
+    global_conf["envs"] = solve_relative_path(global_conf.get("envs", {}), sdk_root)
+    global_conf["advanced_options"] = solve_relative_path(global_conf.get("advanced_options", {}), sdk_root)
+
+
+def prepare_project(global_conf, local_conf, restapi_git_folder, sdk_root):
+    """Solve in place the relative paths of this project, and return the absolute markdown path."""
+    local_conf["autorest_options"] = solve_relative_path(local_conf.get("autorest_options", {}), sdk_root)
+
+    markdown_relative_path, optional_relative_paths = get_input_paths(global_conf, local_conf)
+    _LOGGER.info(f"Markdown input: {markdown_relative_path}")
+    _LOGGER.info(f"Optional inputs: {optional_relative_paths}")
+
+    absolute_markdown_path = None
+    if markdown_relative_path:
+        absolute_markdown_path = Path(restapi_git_folder, markdown_relative_path).resolve()
+    if optional_relative_paths:
+        local_conf.setdefault('autorest_options', {})['input-file'] = [
+            Path(restapi_git_folder, input_path).resolve()
+            for input_path
+            in optional_relative_paths
+        ]
+    return absolute_markdown_path
+
+
+def build_libraries(config, skip_callback, restapi_git_folder, sdk_repo, temp_dir, autorest_bin=None, cancel_token=None):
+    """Main method of the the file.
+
+    Returns the paths written in the SDK repo (to be given to do_scoped_commit), or None if
+    anything could have been written.
+    If cancel_token is cancelled, stops as soon as possible with GenerationCancelled.
+    """
+
+    global_conf = config["meta"]
+    solve_global_conf(global_conf, sdk_repo.working_tree_dir)
 
+    output_dirs = []
+    written_paths = []
+    for project, local_conf in config.get("projects", {}).items():
+        if skip_callback(project, local_conf):
+            _LOGGER.info("Skip project %s", project)
+            continue
+        if cancel_token:
+            cancel_token.check()
+        absolute_markdown_path = prepare_project(global_conf, local_conf, restapi_git_folder, sdk_repo.working_tree_dir)
+
+        sdk_folder = sdk_repo.working_tree_dir
+        if build_project(
+                temp_dir,
+                project,
+                absolute_markdown_path,
+                sdk_folder,
+                global_conf,
+                local_conf,
+                autorest_bin,
+                cancel_token):
+            output_dirs.append(get_output_dir(local_conf))
+            project_written_paths = get_written_paths(local_conf)
+            if written_paths is not None and project_written_paths is not None:
+                written_paths += project_written_paths
+            else:
+                written_paths = None
 
-def build_libraries(config, skip_callback, restapi_git_folder, sdk_repo, temp_dir, autorest_bin=None):
-    """Main method of the the file"""
+    if output_dirs:
+        execute_meta_after_script(sdk_repo.working_tree_dir, global_conf, sorted(set(output_dirs)), cancel_token)
+        if global_conf.get("after_scripts"):
+            written_paths = None
+    return written_paths
 
+
+def plan_libraries(config, skip_callback, restapi_git_folder, sdk_folder, autorest_bin=None):
+    """Same as build_libraries, but only returns the list of ProjectPlan to build.
+
+    SDK folder is only used to solve relative paths, and does not need to exist.
+    """
     global_conf = config["meta"]
-    global_conf["autorest_options"] = solve_relative_path(global_conf.get("autorest_options", {}), sdk_repo.working_tree_dir)
-    global_conf["envs"] = solve_relative_path(global_conf.get("envs", {}), sdk_repo.working_tree_dir)
-    global_conf["advanced_options"] = solve_relative_path(global_conf.get("advanced_options", {}), sdk_repo.working_tree_dir)
+    solve_global_conf(global_conf, sdk_folder)
 
+    plan = []
     for project, local_conf in config.get("projects", {}).items():
         if skip_callback(project, local_conf):
             _LOGGER.info("Skip project %s", project)
             continue
-        local_conf["autorest_options"] = solve_relative_path(local_conf.get("autorest_options", {}), sdk_repo.working_tree_dir)
-
-        markdown_relative_path, optional_relative_paths = get_input_paths(global_conf, local_conf)
-        _LOGGER.info(f"Markdown input: {markdown_relative_path}")
-        _LOGGER.info(f"Optional inputs: {optional_relative_paths}")
-
-        absolute_markdown_path = None
-        if markdown_relative_path:
-            absolute_markdown_path = Path(restapi_git_folder, markdown_relative_path).resolve()
-        if optional_relative_paths:
-            local_conf.setdefault('autorest_options', {})['input-file'] = [
-                Path(restapi_git_folder, input_path).resolve()
-                for input_path
-                in optional_relative_paths
-            ]
+        absolute_markdown_path = prepare_project(global_conf, local_conf, restapi_git_folder, sdk_folder)
+        plan.append(plan_project(project, absolute_markdown_path, global_conf, local_conf, autorest_bin))
+    return plan
+
+
+def tune_git_index(repo):
+    """Configure this clone to make "git status" and "git add" fast on huge repos.
+
+    core.splitIndex is not used: GitPython cannot read a split index, and we commit with GitPython.
+    """
+    repo.git.config("core.untrackedCache", "true")
+    repo.git.config("core.preloadIndex", "true")
+
+
+def do_scoped_commit(repo, message_template, branch_name, hexsha, paths=None):
+    """Same as do_commit, but only stages these paths (relative to working tree), if not None.
+
+    Staging only what was written avoids to scan the whole working tree of huge SDK repos.
+    """
+    if paths is None:
+        repo.git.add(repo.working_tree_dir)
+    elif paths:
+        repo.git.add("--all", "--", *sorted(set(paths)))
+
+    if not repo.git.diff(staged=True, name_only=True):
+        _LOGGER.warning('No modified files in this Autorest run')
+        return False
+
+    checkout_and_create_branch(repo, branch_name)
+    msg = message_template.format(hexsha=hexsha)
+    commit = repo.index.commit(msg)
+    _LOGGER.info("Commit done: %s", msg)
+    return commit.hexsha
 
-        sdk_folder = sdk_repo.working_tree_dir
-        build_project(
-            temp_dir,
-            project,
-            absolute_markdown_path,
-            sdk_folder,
-            global_conf,
-            local_conf,
-            autorest_bin
-        )
 
-def generate_sdk_from_git_object(git_object, branch_name, restapi_git_id, sdk_git_id, base_branch_names, *, fallback_base_branch_name="master", sdk_tag=None):
+def push_branches(sdk_repo, branch_names):
+    """Push these branches to origin in one atomic push.
+
+    If the push is rejected because a branch moved on origin meanwhile, rebase the local
+    branches and try again. Branches are rebased in order, on their origin version if it exists,
+    or on the previous branch in the list (i.e. a new branch is based on the previous one).
+    """
+    for attempt in range(_PUSH_RETRIES + 1):
+        try:
+            return sdk_repo.git.push('origin', *branch_names, atomic=True, set_upstream=True)
+        except GitCommandError as err:
+            if attempt == _PUSH_RETRIES or "rejected" not in str(err.stderr):
+                raise
+            _LOGGER.warning("Push rejected, rebase and try again:\n%s", err.stderr)
+        current_branch = sdk_repo.active_branch.name
+        sdk_repo.remotes.origin.fetch()
+        origin_refs = [ref.name for ref in sdk_repo.remotes.origin.refs]
+        previous_branch = None
+        for branch_name in branch_names:
+            if "origin/"+branch_name in origin_refs:
+                sdk_repo.git.rebase("origin/"+branch_name, branch_name)
+            elif previous_branch:
+                sdk_repo.git.rebase(previous_branch, branch_name)
+            previous_branch = branch_name
+        sdk_repo.git.checkout(current_branch)
+
+
+def get_branch_sha(github_repo, branch_name):
+    """Commit of this branch of this PyGithub repository, None if the branch does not exist."""
+    try:
+        return github_repo.get_branch(branch_name).commit.sha
+    except UnknownObjectException:
+        return None
+
+
+def get_generation_key(git_object, config, sdk_tag, sdk_github_repo, base_branch_names):
+    """Ledger key of this generation (see generation_ledger.py), None if it cannot be computed.
+
+    The SDK base commit is the one of the first existing branch in base_branch_names.
+    """
+    try:
+        rest_sha = git_object.sha  # Commit
+    except AttributeError:
+        rest_sha = git_object.merge_commit_sha  # PR, None if not mergeable
+    if not rest_sha:
+        return None
+    try:
+        sdk_base_sha = next(filter(None, (get_branch_sha(sdk_github_repo, branch) for branch in base_branch_names)), None)
+        toolchain_fingerprint = get_toolchain_fingerprint()
+    except (GithubException, OSError, ValueError, subprocess.CalledProcessError) as err:
+        _LOGGER.warning("Unable to compute the generation key, ledger is not used: %s", err)
+        return None
+    return get_ledger_key(rest_sha, config, sdk_tag, sdk_base_sha, toolchain_fingerprint)
+
+
+def generate_sdk_from_git_object(git_object, branch_name, restapi_git_id, sdk_git_id, base_branch_names, *, fallback_base_branch_name="master", sdk_tag=None, plan=False, cancel_token=None):
     """Generate SDK from a commit or a PR object.
 
     git_object is the initial commit/PR from the RestAPI repo. If git_object is a PR, prefer to checkout Github PR "merge_commit_sha"
@@ -205,14 +517,82 @@ def generate_sdk_from_git_object(git_object, branch_name, restapi_git_id, sdk_gi
     - If base_branch_names is not provided, use fallback_base_branch_name as base
     - If this base branch is provided and does not exists, create this base branch first using fallback_base_branch_name (this one is required to exist)
 
+    If plan is True, nothing is generated and the list of ProjectPlan is returned instead.
+    If cancel_token is cancelled, generation stops with GenerationCancelled, and nothing is pushed.
+
+    If the same inputs were already generated on this branch (see generation_ledger.py), the recorded
+    result is returned without cloning nor generating.
+
+    To generate several SDKs from the same RestAPI clone, see generate_sdks_from_git_object.
+
     WARNING:
     This method might push to "branch_name" and "base_branch_name". No push will be made to "fallback_base_branch_name"
+    These branches are locked during the generation (see branch_locks.py).
+    """
+    target = SdkTarget(sdk_git_id, branch_name, base_branch_names, fallback_base_branch_name, sdk_tag or sdk_git_id)
+    return generate_sdks_from_git_object(git_object, [target], restapi_git_id, plan=plan, cancel_token=cancel_token)[0]
+
+
+def get_clone_dir(config):
+    """Folder of the SDK clone, relative to the temp folder of the target."""
+    return Path(config["meta"].get("advanced_options", {}).get("clone_dir", "sdk"))
+
+
+def read_target_config(target, gh_token):
+    """Read the SwaggerToSdk conf of this SdkTarget, from the first branch where it exists."""
+    # I don't know if the destination branch exists, try until it works
+    branch_list = target.base_branch_names + [target.branch_name] + [target.fallback_base_branch_name]
+    for branch in branch_list:
+        try:
+            return read_config_from_github(target.sdk_git_id, branch, gh_token)
+        except Exception:
+            pass
+    raise ValueError("Unable to locate configuration in {}".format(branch_list))
+
+
+def get_skip_callback(global_conf, readme_files_infered, files_list, restapi_git_folder, swagger_graph):
+    """The skip_callback of build_libraries: True if the project is not impacted by these files."""
+    def skip_callback(project, local_conf):
+        # We know "project" is based on Path in "readme_files_infered"
+        if Path(project) in readme_files_infered:
+            readme_path = Path(project)
+        else:
+            # Might be a regular project
+            markdown_relative_path, optional_relative_paths = get_input_paths(global_conf, local_conf)
+            if not (
+                    markdown_relative_path in readme_files_infered or
+                    any(input_file in readme_files_infered for input_file in optional_relative_paths)):
+                _LOGGER.info(f"In project {project} no files involved in this commit")
+                return True
+            if markdown_relative_path not in readme_files_infered:
+                return False
+            readme_path = markdown_relative_path
+        # Readme is impacted, but maybe not the tag this SDK uses
+        autorest_options = merge_options(global_conf, local_conf, "autorest_options") or {}
+        if "batch" in autorest_options or "multiapi" in autorest_options:
+            return False  # Several tags, generate whatever their input files
+        tag = autorest_options.get("tag")
+        if not is_tag_impacted(readme_path, tag, files_list, restapi_git_folder, swagger_graph):
+            _LOGGER.info(f"In project {project} no input files of tag {tag or 'default'} involved in this commit")
+            return True
+        return False
+    return skip_callback
+
+
+def generate_sdks_from_git_object(git_object, targets, restapi_git_id, *,
+                                  plan=False, cancel_token=None, return_exceptions=False):
+    """Generate the SDKs of several SdkTarget from a commit or a PR object.
+
+    See generate_sdk_from_git_object for the meaning of the parameters and of the result.
+    The RestAPI repo is cloned and the impacted readmes are found once. Each readme is read once
+    for all the targets, then the SDKs are generated in parallel, each in its own SDK clone.
+
+    Returns the list of results, in the order of targets. If return_exceptions is True, the exception
+    of a target that failed is its result, and does not stop the other targets.
     """
     gh_token = os.environ["GH_TOKEN"]
-    message_template = DEFAULT_COMMIT_MESSAGE
     autorest_bin = None
-    if sdk_tag is None:
-        sdk_tag = sdk_git_id
+    results = [None] * len(targets)
 
     try:  # Checkout the sha if commit obj
         branched_rest_api_id = restapi_git_id+'@'+git_object.sha
@@ -224,88 +604,146 @@ def generate_sdk_from_git_object(git_object, branch_name, restapi_git_id, sdk_gi
             branched_rest_api_id = git_object.base.repo.full_name
         pr_number = git_object.number
 
-    # Always clone SDK from fallback branch that is required to exist
-    branched_sdk_git_id = sdk_git_id+'@'+fallback_base_branch_name
-
-    # I don't know if the destination branch exists, try until it works
-    config = None
-    branch_list = base_branch_names + [branch_name] + [fallback_base_branch_name]
-    for branch in branch_list:
+    ledger = None if plan else GenerationLedger()
+    pending_targets = []  # (index, target, config, ledger_key)
+    for index, target in enumerate(targets):
         try:
-            config = read_config_from_github(sdk_git_id, branch, gh_token)
-        except Exception:
-            pass
+            config = read_target_config(target, gh_token)
+
+            # If PR is only about a language that this conf can't handle, skip fast
+            if not this_conf_will_generate_for_this_pr(git_object, config["meta"]):
+                _LOGGER.info("Skipping %s based on conf not impacted by Git object", target.sdk_git_id)
+                continue
+
+            ledger_key = None
+            if not plan:
+                # Shared client: same API url, and counted in the API quota of the process
+                sdk_github_repo = get_github_client(gh_token).get_repo(target.sdk_git_id, lazy=True)
+                # Computed before the readme extraction, that updates the config
+                ledger_key = get_generation_key(
+                    git_object, config, target.sdk_tag, sdk_github_repo,
+                    target.base_branch_names + [target.fallback_base_branch_name]
+                )
+                ledger_entry = ledger.lookup(ledger_key) if ledger_key else None
+                if ledger_entry and ledger_entry.branch_sha == get_branch_sha(sdk_github_repo, target.branch_name):
+                    _LOGGER.info("Same inputs already generated on %s, skipping: %s",
+                                 target.branch_name, ledger_entry.result)
+                    results[index] = ledger_entry.result
+                    continue
+        except Exception as err:
+            if not return_exceptions:
+                raise
+            results[index] = err
         else:
-            break
-    if config is None:
-        raise ValueError("Unable to locate configuration in {}".format(branch_list))
-    global_conf = config["meta"]
-
-    # If PR is only about a language that this conf can't handle, skip fast
-    if not this_conf_will_generate_for_this_pr(git_object, global_conf):
-        _LOGGER.info("Skipping this job based on conf not impacted by Git object")
-        return
+            pending_targets.append((index, target, config, ledger_key))
+    if not pending_targets:
+        return results
 
     with tempfile.TemporaryDirectory() as temp_dir:
 
-        clone_dir = Path(temp_dir) / Path(global_conf.get("advanced_options", {}).get("clone_dir", "sdk"))
-        _LOGGER.info("Clone dir will be: %s", clone_dir)
+        rest_folder = Path(temp_dir) / Path("rest")
+        with manage_git_folder(gh_token, rest_folder, branched_rest_api_id, pr_number=pr_number) as restapi_git_folder:
 
-        with manage_git_folder(gh_token, Path(temp_dir) / Path("rest"), branched_rest_api_id, pr_number=pr_number) as restapi_git_folder, \
-            manage_git_folder(gh_token, clone_dir, branched_sdk_git_id) as sdk_folder:
-
-            readme_files_infered = get_readme_files_from_git_object(git_object, restapi_git_folder)
+            files_list = [file.filename for file in get_files(git_object)]
+            swagger_graph = None
+            if any(filename.endswith(".json") for filename in files_list):
+                swagger_graph = SwaggerGraph(restapi_git_folder).build()
+            readme_files_infered = get_impacted_readme_files(files_list, restapi_git_folder, swagger_graph)
             _LOGGER.info("Readmes files infered from PR: %s ", readme_files_infered)
             if not readme_files_infered:
                 _LOGGER.info("No Readme in PR, quit")
-                return
+                return results
+
+            # Look for configuration in Readme, Autorest reads each Readme once for all the targets
+            readme_confs = {}
+            for _, target, config, _ in pending_targets:
+                _LOGGER.info('Extract conf from Readmes for target: %s', target.sdk_git_id)
+                extract_conf_from_readmes(readme_files_infered, restapi_git_folder, target.sdk_tag, config,
+                                          readme_confs)
+            _LOGGER.info('End of extraction')
 
-            # SDK part
-            sdk_repo = Repo(str(sdk_folder))
+            futures = []
+            with ThreadPoolExecutor(max_workers=len(pending_targets)) as executor:
+                for index, target, config, ledger_key in pending_targets:
+                    target_dir = Path(temp_dir) / Path("target_{}".format(index))
+                    target_dir.mkdir()
+                    skip_callback = get_skip_callback(config["meta"], readme_files_infered, files_list,
+                                                      restapi_git_folder, swagger_graph)
+                    if plan:
+                        # No need to clone the SDK, clone_dir is only used to solve relative paths
+                        clone_dir = target_dir / get_clone_dir(config)
+                        results[index] = plan_libraries(config, skip_callback, restapi_git_folder, clone_dir,
+                                                        autorest_bin)
+                        continue
+                    futures.append((index, executor.submit(
+                        generate_sdk_target, git_object, target, config, skip_callback, restapi_git_folder,
+                        target_dir, autorest_bin, cancel_token, ledger, ledger_key
+                    )))
+            for index, future in futures:
+                try:
+                    results[index] = future.result()
+                except Exception as err:
+                    if not return_exceptions:
+                        raise
+                    results[index] = err
+    return results
+
+
+def generate_sdk_target(git_object, target, config, skip_callback, restapi_git_folder, temp_dir,
+                        autorest_bin=None, cancel_token=None, ledger=None, ledger_key=None):
+    """Generate the SDK of this SdkTarget in a clone in temp_dir, and push it.
+
+    config already contains the projects of the Readmes. Returns the SDK commit url, None if nothing changed.
+    """
+    gh_token = os.environ["GH_TOKEN"]
+    message_template = DEFAULT_COMMIT_MESSAGE
+    sdk_git_id, branch_name, base_branch_names = target.sdk_git_id, target.branch_name, target.base_branch_names
 
-            for base_branch in base_branch_names:
-                _LOGGER.info('Checkout and create %s', base_branch)
-                checkout_and_create_branch(sdk_repo, base_branch)
+    # Always clone SDK from fallback branch that is required to exist
+    branched_sdk_git_id = sdk_git_id+'@'+target.fallback_base_branch_name
 
-            _LOGGER.info('Try to checkout destination branch %s', branch_name)
-            try:
-                sdk_repo.git.checkout(branch_name)
-                _LOGGER.info('The branch exists.')
-            except GitCommandError:
-                _LOGGER.info('Destination branch does not exists')
-                # Will be created by do_commit
+    clone_dir = Path(temp_dir) / get_clone_dir(config)
+    _LOGGER.info("Clone dir will be: %s", clone_dir)
 
-            configure_user(gh_token, sdk_repo)
+    # Lock the branches that might be pushed, from the clone to the push
+    with BranchLockManager().lock(sdk_git_id, base_branch_names + [branch_name], cancel_token), \
+            manage_git_folder(gh_token, clone_dir, branched_sdk_git_id) as sdk_folder:
 
-            # Look for configuration in Readme
-            _LOGGER.info('Extract conf from Readmes for target: %s', sdk_git_id)
-            extract_conf_from_readmes(readme_files_infered, restapi_git_folder, sdk_tag, config)
-            _LOGGER.info('End of extraction')
+        # SDK part
+        sdk_repo = Repo(str(sdk_folder))
 
-            def skip_callback(project, local_conf):
-                # We know "project" is based on Path in "readme_files_infered"
-                if Path(project) in readme_files_infered:
-                    return False
-                # Might be a regular project
-                markdown_relative_path, optional_relative_paths = get_input_paths(global_conf, local_conf)
-                if not (
-                        markdown_relative_path in readme_files_infered or
-                        any(input_file in readme_files_infered for input_file in optional_relative_paths)):
-                    _LOGGER.info(f"In project {project} no files involved in this commit")
-                    return True
-                return False
+        for base_branch in base_branch_names:
+            _LOGGER.info('Checkout and create %s', base_branch)
+            checkout_and_create_branch(sdk_repo, base_branch)
+
+        _LOGGER.info('Try to checkout destination branch %s', branch_name)
+        try:
+            sdk_repo.git.checkout(branch_name)
+            _LOGGER.info('The branch exists.')
+        except GitCommandError:
+            _LOGGER.info('Destination branch does not exists')
+            # Will be created by do_scoped_commit
 
-            build_libraries(config, skip_callback, restapi_git_folder,
-                            sdk_repo, temp_dir, autorest_bin)
-
-            try:
-                commit_for_sha = git_object.commit   # Commit
-            except AttributeError:
-                commit_for_sha = list(git_object.get_commits())[-1].commit  # PR
-            message = message_template + "\n\n" + commit_for_sha.message
-            commit_sha = do_commit(sdk_repo, message, branch_name, commit_for_sha.sha)
-            if commit_sha:
-                for base_branch in base_branch_names:
-                    sdk_repo.git.push('origin', base_branch, set_upstream=True)
-                sdk_repo.git.push('origin', branch_name, set_upstream=True)
-                return "https://github.com/{}/commit/{}".format(sdk_git_id, commit_sha)
+        configure_user(gh_token, sdk_repo)
+        tune_git_index(sdk_repo)
+
+        written_paths = build_libraries(config, skip_callback, restapi_git_folder,
+                                        sdk_repo, temp_dir, autorest_bin, cancel_token)
+        if cancel_token:
+            cancel_token.check()  # Last chance before pushing
+
+        try:
+            commit_for_sha = git_object.commit   # Commit
+        except AttributeError:
+            commit_for_sha = list(git_object.get_commits())[-1].commit  # PR
+        message = message_template + "\n\n" + commit_for_sha.message
+        commit_sha = do_scoped_commit(sdk_repo, message, branch_name, commit_for_sha.sha, written_paths)
+        result = None
+        if commit_sha:
+            push_branches(sdk_repo, base_branch_names + [branch_name])
+            commit_sha = sdk_repo.commit(branch_name).hexsha  # Might have been rebased by push
+            result = "https://github.com/{}/commit/{}".format(sdk_git_id, commit_sha)
+        if ledger_key:
+            branch_sha = sdk_repo.heads[branch_name].commit.hexsha if branch_name in sdk_repo.heads else None
+            ledger.record(ledger_key, sdk_git_id, branch_name, result, branch_sha)
+        return result
@@ -1,3 +1,9 @@
 import sys
-from swaggertosdk.SwaggerToSdkMain import main
-main(sys.argv)
+
+if len(sys.argv) > 1 and sys.argv[1] == "worker":
+    # Not in SwaggerToSdkMain, that the webhook server imports
+    from swaggertosdk.restapi.worker import worker_main
+    worker_main(sys.argv[2:])
+else:
+    from swaggertosdk.SwaggerToSdkMain import main
+    main(sys.argv)
@@ -1,14 +1,69 @@
 import json
 import logging
-import os.path
+import os
 from pathlib import Path
 import shutil
+import signal
 import subprocess
+from threading import Event, Lock
 
 
 _LOGGER = logging.getLogger(__name__)
 
 
+class GenerationCancelled(Exception):
+    """The generation was cancelled using its CancellationToken."""
+
+
+class CancellationToken:
+    """Cooperative cancellation of a generation.
+
+    Long operations call check() between steps, and the child processes registered
+    here are killed when cancel() is called.
+    """
+    def __init__(self):
+        self._cancelled = Event()
+        self._lock = Lock()
+        self._processes = set()
+
+    def cancel(self):
+        self._cancelled.set()
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            _kill_process(process)
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        """Raise GenerationCancelled if cancelled."""
+        if self.is_cancelled():
+            raise GenerationCancelled("Generation has been cancelled")
+
+    def register_process(self, process):
+        with self._lock:
+            self._processes.add(process)
+        if self.is_cancelled():
+            _kill_process(process)
+
+    def unregister_process(self, process):
+        with self._lock:
+            self._processes.discard(process)
+
+
+def _kill_process(process):
+    """Kill this process, and its children if it leads a process group (POSIX)."""
+    _LOGGER.info("Killing process %s", process.pid)
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass  # Already dead
+
+
 def autorest_latest_version_finder():
     autorest_bin = shutil.which("autorest")
     cmd_line = "{} --version --json".format(autorest_bin)
@@ -81,22 +136,29 @@ def build_autorest_options(global_conf, local_conf):
         for option in listify(merged_options[key])
     ]
 
-def generate_code(input_file, global_conf, local_conf, output_dir=None, autorest_bin=None):
+def build_autorest_cmd_line(input_file, global_conf, local_conf, output_dir=None, autorest_bin="autorest"):
+    """Build the Autorest command line as a list"""
+    params = [str(input_file)] if input_file else []
+    if output_dir:  # For legacy. Define "output-folder" as "autorest_options" now
+        params.append("--output-folder={}".format(str(output_dir)+os.path.sep))
+    params += build_autorest_options(global_conf, local_conf)
+
+    cmd_line = autorest_bin.split()
+    cmd_line += params
+    return cmd_line
+
+def generate_code(input_file, global_conf, local_conf, output_dir=None, autorest_bin=None, cancel_token=None):
     """Call the Autorest process with the given parameters.
 
     Input file can be a Path instance, a str (will be cast to Path), or a str starting with
     http (will be passed to Autorest as is).
+    If cancel_token is cancelled, Autorest is killed and GenerationCancelled is raised.
     """
     if not autorest_bin:
         autorest_bin = shutil.which("autorest")
     if not autorest_bin:
         raise ValueError("No autorest found in PATH and no autorest path option used")
 
-    params = [str(input_file)] if input_file else []
-    if output_dir:  # For legacy. Define "output-folder" as "autorest_options" now
-        params.append("--output-folder={}".format(str(output_dir)+os.path.sep))
-    params += build_autorest_options(global_conf, local_conf)
-
     input_files = local_conf.get("autorest_options", {}).get("input-file", [])
 
     if not input_file and not input_files:
@@ -110,18 +172,22 @@ def generate_code(input_file, global_conf, local_conf, output_dir=None, autorest
     else:
         input_path = Path(".")
 
-    cmd_line = autorest_bin.split()
-    cmd_line += params
+    cmd_line = build_autorest_cmd_line(input_file, global_conf, local_conf, output_dir, autorest_bin)
     _LOGGER.info("Autorest cmd line:\n%s", " ".join(cmd_line))
 
-    execute_simple_command(cmd_line, cwd=str(input_path))
+    execute_simple_command(cmd_line, cwd=str(input_path), cancel_token=cancel_token)
     # Checks that Autorest did something if output_dir is under control
     # Note that this can fail if "--output-folder" was overidden by the Readme.
     if output_dir and (not output_dir.is_dir() or next(output_dir.iterdir(), None) is None):
         raise ValueError("Autorest call ended with 0, but no files were generated")
 
 
-def execute_simple_command(cmd_line, cwd=None, shell=False, env=None):
+def execute_simple_command(cmd_line, cwd=None, shell=False, env=None, cancel_token=None):
+    """Execute this command, log and return its output.
+
+    If cancel_token is given, the process (and its children on POSIX) is killed when the token is
+    cancelled, and GenerationCancelled is raised.
+    """
     try:
         process = subprocess.Popen(cmd_line,
                                    stderr=subprocess.STDOUT,
@@ -129,12 +195,21 @@ def execute_simple_command(cmd_line, cwd=None, shell=False, env=None):
                                    universal_newlines=True,
                                    cwd=cwd,
                                    shell=shell,
-                                   env=env)
-        output_buffer = []
-        for line in process.stdout:
-            output_buffer.append(line.rstrip())
-            _LOGGER.info(output_buffer[-1])
-        process.wait()
+                                   env=env,
+                                   start_new_session=cancel_token is not None and os.name == "posix")
+        if cancel_token:
+            cancel_token.register_process(process)
+        try:
+            output_buffer = []
+            for line in process.stdout:
+                output_buffer.append(line.rstrip())
+                _LOGGER.info(output_buffer[-1])
+            process.wait()
+        finally:
+            if cancel_token:
+                cancel_token.unregister_process(process)
+        if cancel_token:
+            cancel_token.check()
         output = "\n".join(output_buffer)
         if process.returncode:
             raise subprocess.CalledProcessError(
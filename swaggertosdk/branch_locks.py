@@ -0,0 +1,120 @@
+"""Locks on SDK branches, so that concurrent generations do not race on the same branch.
+
+A generation locks the branches it might push (keyed by SDK repo and branch name) from the SDK clone
+to the push. Generations on different branches run in parallel, generations on the same branch are
+serialized. Locks are leases stored in a SQLite file: the lease is refreshed while the lock is held,
+and the lock of a dead process is released when its lease expires.
+"""
+from contextlib import contextmanager
+import logging
+import os
+from pathlib import Path
+import sqlite3
+from threading import Event, Thread
+import time
+import uuid
+
+from .SwaggerToSdkCore import get_cache_dir
+
+_LOGGER = logging.getLogger(__name__)
+
+# SQLite file of the locks. Must be shared by all the workers pushing to the same SDK repos.
+# Default is in the cache dir.
+BRANCH_LOCKS_ENV = "SWAGGER_TO_SDK_BRANCH_LOCKS"
+
+# Seconds before the lock of a process that stopped refreshing its lease is released
+LEASE_SECONDS = 300
+# Seconds between two attempts to get busy locks
+POLL_SECONDS = 1
+
+
+@contextmanager
+def _transaction(path):
+    """A sqlite3 connection, in a transaction that is committed at exit (rollback on error)."""
+    connection = sqlite3.connect(str(path), timeout=30, isolation_level=None)
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        yield connection
+        connection.execute("COMMIT")
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+
+class BranchLockManager:
+    """Leased locks on (SDK repo, branch)."""
+    def __init__(self, path=None, lease_seconds=LEASE_SECONDS, poll_seconds=POLL_SECONDS):
+        self.path = Path(path or os.environ.get(BRANCH_LOCKS_ENV) or get_cache_dir() / "branch_locks.sqlite")
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        with _transaction(self.path) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS branch_locks ("
+                "sdk_repo TEXT NOT NULL, branch TEXT NOT NULL, owner TEXT NOT NULL, lease_until REAL NOT NULL, "
+                "PRIMARY KEY (sdk_repo, branch))"
+            )
+
+    def try_acquire(self, sdk_git_id, branch_names, owner):
+        """Get all these locks, or none if one is held by another owner. Returns True if got."""
+        now = time.time()
+        with _transaction(self.path) as connection:
+            connection.execute("DELETE FROM branch_locks WHERE lease_until < ?", (now,))
+            for branch_name in branch_names:
+                row = connection.execute(
+                    "SELECT owner FROM branch_locks WHERE sdk_repo = ? AND branch = ?",
+                    (sdk_git_id, branch_name)
+                ).fetchone()
+                if row and row[0] != owner:
+                    return False
+            connection.executemany(
+                "INSERT OR REPLACE INTO branch_locks VALUES (?, ?, ?, ?)",
+                [(sdk_git_id, branch_name, owner, now + self.lease_seconds) for branch_name in branch_names]
+            )
+        return True
+
+    def refresh(self, owner):
+        with _transaction(self.path) as connection:
+            connection.execute(
+                "UPDATE branch_locks SET lease_until = ? WHERE owner = ?",
+                (time.time() + self.lease_seconds, owner)
+            )
+
+    def release(self, owner):
+        with _transaction(self.path) as connection:
+            connection.execute("DELETE FROM branch_locks WHERE owner = ?", (owner,))
+
+    @contextmanager
+    def lock(self, sdk_git_id, branch_names, cancel_token=None):
+        """Hold the locks of these branches of this SDK repo, waiting for them if needed.
+
+        All the locks are taken at once, so two generations cannot deadlock.
+        If cancel_token is cancelled while waiting, GenerationCancelled is raised.
+        """
+        branch_names = sorted(set(branch_names))
+        owner = "{}-{}".format(os.getpid(), uuid.uuid4().hex)
+        start_time = time.monotonic()
+        while not self.try_acquire(sdk_git_id, branch_names, owner):
+            if cancel_token:
+                cancel_token.check()
+            time.sleep(self.poll_seconds)
+        _LOGGER.info("Locked branches %s of %s after %.1fs", branch_names, sdk_git_id, time.monotonic() - start_time)
+
+        released = Event()
+        def refresh_lease():
+            while not released.wait(self.lease_seconds / 3):
+                try:
+                    self.refresh(owner)
+                except sqlite3.Error as err:
+                    _LOGGER.warning("Unable to refresh the branch locks: %s", err)
+        refresh_thread = Thread(target=refresh_lease, name="BranchLockThread", daemon=True)
+        refresh_thread.start()
+        try:
+            yield
+        finally:
+            released.set()
+            refresh_thread.join()
+            self.release(owner)
+            _LOGGER.info("Unlocked branches %s of %s", branch_names, sdk_git_id)
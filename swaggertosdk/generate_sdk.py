@@ -1,10 +1,21 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 import logging
-from pathlib import Path
+import os
+from pathlib import Path, PurePosixPath
 import tempfile
+from threading import Condition
+
+from git import Repo
 
 from swaggertosdk.SwaggerToSdkNewCLI import (
     build_project,
+    execute_meta_after_script,
+    format_plan,
+    get_output_dir,
+    get_written_paths,
+    plan_project,
 )
 from swaggertosdk.SwaggerToSdkCore import (
     CONFIG_FILE,
@@ -12,14 +23,67 @@ from swaggertosdk.SwaggerToSdkCore import (
     solve_relative_path,
     extract_conf_from_readmes,
     get_input_paths,
+    get_readme_files_from_file_list,
     get_repo_tag_meta,
 )
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def generate(config_path, sdk_folder, project_pattern, readme, restapi_git_folder, autorest_bin=None):
+def get_files_changed_since(git_folder, git_ref):
+    """List of files changed in this git folder since this git ref (committed or not, and untracked files)."""
+    repo = Repo(str(git_folder))
+    changed_files = repo.git.diff("--name-only", git_ref).splitlines()
+    changed_files += repo.git.ls_files("--others", "--exclude-standard").splitlines()
+    return changed_files
+
+
+def is_project_impacted(global_conf, local_conf, changed_files):
+    """Does this project uses a Readme or an input file from changed_files."""
+    markdown_relative_path, optional_relative_paths = get_input_paths(global_conf, local_conf)
+    return markdown_relative_path in changed_files or \
+        any(input_file in changed_files for input_file in optional_relative_paths)
+
+
+class OutputDirLocks:
+    """Serialize the projects writing to overlapping folders (same folder, or one inside the other)."""
+    def __init__(self):
+        self._condition = Condition()
+        self._busy_folders = []
+
+    @staticmethod
+    def _overlap(folder, other_folder):
+        return folder == other_folder or folder in other_folder.parents or other_folder in folder.parents
 
+    @contextmanager
+    def lock(self, folders):
+        """Hold these folders, relative to the SDK root."""
+        folders = [PurePosixPath(os.path.normpath(folder).replace(os.path.sep, "/")) for folder in folders]
+        with self._condition:
+            while any(self._overlap(folder, busy_folder) for folder in folders for busy_folder in self._busy_folders):
+                self._condition.wait()
+            self._busy_folders += folders
+        try:
+            yield
+        finally:
+            with self._condition:
+                for folder in folders:
+                    self._busy_folders.remove(folder)
+                self._condition.notify_all()
+
+
+def generate(config_path, sdk_folder, project_pattern, readme, restapi_git_folder, autorest_bin=None, jobs=1, changed_since=None, plan=False):
+    """Generate the SDK offline.
+
+    If changed_since is a git ref, generate only the projects whose Readme or input files
+    changed in the RestAPI folder since this ref.
+
+    If plan is True, nothing is generated: the plan is printed and the list of ProjectPlan returned.
+
+    Readme discovery, configuration extraction and generation are streamed: each Readme
+    is processed and generated as soon as it's found, using "jobs" parallel workers.
+    Each project uses its own scratch folder, removed as soon as the project is applied to the SDK folder.
+    """
     sdk_folder = Path(sdk_folder).expanduser()
     config = read_config(sdk_folder, config_path)
 
@@ -32,48 +96,63 @@ def generate(config_path, sdk_folder, project_pattern, readme, restapi_git_folde
         restapi_git_folder = Path(restapi_git_folder).expanduser()
 
     # Look for configuration in Readme
+    changed_files = None
     if readme:
+        if changed_since:
+            raise ValueError("You can't use a readme and changed since at the same time.")
         swagger_files_in_pr = [readme]
     else:
         if not restapi_git_folder:
             raise ValueError("RestAPI folder must be set if you don't provide a readme.")
-        swagger_files_in_pr =  list(restapi_git_folder.glob('specification/**/readme.md'))
-    _LOGGER.info(f"Readme files: {swagger_files_in_pr}")
-    extract_conf_from_readmes(swagger_files_in_pr, restapi_git_folder, repotag, config)
-
-    with tempfile.TemporaryDirectory() as temp_dir:
-        for project, local_conf in config.get("projects", {}).items():
-            if readme:
-                if str(readme) not in project:
-                    _LOGGER.info("Skip project %s (readme was %s)", project, readme)
-                    continue
-            else:
-                if project_pattern and not any(p in project for p in project_pattern):
-                    _LOGGER.info("Skip project %s", project)
-                    continue
-            local_conf["autorest_options"] = solve_relative_path(local_conf.get("autorest_options", {}), sdk_folder)
-
-            if readme and readme.startswith("http"):
-                # Simplify here, do not support anything else than Readme.md
-                absolute_markdown_path = readme
-                _LOGGER.info(f"HTTP Markdown input: {absolute_markdown_path}")
-            else:    
-                markdown_relative_path, optional_relative_paths = get_input_paths(global_conf, local_conf)
-
-                _LOGGER.info(f"Markdown input: {markdown_relative_path}")
-                _LOGGER.info(f"Optional inputs: {optional_relative_paths}")
-
-                absolute_markdown_path = None
-                if markdown_relative_path:
-                    absolute_markdown_path = Path(restapi_git_folder or "", markdown_relative_path).resolve()
-                if optional_relative_paths:
-                    local_conf.setdefault('autorest_options', {})['input-file'] = [
-                        Path(restapi_git_folder or "", input_path).resolve()
-                        for input_path
-                        in optional_relative_paths
-                    ]
-
-            build_project(
+        if changed_since:
+            changed_files = {Path(f) for f in get_files_changed_since(restapi_git_folder, changed_since)}
+            _LOGGER.info(f"Files changed since {changed_since}: {changed_files}")
+            readme_files = get_readme_files_from_file_list(changed_files, restapi_git_folder)
+            changed_files |= readme_files
+            swagger_files_in_pr = sorted(readme_files)
+        else:
+            # Lazy: each Readme is submitted as soon as it's found, not after walking the whole tree
+            swagger_files_in_pr = restapi_git_folder.glob('specification/**/readme.md')
+
+    def generate_project(project, local_conf):
+        if readme:
+            if str(readme) not in project:
+                _LOGGER.info("Skip project %s (readme was %s)", project, readme)
+                return []
+        else:
+            if project_pattern and not any(p in project for p in project_pattern):
+                _LOGGER.info("Skip project %s", project)
+                return []
+        local_conf["autorest_options"] = solve_relative_path(local_conf.get("autorest_options", {}), sdk_folder)
+
+        if readme and readme.startswith("http"):
+            # Simplify here, do not support anything else than Readme.md
+            absolute_markdown_path = readme
+            _LOGGER.info(f"HTTP Markdown input: {absolute_markdown_path}")
+        else:
+            markdown_relative_path, optional_relative_paths = get_input_paths(global_conf, local_conf)
+
+            _LOGGER.info(f"Markdown input: {markdown_relative_path}")
+            _LOGGER.info(f"Optional inputs: {optional_relative_paths}")
+
+            absolute_markdown_path = None
+            if markdown_relative_path:
+                absolute_markdown_path = Path(restapi_git_folder or "", markdown_relative_path).resolve()
+            if optional_relative_paths:
+                local_conf.setdefault('autorest_options', {})['input-file'] = [
+                    Path(restapi_git_folder or "", input_path).resolve()
+                    for input_path
+                    in optional_relative_paths
+                ]
+
+        if plan:
+            generation_plan.append(plan_project(project, absolute_markdown_path, global_conf, local_conf, autorest_bin))
+            return []
+
+        # After scripts, or a generation in place, can write anywhere: lock the SDK root
+        written_folders = get_written_paths(local_conf) or ["."]
+        with output_dir_locks.lock(written_folders), tempfile.TemporaryDirectory() as temp_dir:
+            changed = build_project(
                 temp_dir,
                 project,
                 absolute_markdown_path,
@@ -82,6 +161,72 @@ def generate(config_path, sdk_folder, project_pattern, readme, restapi_git_folde
                 local_conf,
                 autorest_bin
             )
+        return [get_output_dir(local_conf)] if changed else []
+
+    def get_readme_keys(readme_file):
+        """Project keys of this Readme in the static conf: its path, absolute or relative to RestAPI folder."""
+        readme_keys = {str(readme_file)}
+        if restapi_git_folder:
+            readme_keys.add(str(Path(restapi_git_folder, readme_file)))
+            try:
+                readme_keys.add(Path(readme_file).relative_to(restapi_git_folder).as_posix())
+            except ValueError:
+                pass
+        return readme_keys
+
+    def generate_readme(readme_file, static_projects):
+        """Generate the projects of this Readme, or the static projects with the same key if the Readme has none."""
+        _LOGGER.info(f"Readme file: {readme_file}")
+        readme_config = {}
+        extract_conf_from_readmes([readme_file], restapi_git_folder, repotag, readme_config)
+        output_dirs = []
+        for project, local_conf in (readme_config.get("projects") or static_projects).items():
+            output_dirs += generate_project(project, local_conf)
+        return output_dirs
+
+    output_dirs = []
+    generation_plan = []
+    futures = []
+    output_dir_locks = OutputDirLocks()
+    static_projects = {}
+    for project, local_conf in config.get("projects", {}).items():
+        if changed_files is not None and not is_project_impacted(global_conf, local_conf, changed_files):
+            _LOGGER.info("Skip project %s (no change since %s)", project, changed_since)
+            continue
+        static_projects[project] = local_conf
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        try:
+            for readme_file in swagger_files_in_pr:
+                # The Readme conf replaces the static project with the same key, generate it once
+                readme_static_projects = {
+                    key: static_projects.pop(key)
+                    for key in get_readme_keys(readme_file) if key in static_projects
+                }
+                futures.append(executor.submit(generate_readme, readme_file, readme_static_projects))
+            for project, local_conf in static_projects.items():
+                futures.append(executor.submit(generate_project, project, local_conf))
+            for future in as_completed(futures):
+                output_dirs += future.result()
+        except BaseException:
+            # Do not start anything new, the running projects will finish
+            for future in futures:
+                future.cancel()
+            raise
+
+    if plan:
+        print(format_plan(generation_plan))
+        return generation_plan
+
+    if output_dirs:
+        execute_meta_after_script(sdk_folder, global_conf, sorted(set(output_dirs)))
+
+
+def jobs_count(value):
+    """argparse type of --jobs."""
+    jobs = int(value)
+    if jobs < 0:
+        raise argparse.ArgumentTypeError("must be 0 (one per CPU) or more, not {}".format(value))
+    return jobs
 
 
 def generate_main():
@@ -99,12 +244,21 @@ def generate_main():
     parser.add_argument('--readme', '-m',
                         dest='readme',
                         help='Select a specific readme. Must be a path')
+    parser.add_argument('--changed-since',
+                        dest='changed_since',
+                        help='Generate only projects whose specs changed in the Rest API folder since this git ref.')
     parser.add_argument('--config', '-c',
                         dest='config_path', default=CONFIG_FILE,
                         help='The JSON configuration format path [default: %(default)s]')
     parser.add_argument('--autorest',
                         dest='autorest_bin',
                         help='Force the Autorest to be executed. Must be a executable command.')                        
+    parser.add_argument('--jobs', '-j',
+                        dest='jobs', type=jobs_count, default=1,
+                        help='Number of projects to generate in parallel. 0 means one per CPU. [default: %(default)s]')
+    parser.add_argument('--plan',
+                        dest='plan', action='store_true',
+                        help='Print the projects that would be generated, and estimated durations, without generating.')
     parser.add_argument("-v", "--verbose",
                         dest="verbose", action="store_true",
                         help="Verbosity in INFO mode")
@@ -127,7 +281,10 @@ def generate_main():
              args.project,
              args.readme,
              args.restapi_git_folder,
-             args.autorest_bin)
+             args.autorest_bin,
+             args.jobs,
+             args.changed_since,
+             args.plan)
 
 if __name__ == "__main__":
     generate_main()
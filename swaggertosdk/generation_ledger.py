@@ -0,0 +1,74 @@
+"""Ledger of the generations already done, so that a job with the same inputs is not run twice.
+
+The same inputs regularly reach the generation more than once (rebuild comments, reopen events,
+webhook redeliveries, push and synchronize of the same commit). A generation is keyed by the
+RestAPI commit, the SDK configuration, the SDK base commit and the Autorest toolchain, and the
+ledger records the SDK branch commit it produced. A job with a known key, on an SDK branch that
+still points to the recorded commit, returns the recorded result without cloning or generating.
+
+Entries of an SDK branch are removed explicitly on "regenerate".
+"""
+from collections import namedtuple
+from contextlib import closing
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import time
+
+from .SwaggerToSdkCore import get_cache_dir
+
+_LOGGER = logging.getLogger(__name__)
+
+# SQLite file of the ledger. Should be shared by all the workers generating for the same SDK repos.
+# Default is in the cache dir.
+LEDGER_ENV = "SWAGGER_TO_SDK_LEDGER"
+
+LedgerEntry = namedtuple("LedgerEntry", ["result", "branch_sha"])
+
+
+def get_ledger_key(rest_sha, config, sdk_tag, sdk_base_sha, toolchain_fingerprint):
+    """A stable hash of the inputs of a generation."""
+    inputs = json.dumps([rest_sha, config, sdk_tag, sdk_base_sha, toolchain_fingerprint], sort_keys=True, default=str)
+    return hashlib.sha256(inputs.encode()).hexdigest()
+
+
+class GenerationLedger:
+    """Generations done, by key (see get_ledger_key)."""
+    def __init__(self, path=None):
+        self.path = Path(path or os.environ.get(LEDGER_ENV) or get_cache_dir() / "generation_ledger.sqlite")
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS generations ("
+                "key TEXT PRIMARY KEY, sdk_repo TEXT NOT NULL, branch TEXT NOT NULL, "
+                "result TEXT, branch_sha TEXT, created_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return closing(sqlite3.connect(str(self.path), timeout=30, isolation_level=None))
+
+    def lookup(self, key):
+        """The LedgerEntry of this key, or None."""
+        with self._connect() as connection:
+            row = connection.execute("SELECT result, branch_sha FROM generations WHERE key = ?", (key,)).fetchone()
+        return LedgerEntry(*row) if row else None
+
+    def record(self, key, sdk_git_id, branch_name, result, branch_sha):
+        """Record the result of a generation, and the commit of the SDK branch after it (None if no branch)."""
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?)",
+                (key, sdk_git_id, branch_name, result, branch_sha, time.time())
+            )
+
+    def invalidate(self, sdk_git_id, branch_name):
+        """Forget the generations of this SDK branch, return how many were removed."""
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "DELETE FROM generations WHERE sdk_repo = ? AND branch = ?",
+                (sdk_git_id, branch_name)
+            )
+        _LOGGER.info("Removed %d ledger entries of %s in %s", cursor.rowcount, branch_name, sdk_git_id)
+        return cursor.rowcount
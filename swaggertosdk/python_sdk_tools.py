@@ -1,8 +1,15 @@
 """This file is specific to Azure SDK for Python and should be split somewhere else."""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import hashlib
+import json
 import logging
+import os
 from pathlib import Path
+import shutil
 import tempfile
 
+from git import Repo
 from github import Github
 
 from azure_devtools.ci_tools.github_tools import (
@@ -10,39 +17,186 @@ from azure_devtools.ci_tools.github_tools import (
     DashboardCommentableObject
 )
 from .autorest_tools import execute_simple_command
+from .SwaggerToSdkCore import get_cache_dir
+from .workspace_pool import get_folder_size
 
 _LOGGER = logging.getLogger(__name__)
 
 
 _STORAGE_ACCOUNT = "http://azuresdkinfrajobstore1.blob.core.windows.net/azure/azure-sdk-for-python/pullrequests/{prnumber}/dist/{file}"
 
+# How many packages are built at the same time
+_BUILD_WORKERS = 4
+
+_BUILD_SCRIPT = "build_package.py"
+
+# Disk budget of the built packages cache in GB. Can be overriden by this environment variable.
+PACKAGES_BUDGET_ENV = "SWAGGER_TO_SDK_PACKAGES_BUDGET_GB"
+_DEFAULT_PACKAGES_BUDGET_GB = 5
+
+_BUILD_VERSIONS_SCRIPT = (
+    "import json, sys\n"
+    "versions = {'python': sys.version}\n"
+    "for name in ['setuptools', 'wheel']:\n"
+    "    try:\n"
+    "        versions[name] = __import__(name).__version__\n"
+    "    except ImportError:\n"
+    "        versions[name] = None\n"
+    "print(json.dumps(versions))\n"
+)
+
+
+def _python_bin_stat():
+    """Return the python path in PATH and its mtime, used to invalidate the build versions cache."""
+    python_bin = shutil.which("python")
+    try:
+        python_mtime = os.stat(python_bin).st_mtime if python_bin else None
+    except OSError:
+        python_mtime = None
+    return python_bin, python_mtime
+
+
+@lru_cache(maxsize=1)
+def _build_versions(python_bin, python_mtime):
+    del python_bin, python_mtime  # Cache keys only
+    _LOGGER.info("Probing Python build versions")
+    output = execute_simple_command(["python", "-c", _BUILD_VERSIONS_SCRIPT])
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def get_build_versions():
+    """Versions of Python, setuptools and wheel used by the build script, computed once per process."""
+    return _build_versions(*_python_bin_stat())
+
+
+def get_package_hash(sdk_folder, package_name):
+    """Hash of the content of the package folder, of the build script and of the build versions."""
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(get_build_versions(), sort_keys=True).encode())
+    hasher.update(b"\0")
+    package_folder = Path(sdk_folder, package_name)
+    files = [Path(sdk_folder, _BUILD_SCRIPT)]
+    files += sorted(f for f in package_folder.rglob("*") if f.is_file() and "__pycache__" not in f.parts)
+    for file_path in files:
+        hasher.update(file_path.relative_to(sdk_folder).as_posix().encode())
+        hasher.update(b"\0")
+        hasher.update(file_path.read_bytes())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def build_package(sdk_folder, package_name, output_folder):
+    """Build this package into output_folder.
+
+    Wheel and sdist are cached based on the package content, an unchanged package is not built again.
+    Least recently used builds are removed when the cache is bigger than its disk budget.
+    """
+    package_cache_folder = get_cache_dir("packages", package_name)
+    cached_build_folder = package_cache_folder / get_package_hash(sdk_folder, package_name)
+    if cached_build_folder.is_dir():
+        _LOGGER.info("Package %s found in cache: %s", package_name, cached_build_folder)
+    else:
+        _LOGGER.debug("Build {}".format(package_name))
+        # Build in a temp folder, so an incomplete build is never seen as cached
+        build_folder = tempfile.mkdtemp(dir=str(package_cache_folder))
+        try:
+            execute_simple_command(
+                ["python", "./"+_BUILD_SCRIPT, "--dest", build_folder, package_name],
+                cwd=sdk_folder
+            )
+            os.replace(build_folder, str(cached_build_folder))
+        except OSError:
+            # Built at the same time by someone else, use theirs
+            if not cached_build_folder.is_dir():
+                raise
+        finally:
+            shutil.rmtree(build_folder, ignore_errors=True)
+        _LOGGER.debug("Build finished: {}".format(package_name))
+    os.utime(str(cached_build_folder))  # Used now, for LRU eviction
+    for built_file in cached_build_folder.iterdir():
+        shutil.copy(str(built_file), str(output_folder))
+    evict_packages(keep=cached_build_folder)
+
+
+def evict_packages(disk_budget=None, keep=None):
+    """Remove least recently used builds, until the packages cache fits in the disk budget (in bytes).
+
+    The "keep" build folder is never removed.
+    """
+    if disk_budget is None:
+        disk_budget = float(os.environ.get(PACKAGES_BUDGET_ENV, _DEFAULT_PACKAGES_BUDGET_GB)) * 1024**3
+    builds = []
+    for package_cache_folder in get_cache_dir("packages").iterdir():
+        if not package_cache_folder.is_dir():
+            continue
+        for build_folder in package_cache_folder.iterdir():
+            # Builds in progress are temp folders, not hashes
+            if len(build_folder.name) != 64 or not build_folder.is_dir():
+                continue
+            try:
+                builds.append((build_folder.stat().st_mtime, build_folder, get_folder_size(build_folder)))
+            except OSError:
+                pass  # Removed by someone else
+    total_size = sum(size for _, _, size in builds)
+    for _, build_folder, size in sorted(builds):
+        if total_size <= disk_budget:
+            break
+        if keep is not None and build_folder == keep:
+            continue
+        _LOGGER.info("Evict package build %s", build_folder)
+        shutil.rmtree(str(build_folder), ignore_errors=True)
+        total_size -= size
+
+def get_package_names_from_file_list(files_list):
+    # Package starts with "azure" and is at the root of the repo
+    return {filename.split('/')[0] for filename in files_list if filename.startswith("azure")}
+
+
+def get_package_names(sdk_pr):
+    """Package names changed in this PR, using Github API.
+
+    "get_files" of Github only download the first 300 files. Prefer get_package_names_from_git
+    if you have a clone of the PR.
+    """
+    return get_package_names_from_file_list(f.filename for f in sdk_pr.get_files())
+
+
+def get_package_names_from_git(sdk_folder, base_ref):
+    """Package names changed between base_ref and HEAD of this local clone."""
+    repo = Repo(str(sdk_folder))
+    output = repo.git.diff("--name-only", "{}...HEAD".format(base_ref))
+    return get_package_names_from_file_list(output.splitlines())
+
+
 def build_package_from_pr_number(gh_token, sdk_id, pr_number, output_folder, *, with_comment=False):
     """Will clone the given PR branch and vuild the package with the given name."""
 
     con = Github(gh_token)
     repo = con.get_repo(sdk_id)
     sdk_pr = repo.get_pull(pr_number)
-    # "get_files" of Github only download the first 300 files. Might not be enough.
-    package_names = {f.filename.split('/')[0] for f in sdk_pr.get_files() if f.filename.startswith("azure")}
     absolute_output_folder = Path(output_folder).resolve()
 
     with tempfile.TemporaryDirectory() as temp_dir, \
             manage_git_folder(gh_token, Path(temp_dir) / Path("sdk"), sdk_id, pr_number=pr_number) as sdk_folder:
 
-        for package_name in package_names:
-            _LOGGER.debug("Build {}".format(package_name))
-            execute_simple_command(
-                ["python", "./build_package.py", "--dest", str(absolute_output_folder), package_name],
-                cwd=sdk_folder
-            )
-            _LOGGER.debug("Build finished: {}".format(package_name))
+        package_names = get_package_names_from_git(sdk_folder, "origin/"+sdk_pr.base.ref)
+        _LOGGER.info("Packages in PR: %s", package_names)
+
+        absolute_output_folder.mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=_BUILD_WORKERS) as executor:
+            futures = [
+                executor.submit(build_package, sdk_folder, package_name, absolute_output_folder)
+                for package_name in package_names
+            ]
+            for future in futures:
+                future.result()  # Raise if the build failed
 
     if with_comment:
         files = [f.name for f in absolute_output_folder.iterdir()]
         comment_message = None
         dashboard = DashboardCommentableObject(sdk_pr, "(message created by the CI based on PR content)")
         try:
-            installation_message = build_installation_message(sdk_pr)
+            installation_message = build_installation_message(sdk_pr, package_names)
             download_message = build_download_message(sdk_pr, files)
             comment_message = installation_message + "\n\n" + download_message
             dashboard.create_comment(comment_message)
@@ -60,9 +214,13 @@ def build_download_message(sdk_pr, files):
         )
     return message
 
-def build_installation_message(sdk_pr):
-    # Package starts with "azure" and is at the root of the repo
-    package_names = {f.filename.split('/')[0] for f in sdk_pr.get_files() if f.filename.startswith("azure")}
+def build_installation_message(sdk_pr, package_names=None):
+    """Installation message for the packages of this PR.
+
+    If package_names is not provided, it's computed using Github API.
+    """
+    if package_names is None:
+        package_names = get_package_names(sdk_pr)
 
     result = ["# Installation instruction"]
     for package in package_names:
@@ -0,0 +1,104 @@
+"""Run independent GitHub API calls concurrently, in the order required by their dependencies.
+
+Each call is a full HTTPS round trip: the bookkeeping done after a generation (SDK PR, dashboard,
+labels, merge, branch delete, context PR) is mostly waiting. Calls that do not depend on each other
+run on a small thread pool. The number of calls running at once in the process is capped, to stay
+within GitHub abuse rate limits whatever the number of workers.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import os
+from threading import BoundedSemaphore, Lock
+
+_LOGGER = logging.getLogger(__name__)
+
+# Max GitHub API calls running at once in this process, for all the jobs.
+API_CONCURRENCY_ENV = "SWAGGER_TO_SDK_API_CONCURRENCY"
+_DEFAULT_API_CONCURRENCY = 4
+
+_API_SLOTS = BoundedSemaphore(int(os.environ.get(API_CONCURRENCY_ENV, _DEFAULT_API_CONCURRENCY)))
+
+
+class ApiFanOut:
+    """A set of API operations, each one started as soon as the operations it depends on are done.
+
+    submit returns a concurrent.futures.Future. If a dependency failed, the operation is not run and
+    its future gets the same exception. Leaving the "with" block waits for all the operations, and
+    raises the first exception if one failed. If the "with" block raises, the operations not started
+    yet are cancelled, and the running ones are waited for.
+    """
+    def __init__(self, max_workers=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get(API_CONCURRENCY_ENV, _DEFAULT_API_CONCURRENCY))
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="ApiFanOut")
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.wait()
+            else:
+                self.cancel()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def cancel(self):
+        """Cancel the operations not started yet, and the ones depending on them."""
+        for future in self._futures:
+            future.cancel()
+
+    def submit(self, func, *args, after=(), **kwargs):
+        """Run func(*args, **kwargs) once all the futures in "after" are done."""
+        future = Future()
+        self._futures.append(future)
+        remaining = [len(after)]
+        lock = Lock()
+
+        def start():
+            if future.cancelled():
+                return
+            for dependency in after:
+                if dependency.cancelled():
+                    future.cancel()
+                    return
+                if dependency.exception():
+                    future.set_exception(dependency.exception())
+                    return
+            self._executor.submit(self._run, future, func, args, kwargs)
+
+        def dependency_done(_):
+            with lock:
+                remaining[0] -= 1
+                ready = not remaining[0]
+            if ready:
+                start()
+
+        if after:
+            for dependency in after:
+                dependency.add_done_callback(dependency_done)
+        else:
+            start()
+        return future
+
+    @staticmethod
+    def _run(future, func, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            with _API_SLOTS:
+                result = func(*args, **kwargs)
+        except Exception as err:
+            future.set_exception(err)
+        else:
+            future.set_result(result)
+
+    def wait(self):
+        """Wait for all the operations, raise the first exception if one failed."""
+        for future in self._futures:
+            future.exception()  # Wait, without raising
+        for future in self._futures:
+            if future.exception():
+                raise future.exception()
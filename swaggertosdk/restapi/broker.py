@@ -0,0 +1,290 @@
+"""Job broker shared by several processes, so that workers scale independently of the webhook server.
+
+If SWAGGER_TO_SDK_BROKER is set to a SQLite file path, the webhook server only queues the jobs there,
+and "python -m swaggertosdk worker" processes (as many as needed) consume them.
+
+SqliteBroker has the same API as JobScheduler, and the same scheduling (see select_job). Running jobs
+are leased: a worker refreshes its lease while running, and the job of a dead worker is queued again
+when its lease expires. A job superseded while running is cancelled through the lease refresh.
+"""
+import json
+import logging
+import os
+import sqlite3
+from threading import Lock, Thread
+import time
+import uuid
+
+from ..autorest_tools import CancellationToken
+from .scheduler import Job, JobScheduler, select_job, supersedes
+
+_LOGGER = logging.getLogger(__name__)
+
+# SQLite file path of the broker. If not set, jobs are consumed by threads of the webhook server.
+BROKER_ENV = "SWAGGER_TO_SDK_BROKER"
+
+# Seconds before the job of a worker that stopped refreshing its lease is queued again
+LEASE_SECONDS = 60
+# Seconds between two polls of the broker, by an idle worker or to refresh the leases
+POLL_SECONDS = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type TEXT NOT NULL,
+    body TEXT NOT NULL,
+    sdkid TEXT NOT NULL,
+    sdkbase TEXT NOT NULL,
+    sdk_tag TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    cancelled INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tenants (
+    sdkid TEXT PRIMARY KEY,
+    served REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def create_job_queue(maxsize=0, rate_budget=None):
+    """A SqliteBroker if SWAGGER_TO_SDK_BROKER is set, an in-process JobScheduler otherwise."""
+    broker_path = os.environ.get(BROKER_ENV)
+    if broker_path:
+        return SqliteBroker(broker_path, maxsize, rate_budget=rate_budget)
+    return JobScheduler(maxsize, rate_budget=rate_budget)
+
+
+class SqliteBroker:
+    """A JobScheduler stored in a SQLite file, usable by several processes.
+
+    Time is stored as wall clock in the file, jobs are returned with enqueued_at on the local
+    monotonic clock like create_job does.
+    """
+    def __init__(self, path, maxsize=0, weights=None, max_running=None, lease_seconds=LEASE_SECONDS, poll_seconds=POLL_SECONDS, rate_budget=None):
+        # Scheduling options are read from the environment like JobScheduler does
+        scheduler = JobScheduler(weights=weights, max_running=max_running)
+        self.weights = scheduler.weights
+        self.max_running = scheduler.max_running
+        self.maxsize = maxsize
+        self.rate_budget = rate_budget
+        self.path = str(path)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.worker_id = "{}-{}".format(os.getpid(), uuid.uuid4().hex[:8])
+        self._lock = Lock()
+        self._job_ids = {}  # CancellationToken -> job id, for jobs got by this process
+        self._lease_thread = None
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return _Transaction(connection)
+
+    def qsize(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM jobs WHERE worker IS NULL").fetchone()[0]
+
+    @property
+    def superseded(self):
+        with self._connect() as connection:
+            row = connection.execute("SELECT value FROM counters WHERE name = 'superseded'").fetchone()
+        return row[0] if row else 0
+
+    def put(self, job):
+        """Add a job, block while the broker is full.
+
+        Superseded queued jobs are dropped, superseded running jobs are flagged as cancelled.
+        """
+        while True:
+            now = time.time()
+            with self._connect() as connection:
+                connection.execute("BEGIN IMMEDIATE")
+                self._requeue_expired(connection, now)
+                queued = connection.execute("SELECT COUNT(*) FROM jobs WHERE worker IS NULL").fetchone()[0]
+                if self.maxsize <= 0 or queued < self.maxsize:
+                    self._insert(connection, job, now)
+                    return
+            time.sleep(self.poll_seconds)
+
+    def _insert(self, connection, job, now):
+        """Add a job in this transaction."""
+        enqueued_at = now - (time.monotonic() - job.enqueued_at)
+        rows = connection.execute("SELECT * FROM jobs").fetchall()
+        if not any(row[3] == job.sdkid for row in rows):
+            # An idle tenant does not bank service: start from the least served active tenant
+            served = self._get_served(connection)
+            active_served = [served.get(sdkid, 0) / self.weights.get(sdkid, 1) for sdkid in {row[3] for row in rows}]
+            connection.execute(
+                "INSERT OR REPLACE INTO tenants VALUES (?, ?)",
+                (job.sdkid, min(active_served, default=0) * self.weights.get(job.sdkid, 1))
+            )
+
+        superseded = 0
+        for row in rows:
+            job_id, worker, cancelled = row[0], row[8], row[10]
+            old_job = self._row_to_job(row, now)
+            if cancelled or not supersedes(job, old_job):
+                continue
+            superseded += 1
+            if worker is None:
+                connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                enqueued_at = min(enqueued_at, row[7])
+                job = job._replace(priority=min(job.priority, old_job.priority))
+            else:
+                _LOGGER.info("Cancel running %s job of PR %s", old_job.body.get("action"), old_job.body["number"])
+                connection.execute("UPDATE jobs SET cancelled = 1 WHERE id = ?", (job_id,))
+        if superseded:
+            connection.execute("INSERT OR IGNORE INTO counters VALUES ('superseded', 0)")
+            connection.execute("UPDATE counters SET value = value + ? WHERE name = 'superseded'", (superseded,))
+        connection.execute(
+            "INSERT INTO jobs (event_type, body, sdkid, sdkbase, sdk_tag, priority, enqueued_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job.event_type, json.dumps(job.body), job.sdkid, job.sdkbase, job.sdk_tag, job.priority, enqueued_at)
+        )
+
+    def get(self):
+        """Remove and return the next job, block while there is none that can run."""
+        while True:
+            job = self.get_nowait()
+            if job is not None:
+                return job
+            time.sleep(self.poll_seconds)
+
+    def get_nowait(self):
+        """Remove and return the next job, or None if there is none that can run."""
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            self._requeue_expired(connection, now)
+            rows = connection.execute("SELECT * FROM jobs WHERE worker IS NULL ORDER BY id").fetchall()
+            jobs = [self._row_to_job(row, now) for row in rows]
+            running = dict(connection.execute(
+                "SELECT sdkid, COUNT(*) FROM jobs WHERE worker IS NOT NULL GROUP BY sdkid"
+            ).fetchall())
+            index = select_job(jobs, time.monotonic(), running, self._get_served(connection), self.weights, self.max_running, self.rate_budget)
+            if index is None:
+                return None
+            job_id, job = rows[index][0], jobs[index]
+            connection.execute(
+                "UPDATE jobs SET worker = ?, lease_until = ? WHERE id = ?",
+                (self.worker_id, now + self.lease_seconds, job_id)
+            )
+            connection.execute("INSERT OR IGNORE INTO tenants VALUES (?, 0)", (job.sdkid,))
+            connection.execute("UPDATE tenants SET served = served + 1 WHERE sdkid = ?", (job.sdkid,))
+        with self._lock:
+            self._job_ids[job.cancel_token] = job_id
+        if self.rate_budget:
+            self.rate_budget.spend(job)
+        self._start_lease_thread()
+        return job
+
+    def task_done(self, job):
+        with self._lock:
+            job_id = self._job_ids.pop(job.cancel_token)
+        with self._connect() as connection:
+            # If our lease expired, the job may run somewhere else now
+            connection.execute("DELETE FROM jobs WHERE id = ? AND worker = ?", (job_id, self.worker_id))
+
+    def join(self):
+        """Block until every job has been got and processed, by any worker."""
+        while True:
+            with self._connect() as connection:
+                if not connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]:
+                    return
+            time.sleep(self.poll_seconds)
+
+    def tenants_status(self):
+        """sdkid -> queued and running jobs."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT sdkid, SUM(worker IS NULL), SUM(worker IS NOT NULL) FROM jobs GROUP BY sdkid"
+            ).fetchall()
+        return {sdkid: {"queued": queued, "running": running} for sdkid, queued, running in rows}
+
+    def refresh_leases(self):
+        """Extend the lease of the jobs run by this process, and cancel the ones flagged as cancelled."""
+        with self._lock:
+            job_ids = dict(self._job_ids)
+        if not job_ids:
+            return
+        ids_by_token = {job_id: token for token, job_id in job_ids.items()}
+        placeholders = ",".join("?" * len(ids_by_token))
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET lease_until = ? WHERE worker = ? AND id IN ({})".format(placeholders),
+                [time.time() + self.lease_seconds, self.worker_id] + list(ids_by_token)
+            )
+            cancelled_ids = [row[0] for row in connection.execute(
+                "SELECT id FROM jobs WHERE cancelled = 1 AND id IN ({})".format(placeholders),
+                list(ids_by_token)
+            )]
+        for job_id in cancelled_ids:
+            if not ids_by_token[job_id].is_cancelled():
+                ids_by_token[job_id].cancel()
+
+    def _start_lease_thread(self):
+        with self._lock:
+            if self._lease_thread:
+                return
+            self._lease_thread = Thread(target=self._refresh_leases_forever, name="BrokerLeaseThread", daemon=True)
+        self._lease_thread.start()
+
+    def _refresh_leases_forever(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.refresh_leases()
+            except sqlite3.Error as err:
+                _LOGGER.warning("Unable to refresh the leases: %s", err)
+
+    @staticmethod
+    def _requeue_expired(connection, now):
+        connection.execute("DELETE FROM jobs WHERE cancelled = 1 AND lease_until < ?", (now,))
+        requeued = connection.execute(
+            "UPDATE jobs SET worker = NULL, lease_until = NULL WHERE worker IS NOT NULL AND lease_until < ?",
+            (now,)
+        ).rowcount
+        if requeued:
+            _LOGGER.warning("%d job(s) queued again, their worker stopped refreshing its lease", requeued)
+
+    @staticmethod
+    def _get_served(connection):
+        return dict(connection.execute("SELECT sdkid, served FROM tenants").fetchall())
+
+    @staticmethod
+    def _row_to_job(row, now):
+        _, event_type, body, sdkid, sdkbase, sdk_tag, priority, enqueued_at = row[:8]
+        return Job(
+            event_type, json.loads(body), sdkid, sdkbase, sdk_tag, priority,
+            time.monotonic() - (now - enqueued_at),
+            CancellationToken()
+        )
+
+
+class _Transaction:
+    """Context manager on a sqlite3 connection in autocommit mode: commit a transaction if one
+    was started, rollback on error, and close the connection."""
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if self.connection.in_transaction:
+                if exc_type is None:
+                    self.connection.execute("COMMIT")
+                else:
+                    self.connection.execute("ROLLBACK")
+        finally:
+            self.connection.close()
@@ -0,0 +1,392 @@
+"""A local in-memory stand-in of the GitHub REST API, for benchmarks and tests.
+
+Only the endpoints used by the REST PR management are implemented, and the GraphQL
+queries of graphql_snapshot.py. Every call is counted in FakeGithub.calls, keyed by "METHOD route".
+"""
+from collections import Counter
+import itertools
+import json
+import logging
+import re
+from threading import Lock, Thread
+import time
+
+from flask import Flask, request, jsonify, abort
+from werkzeug.serving import make_server
+
+_LOGGER = logging.getLogger(__name__)
+
+_GITHUB_API_URL = "https://api.github.com"
+
+
+class FakeGithub:
+    """State of the fake GitHub, shared by all the requests."""
+    def __init__(self):
+        self.base_url = _GITHUB_API_URL
+        self.repos = {}
+        self.pulls = {}
+        self.files = {}
+        self.commits = {}
+        self.comments = {}
+        self.issue_comments = {}
+        self.labels = {}
+        self.issue_labels = {}
+        self.refs = set()
+        self.user_login = "swagger-to-sdk"
+        self.calls = Counter()
+        # API quota, decremented at each call and sent in the rate limit headers
+        self.rate_limit = 5000
+        self.rate_remaining = 5000
+        self.rate_reset_at = int(time.time()) + 3600
+        self.lock = Lock()
+        self._ids = itertools.count(1)
+
+    def to_fake_urls(self, obj):
+        """Rewrite GitHub API urls of this JSON object to point to this fake."""
+        return json.loads(json.dumps(obj).replace(_GITHUB_API_URL, self.base_url))
+
+    def repo_json(self, full_name):
+        if full_name not in self.repos:
+            owner = full_name.split("/")[0]
+            self.repos[full_name] = {
+                "id": next(self._ids),
+                "name": full_name.split("/")[1],
+                "full_name": full_name,
+                "owner": {"login": owner, "url": "{}/users/{}".format(_GITHUB_API_URL, owner)},
+                "url": "{}/repos/{}".format(_GITHUB_API_URL, full_name),
+                "html_url": "https://github.com/{}".format(full_name),
+                "default_branch": "master",
+            }
+        return self.repos[full_name]
+
+    def add_repository(self, repo_json):
+        self.repos[repo_json["full_name"]] = repo_json
+
+    def add_pull(self, full_name, pull_json, files=None):
+        self.pulls[(full_name, pull_json["number"])] = pull_json
+        self.files[(full_name, pull_json["number"])] = files or []
+
+    def add_commit(self, full_name, sha, files=None):
+        self.commits[(full_name, sha)] = files or []
+
+    def create_pull(self, full_name, title, body, head, base):
+        for pull in self.pulls.values():
+            if (pull["base"]["repo"]["full_name"] == full_name and pull["head"]["label"] == head
+                    and pull["base"]["ref"] == base and pull["state"] == "open"):
+                return None  # Already exists
+        number = next(self._ids)
+        repo = self.repo_json(full_name)
+        pull_url = "{}/repos/{}/pulls/{}".format(_GITHUB_API_URL, full_name, number)
+        pull = {
+            "id": number,
+            "number": number,
+            "title": title,
+            "body": body,
+            "state": "open",
+            "merged": False,
+            "closed_at": None,
+            "url": pull_url,
+            "html_url": "https://github.com/{}/pull/{}".format(full_name, number),
+            "issue_url": "{}/repos/{}/issues/{}".format(_GITHUB_API_URL, full_name, number),
+            "head": {"label": head, "ref": head.split(":")[-1], "repo": repo},
+            "base": {"label": base, "ref": base, "repo": repo},
+        }
+        self.add_pull(full_name, pull)
+        return pull
+
+    def issue_json(self, full_name, number):
+        return {
+            "id": number,
+            "number": number,
+            "url": "{}/repos/{}/issues/{}".format(_GITHUB_API_URL, full_name, number),
+            "labels": [
+                self.labels.get(full_name, {}).get(name, {"name": name})
+                for name in sorted(self.issue_labels.get((full_name, number), []))
+            ],
+            "repository": self.repo_json(full_name),
+        }
+
+    def comment_json(self, full_name, body):
+        comment_id = next(self._ids)
+        comment = {
+            "id": comment_id,
+            "body": body,
+            "url": "{}/repos/{}/issues/comments/{}".format(_GITHUB_API_URL, full_name, comment_id),
+        }
+        self.comments[comment_id] = comment
+        return comment
+
+
+def create_app(fake_github=None):
+    """Flask app serving this FakeGithub (a new one if None) as app.fake_github."""
+    fake_app = Flask(__name__)
+    fake = fake_github or FakeGithub()
+    fake_app.fake_github = fake
+
+    @fake_app.before_request
+    def count_call():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        with fake.lock:
+            fake.calls["{} {}".format(request.method, rule)] += 1
+            if rule != "/rate_limit":
+                fake.rate_remaining = max(0, fake.rate_remaining - 1)
+
+    @fake_app.after_request
+    def rate_limit_headers(response):
+        with fake.lock:
+            response.headers["X-RateLimit-Limit"] = str(fake.rate_limit)
+            response.headers["X-RateLimit-Remaining"] = str(fake.rate_remaining)
+            response.headers["X-RateLimit-Reset"] = str(fake.rate_reset_at)
+        return response
+
+    @fake_app.errorhandler(404)
+    def not_found(_):
+        # Like GitHub, so that PyGithub raises UnknownObjectException
+        return jsonify({"message": "Not Found"}), 404
+
+    def answer(obj, status=200):
+        response = jsonify(fake.to_fake_urls(obj))
+        response.status_code = status
+        return response
+
+    def get_pull_or_404(owner, repo, number):
+        pull = fake.pulls.get(("{}/{}".format(owner, repo), number))
+        if pull is None:
+            abort(404)
+        return pull
+
+    @fake_app.route("/repos/<owner>/<repo>", methods=["GET"])
+    def get_repo(owner, repo):
+        with fake.lock:
+            return answer(fake.repo_json("{}/{}".format(owner, repo)))
+
+    @fake_app.route("/repos/<owner>/<repo>/commits/<sha>", methods=["GET"])
+    def get_commit(owner, repo, sha):
+        full_name = "{}/{}".format(owner, repo)
+        with fake.lock:
+            files = fake.commits.get((full_name, sha), [])
+        return answer({
+            "sha": sha,
+            "url": "{}/repos/{}/commits/{}".format(_GITHUB_API_URL, full_name, sha),
+            "commit": {"message": "Commit {}".format(sha)},
+            "files": [{"filename": filename} for filename in files],
+        })
+
+    @fake_app.route("/repos/<owner>/<repo>/pulls", methods=["GET", "POST"])
+    def pulls(owner, repo):
+        full_name = "{}/{}".format(owner, repo)
+        with fake.lock:
+            if request.method == "POST":
+                data = request.get_json()
+                pull = fake.create_pull(full_name, data["title"], data.get("body"), data["head"], data["base"])
+                if pull is None:
+                    return answer({
+                        "message": "Validation Failed",
+                        "errors": [{"message": "A pull request already exists for {}.".format(data["head"])}]
+                    }, 422)
+                return answer(pull, 201)
+            head = request.args.get("head")
+            base = request.args.get("base")
+            return answer([
+                pull for (pull_repo, _), pull in sorted(fake.pulls.items(), key=lambda item: item[0][1])
+                if pull_repo == full_name
+                and (head is None or pull["head"]["label"] == head)
+                and (base is None or pull["base"]["ref"] == base)
+            ])
+
+    @fake_app.route("/repos/<owner>/<repo>/pulls/<int:number>", methods=["GET", "PATCH"])
+    def pull(owner, repo, number):
+        with fake.lock:
+            pull_json = get_pull_or_404(owner, repo, number)
+            if request.method == "PATCH":
+                pull_json.update(request.get_json())
+            return answer(pull_json)
+
+    @fake_app.route("/repos/<owner>/<repo>/pulls/<int:number>/files", methods=["GET"])
+    def pull_files(owner, repo, number):
+        with fake.lock:
+            get_pull_or_404(owner, repo, number)
+            files = fake.files[("{}/{}".format(owner, repo), number)]
+        return answer([{"filename": filename, "status": "modified"} for filename in files])
+
+    @fake_app.route("/repos/<owner>/<repo>/pulls/<int:number>/merge", methods=["PUT"])
+    def merge_pull(owner, repo, number):
+        with fake.lock:
+            pull_json = get_pull_or_404(owner, repo, number)
+            pull_json["merged"] = True
+            pull_json["state"] = "closed"
+        return answer({"merged": True, "sha": "0" * 40, "message": "Merged"})
+
+    @fake_app.route("/repos/<owner>/<repo>/issues/<int:number>", methods=["GET"])
+    def issue(owner, repo, number):
+        with fake.lock:
+            return answer(fake.issue_json("{}/{}".format(owner, repo), number))
+
+    @fake_app.route("/repos/<owner>/<repo>/issues/<int:number>/comments", methods=["GET", "POST"])
+    def issue_comments(owner, repo, number):
+        full_name = "{}/{}".format(owner, repo)
+        with fake.lock:
+            comment_ids = fake.issue_comments.setdefault((full_name, number), [])
+            if request.method == "POST":
+                comment = fake.comment_json(full_name, request.get_json()["body"])
+                comment_ids.append(comment["id"])
+                return answer(comment, 201)
+            return answer([fake.comments[comment_id] for comment_id in comment_ids if comment_id in fake.comments])
+
+    @fake_app.route("/repos/<owner>/<repo>/issues/comments/<int:comment_id>", methods=["GET", "PATCH", "DELETE"])
+    def comment(owner, repo, comment_id):
+        with fake.lock:
+            if comment_id not in fake.comments:
+                abort(404)
+            if request.method == "DELETE":
+                del fake.comments[comment_id]
+                return "", 204
+            if request.method == "PATCH":
+                fake.comments[comment_id]["body"] = request.get_json()["body"]
+            return answer(fake.comments[comment_id])
+
+    @fake_app.route("/repos/<owner>/<repo>/labels", methods=["POST"])
+    def create_label(owner, repo):
+        full_name = "{}/{}".format(owner, repo)
+        data = request.get_json()
+        with fake.lock:
+            label = {
+                "name": data["name"],
+                "color": data["color"],
+                "url": "{}/repos/{}/labels/{}".format(_GITHUB_API_URL, full_name, data["name"]),
+            }
+            fake.labels.setdefault(full_name, {})[data["name"]] = label
+            return answer(label, 201)
+
+    @fake_app.route("/repos/<owner>/<repo>/labels/<name>", methods=["GET"])
+    def get_label(owner, repo, name):
+        with fake.lock:
+            label = fake.labels.get("{}/{}".format(owner, repo), {}).get(name)
+            if label is None:
+                abort(404)
+            return answer(label)
+
+    @fake_app.route("/repos/<owner>/<repo>/issues/<int:number>/labels", methods=["POST"])
+    def add_labels(owner, repo, number):
+        full_name = "{}/{}".format(owner, repo)
+        with fake.lock:
+            fake.issue_labels.setdefault((full_name, number), set()).update(request.get_json())
+            return answer(fake.issue_json(full_name, number)["labels"])
+
+    @fake_app.route("/repos/<owner>/<repo>/issues/<int:number>/labels/<name>", methods=["DELETE"])
+    def remove_label(owner, repo, number, name):
+        with fake.lock:
+            labels = fake.issue_labels.get(("{}/{}".format(owner, repo), number), set())
+            if name not in labels:
+                abort(404)
+            labels.remove(name)
+        return "", 204
+
+    @fake_app.route("/repos/<owner>/<repo>/git/refs/<path:ref>", methods=["GET", "DELETE"])
+    def git_ref(owner, repo, ref):
+        full_name = "{}/{}".format(owner, repo)
+        with fake.lock:
+            if request.method == "DELETE":
+                fake.refs.discard((full_name, ref))
+                return "", 204
+            return answer({
+                "ref": "refs/"+ref,
+                "url": "{}/repos/{}/git/refs/{}".format(_GITHUB_API_URL, full_name, ref),
+                "object": {"sha": "0" * 40, "type": "commit"},
+            })
+
+    @fake_app.route("/graphql", methods=["POST"])
+    def graphql():
+        """Only the queries of graphql_snapshot.py, recognized by operation name."""
+        data = request.get_json()
+        match = re.search(r"query\s+(\w+)", data["query"])
+        operation = match.group(1) if match else None
+        variables = data.get("variables") or {}
+        full_name = "{}/{}".format(variables.get("owner"), variables.get("name"))
+        with fake.lock:
+            if operation == "PullRequestSnapshot":
+                pull_json = fake.pulls.get((full_name, variables["number"]))
+                if pull_json is None:
+                    return answer({"data": None, "errors": [{"message": "Could not resolve to a PullRequest"}]})
+                files = fake.files.get((full_name, variables["number"]), [])
+                start = int(variables.get("filesCursor") or 0)
+                page = files[start:start+100]
+                return answer({"data": {"repository": {"pullRequest": {
+                    "files": {
+                        "nodes": [{"path": filename} for filename in page],
+                        "pageInfo": {"hasNextPage": start + 100 < len(files), "endCursor": str(start + len(page))},
+                    },
+                    "commits": {"nodes": [{"commit": {
+                        "oid": pull_json.get("head", {}).get("sha", "0" * 40),
+                        "message": pull_json["title"],
+                    }}]},
+                }}}})
+            if operation == "SdkSnapshot":
+                pulls = []
+                for (pull_repo, number), pull_json in sorted(fake.pulls.items(), key=lambda item: -item[0][1]):
+                    if pull_repo != full_name or pull_json["head"]["ref"] != variables["head"]:
+                        continue
+                    if pull_json.get("merged"):
+                        state = "MERGED"
+                    else:
+                        state = pull_json["state"].upper()
+                    pulls.append({
+                        "number": number,
+                        "state": state,
+                        "baseRefName": pull_json["base"]["ref"],
+                        "headRepositoryOwner": {"login": pull_json["head"]["label"].split(":")[0]},
+                        "labels": labels_page(sorted(fake.issue_labels.get((full_name, number), [])), None),
+                    })
+                return answer({"data": {"repository": {
+                    "labels": labels_page(sorted(fake.labels.get(full_name, {})), None),
+                    "pullRequests": {"nodes": pulls},
+                }}})
+            if operation == "SdkLabels":
+                return answer({"data": {"repository": {
+                    "labels": labels_page(sorted(fake.labels.get(full_name, {})), variables.get("labelsCursor")),
+                }}})
+        return answer({"data": None, "errors": [{"message": "Unknown operation {}".format(operation)}]})
+
+    def labels_page(names, cursor):
+        """Page of 100 labels after this cursor, as GraphQL connection."""
+        start = int(cursor or 0)
+        page = names[start:start+100]
+        return {
+            "nodes": [{"name": name} for name in page],
+            "pageInfo": {"hasNextPage": start + 100 < len(names), "endCursor": str(start + len(page))},
+        }
+
+    @fake_app.route("/user", methods=["GET"])
+    def user():
+        return answer({"login": fake.user_login, "type": "User"})
+
+    @fake_app.route("/rate_limit", methods=["GET"])
+    def rate_limit():
+        with fake.lock:
+            core = {"limit": fake.rate_limit, "remaining": fake.rate_remaining, "reset": fake.rate_reset_at}
+        return answer({"resources": {"core": core}, "rate": core})
+
+    return fake_app
+
+
+class FakeGithubServer:
+    """Serve a fake GitHub on a free localhost port, in a background thread.
+
+    Use as a context manager, base_url is available once started.
+    """
+    def __init__(self, fake_github=None):
+        self.app = create_app(fake_github)
+        self.fake_github = self.app.fake_github
+        self._server = make_server("127.0.0.1", 0, self.app, threaded=True)
+        self.base_url = "http://127.0.0.1:{}".format(self._server.server_port)
+        self.fake_github.base_url = self.base_url
+        self._thread = Thread(target=self._server.serve_forever, name="FakeGithub", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        _LOGGER.info("Fake GitHub listening on %s", self.base_url)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._thread.join()
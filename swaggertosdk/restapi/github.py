@@ -1,16 +1,17 @@
 import os
 from enum import Enum
+from functools import lru_cache
 import hmac
 import hashlib
+import json
 import logging
-from queue import Queue
+import re
+import time
 import traceback
-from threading import Thread
+from threading import Lock, Thread
 
 from flask import request, jsonify
 
-from github import Github
-
 from azure_devtools.ci_tools.bot_framework import (
     BotHandler
 )
@@ -21,17 +22,78 @@ from .restbot import (
     RestAPIRepoHandler
 )
 from .github_handler import (
-    rest_pr_management,
-    generate_sdk_from_git_object
+    rest_pr_management_targets,
+)
+from ..SwaggerToSdkNewCLI import (
+    SdkTarget,
+    generate_sdks_from_git_object,
 )
 from azure_devtools.ci_tools.github_tools import (
     exception_to_github,
     DashboardCommentableObject,
 )
+from ..autorest_tools import GenerationCancelled
+from ..SwaggerToSdkCore import GITHUB_API_URL_ENV, get_github_client
+from .broker import BROKER_ENV, create_job_queue
+from .graphql_snapshot import GRAPHQL_ENV, GraphqlClient
+from .scheduler import JobStats, RateBudget, create_job
 from . import app
 
 _LOGGER = logging.getLogger("swaggertosdk.restapi.github")
-_QUEUE = Queue(64)
+# GitHub API quota, updated after each job from the shared GitHub client
+_RATE_BUDGET = RateBudget()
+# In-process scheduler, or shared broker if SWAGGER_TO_SDK_BROKER is set (see broker.py)
+_QUEUE = create_job_queue(64, rate_budget=_RATE_BUDGET)
+
+# Number of worker threads consuming the queue
+WORKERS_ENV = "SWAGGER_TO_SDK_WORKERS"
+
+# If set, every webhook received is appended to this JSON lines file (see restapi/replay.py)
+RECORD_WEBHOOKS_ENV = "SWAGGER_TO_SDK_RECORD_WEBHOOKS"
+
+_RECORD_LOCK = Lock()
+
+
+_JOB_STATS = JobStats()
+
+
+def get_job_queue():
+    """Queue of the jobs of this process (scheduler or shared broker)."""
+    return _QUEUE
+
+
+def get_rate_budget():
+    """GitHub API quota of this process, shared by the jobs and the queue."""
+    return _RATE_BUDGET
+
+
+def get_job_stats():
+    """Timing of the jobs run by this process."""
+    return _JOB_STATS
+
+
+def get_graphql_client(gh_token):
+    """GraphQL client, or None if SWAGGER_TO_SDK_GRAPHQL is not set."""
+    if not os.environ.get(GRAPHQL_ENV):
+        return None
+    return GraphqlClient(gh_token, os.environ.get(GITHUB_API_URL_ENV) or "https://api.github.com")
+
+
+def record_webhook(local_request):
+    """Append this webhook to the record file, if SWAGGER_TO_SDK_RECORD_WEBHOOKS is set."""
+    record_path = os.environ.get(RECORD_WEBHOOKS_ENV)
+    if not record_path:
+        return
+    record = {
+        "timestamp": time.time(),
+        "path": local_request.path,
+        "args": dict(local_request.args),
+        "event": local_request.headers.get("X-GitHub-Event"),
+        "delivery": local_request.headers.get("X-GitHub-Delivery"),
+        "body": local_request.get_json(),
+    }
+    with _RECORD_LOCK, open(record_path, "a", encoding="utf-8") as record_fd:
+        record_fd.write(json.dumps(record) + "\n")
 
 
 # Webhook secreet to authenticate message (bytes)
@@ -64,27 +126,33 @@ def notify():
         request.get_json()
     )
 
+@app.route('/github/status', methods=['GET'])
+def status():
+    """Queue size and timing of the jobs."""
+    job_stats = _JOB_STATS.as_dict()
+    job_stats["queue_size"] = _QUEUE.qsize()
+    job_stats["superseded"] = _QUEUE.superseded
+    job_stats["rate_limit"] = _RATE_BUDGET.as_dict()
+    tenants = job_stats.setdefault("tenants", {})
+    for sdkid, tenant_status in _QUEUE.tenants_status().items():
+        tenants.setdefault(sdkid, {}).update(tenant_status)
+    return jsonify(job_stats)
+
 @app.route('/github/rest', methods=['POST'])
 def rest_notify():
     """Github rest endpoint."""
     sdkid = request.args.get("sdkid")
-    sdkbase = request.args.get("sdkbase", "master")
-    sdk_tag = request.args.get("repotag", sdkid.split("/")[-1].lower())
-
     if not sdkid:
         return {'message': 'sdkid is a required query parameter'}
 
-    rest_bot = RestAPIRepoHandler(sdkid, sdk_tag, sdkbase)
-    bot = BotHandler(rest_bot)
     github_index = {
         'ping': ping,
         'push': push,
         'pull_request': rest_pull_request,
-        'issue_comment': bot.issue_comment,
-        'issues': bot.issues
+        'issue_comment': rest_issue_comment,
+        'issues': rest_issues
     }
-    if not _WORKER_THREAD.is_alive():
-        _WORKER_THREAD.start()
+    start_workers()
 
     return handle_github_webhook(
         github_index,
@@ -96,6 +164,7 @@ def handle_github_webhook(github_index, gh_event_type, json_body):
     if _HMAC_CHECK:
         check_hmac(request, SECRET)
     _LOGGER.info("Received Webhook %s", request.headers.get("X-GitHub-Delivery"))
+    record_webhook(request)
 
     json_answer = notify_github(github_index, gh_event_type, json_body)
     return jsonify(json_answer)
@@ -108,11 +177,28 @@ def notify_github(github_index, event_type, json_body):
 def ping(body):
     return {'message': 'Moi aussi zen beaucoup'}
 
-def push(body):
-    sdkid = request.args.get("sdkid")
-    sdkbase = request.args.get("sdkbase", "master")
-    sdk_tag = request.args.get("repotag", sdkid.split("/")[-1].lower())
+def get_default_sdk_tag(sdkid):
+    """Default "repotag" of the webhook: name of the SDK repo, lower case (one per SDK)."""
+    return ",".join(target_sdkid.split("/")[-1].lower() for target_sdkid in sdkid.split(","))
+
+def get_sdk_targets(sdkid, sdkbase, sdk_tag):
+    """List of (sdkid, sdkbase, sdk_tag) of a webhook.
+
+    Several SDKs are generated from the same RestAPI clone if "sdkid" is a comma separated list.
+    "sdkbase" and "repotag" are then one value for all the SDKs, or one value per SDK.
+    """
+    sdkids = [target_sdkid.strip() for target_sdkid in sdkid.split(",")]
+    def per_target(value, name):
+        values = [target_value.strip() for target_value in value.split(",")]
+        if len(values) == 1:
+            return values * len(sdkids)
+        if len(values) != len(sdkids):
+            raise ValueError("{} must have one value, or one value per sdkid: {}".format(name, value))
+        return values
+    return list(zip(sdkids, per_target(sdkbase, "sdkbase"), per_target(sdk_tag, "repotag")))
 
+def push(body):
+    """Queue the generation of a push on a branch of the RestAPI repo, like a PR event."""
     rest_api_branch_name = body["ref"][len("refs/heads/"):]
     if rest_api_branch_name == "master":
         return {'message': 'Webhook disabled for RestAPI master'}
@@ -120,71 +206,144 @@ def push(body):
     if body['deleted']:
         return {'message': 'Webhook disabled if push is a delete'}
 
+    return queue_job('push', body)
+
+def rest_handle_push(body, sdkid, sdkbase, sdk_tag, cancel_token=None):
+    """Generate the SDKs from the pushed commit, in the worker.
+
+    sdkid, sdkbase and sdk_tag can list several SDKs, generated from the same RestAPI clone (see get_sdk_targets).
+    """
+    rest_api_branch_name = body["ref"][len("refs/heads/"):]
     gh_token = os.environ["GH_TOKEN"]
-    github_con = Github(gh_token)
+    github_con = get_github_client(gh_token)
 
     restapi_git_id = body['repository']['full_name']
     restapi_repo = github_con.get_repo(restapi_git_id)
 
     commit_obj = restapi_repo.get_commit(body["after"])
-    generate_sdk_from_git_object(
-        commit_obj,
-        "restapi_auto_"+rest_api_branch_name,
-        restapi_git_id,
-        sdkid,
-        [], # I don't know if the origin branch comes from "master", assume it.
-        fallback_base_branch_name=sdkbase,
-        sdk_tag=sdk_tag
+    targets = [
+        # I don't know if the origin branch comes from "master", assume it.
+        SdkTarget(target_sdkid, "restapi_auto_"+rest_api_branch_name, [], target_sdkbase, target_sdk_tag)
+        for target_sdkid, target_sdkbase, target_sdk_tag in get_sdk_targets(sdkid, sdkbase, sdk_tag)
+    ]
+    results = generate_sdks_from_git_object(
+        commit_obj, targets, restapi_git_id,
+        cancel_token=cancel_token, return_exceptions=len(targets) > 1
     )
-    return {'message': 'No return for this endpoint'}
+    for target, result in zip(targets, results):
+        if isinstance(result, Exception):
+            _LOGGER.warning("Unable to generate %s from push on %s: %s",
+                            target.sdk_git_id, rest_api_branch_name, result)
 
 def rest_pull_request(body):
+    _LOGGER.info("Received PR action %s", body["action"])
+    return queue_job('pull_request', body)
+
+def get_robot_name(gh_token):
+    """Login of the bot, asked once to GitHub."""
+    return _get_robot_name(gh_token, os.environ.get(GITHUB_API_URL_ENV))
+
+@lru_cache()
+def _get_robot_name(gh_token, base_url):
+    del base_url  # Cache key only, used by get_github_client
+    return get_github_client(gh_token).get_user().login
+
+def is_bot_command(body, robot_name):
+    """Is this issue comment (or issue text) talking to the bot, and not written by the bot itself."""
+    if body['sender']['login'].lower() == robot_name.lower():
+        return False
+    text = body['comment']['body'] if 'comment' in body else body['issue']['body']
+    # Same pattern as BotHandler
+    return re.search("@{} (.*)".format(re.escape(robot_name)), text or "", re.I) is not None
+
+def rest_issue_comment(body):
+    """Queue this comment only if it's a command for the bot: most comments are not."""
+    if not is_bot_command(body, get_robot_name(os.environ["GH_TOKEN"])):
+        return {'message': 'Nothing for me'}
+    return queue_job('issue_comment', body)
+
+def rest_issues(body):
+    """Queue this issue only if its text is a command for the bot."""
+    if not is_bot_command(body, get_robot_name(os.environ["GH_TOKEN"])):
+        return {'message': 'Nothing for me'}
+    return queue_job('issues', body)
+
+def queue_job(event_type, body):
+    """Queue this webhook for the worker thread. Generations and bot commands are all queued, to be prioritized."""
     sdkid = request.args.get("sdkid")
     sdkbase = request.args.get("sdkbase", "master")
-    sdk_tag = request.args.get("repotag", sdkid.split("/")[-1].lower())
+    sdk_tag = request.args.get("repotag", get_default_sdk_tag(sdkid))
 
-    _LOGGER.info("Received PR action %s", body["action"])
-    _QUEUE.put((body, sdkid, sdkbase, sdk_tag))
-    _LOGGER.info("Received action has been queued. Queue size: %d", _QUEUE.qsize())
+    _QUEUE.put(create_job(event_type, body, sdkid, sdkbase, sdk_tag))
+    _LOGGER.info("Received %s has been queued. Queue size: %d", event_type, _QUEUE.qsize())
 
     return {'message': 'Current queue size: {}'.format(_QUEUE.qsize())}
 
-def rest_handle_action(body, sdkid, sdkbase, sdk_tag):
+def handle_job(job):
+    """Execute a job from the queue."""
+    if job.event_type == 'pull_request':
+        return rest_handle_action(job.body, job.sdkid, job.sdkbase, job.sdk_tag, job.cancel_token)
+    if job.event_type == 'push':
+        return rest_handle_push(job.body, job.sdkid, job.sdkbase, job.sdk_tag, job.cancel_token)
+    # Bot commands are for the first SDK of the webhook
+    sdkid, sdkbase, sdk_tag = get_sdk_targets(job.sdkid, job.sdkbase, job.sdk_tag)[0]
+    bot = BotHandler(
+        RestAPIRepoHandler(sdkid, sdk_tag, sdkbase),
+        robot_name=get_robot_name(os.environ["GH_TOKEN"])
+    )
+    return getattr(bot, job.event_type)(job.body)
+
+def rest_handle_action(body, sdkid, sdkbase, sdk_tag, cancel_token=None):
     """First method in the thread.
+
+    sdkid, sdkbase and sdk_tag can list several SDKs, generated from the same RestAPI clone (see get_sdk_targets).
+    If cancel_token is cancelled (a newer event superseded this one), the generation stops silently.
     """
     _LOGGER.info("Rest handle action")
     gh_token = os.environ["GH_TOKEN"]
-    github_con = Github(gh_token)
+    github_con = get_github_client(gh_token)
 
-    sdk_pr_target_repo = github_con.get_repo(sdkid)
+    sdk_targets = [
+        (github_con.get_repo(target_sdkid), target_sdk_tag, target_sdkbase)
+        for target_sdkid, target_sdkbase, target_sdk_tag in get_sdk_targets(sdkid, sdkbase, sdk_tag)
+    ]
 
     restapi_repo = github_con.get_repo(body['repository']['full_name'])
     rest_pr = restapi_repo.get_pull(body["number"])
     dashboard = DashboardCommentableObject(rest_pr, "# Automation for {}".format(sdk_tag))
+    graphql_client = get_graphql_client(gh_token)
 
     _LOGGER.info("Received PR action %s", body["action"])
     with exception_to_github(dashboard, sdk_tag):
-        if body["action"] in ["opened", "reopened"]:
-            return rest_pull_open(body, restapi_repo, sdk_pr_target_repo, sdkbase, sdk_tag)
-        if body["action"] == "closed":
-            return rest_pull_close(body, restapi_repo, sdk_pr_target_repo, sdkbase, sdk_tag)
-        if body["action"] == "synchronize": # push to a PR from a fork
-            return rest_pull_sync(body, restapi_repo, sdk_pr_target_repo, sdkbase, sdk_tag)
-
-def rest_pull_open(body, restapi_repo, sdk_pr_target_repo, sdk_default_base="master", sdk_tag=None):
+        pull_args = (body, restapi_repo, sdk_targets, cancel_token, rest_pr, graphql_client)
+        try:
+            if body["action"] in ["opened", "reopened"]:
+                return rest_pull_open(*pull_args)
+            if body["action"] == "closed":
+                return rest_pull_close(*pull_args)
+            if body["action"] == "synchronize": # push to a PR from a fork
+                return rest_pull_sync(*pull_args)
+        except GenerationCancelled:
+            # Not an error, the newer event will update the dashboard
+            _LOGGER.info("Generation for PR %s has been superseded by a newer event", body["number"])
+
+def rest_pull_open(body, restapi_repo, sdk_targets, cancel_token=None, rest_pr=None, graphql_client=None):
+    """sdk_targets is a list of (sdk_repo, sdk_tag, sdk_default_base), see rest_pr_management_targets."""
     _LOGGER.info("Received a PR open event")
 
-    rest_pr = restapi_repo.get_pull(body["number"])
-    rest_pr_management(rest_pr, sdk_pr_target_repo, sdk_tag, sdk_default_base)
+    if rest_pr is None:
+        rest_pr = restapi_repo.get_pull(body["number"])
+    rest_pr_management_targets(rest_pr, sdk_targets, cancel_token=cancel_token, graphql_client=graphql_client)
 
 
-def rest_pull_close(body, restapi_repo, sdk_pr_target_repo, sdk_default_base="master", sdk_tag=None):
+def rest_pull_close(body, restapi_repo, sdk_targets, cancel_token=None, rest_pr=None, graphql_client=None):
     _LOGGER.info("Received a PR closed event")
 
-    rest_pr = restapi_repo.get_pull(body["number"])
-    rest_pr_management(rest_pr, sdk_pr_target_repo, sdk_tag, sdk_default_base)
+    if rest_pr is None:
+        rest_pr = restapi_repo.get_pull(body["number"])
+    rest_pr_management_targets(rest_pr, sdk_targets, cancel_token=cancel_token, graphql_client=graphql_client)
 
-def rest_pull_sync(body, restapi_repo, sdk_pr_target_repo, sdk_default_base="master", sdk_tag=None):
+def rest_pull_sync(body, restapi_repo, sdk_targets, cancel_token=None, rest_pr=None, graphql_client=None):
 
     # If this sync has no commit change, save CPU time.
     if body["before"] == body["after"]:
@@ -196,22 +355,61 @@ def rest_pull_sync(body, restapi_repo, sdk_pr_target_repo, sdk_default_base="mas
         _LOGGER.info("This will be handled by 'push' event on the branch")
         return
 
-    rest_pr = restapi_repo.get_pull(body["number"])
-    rest_pr_management(rest_pr, sdk_pr_target_repo, sdk_tag, sdk_default_base)
+    if rest_pr is None:
+        rest_pr = restapi_repo.get_pull(body["number"])
+    rest_pr_management_targets(rest_pr, sdk_targets, cancel_token=cancel_token, graphql_client=graphql_client)
 
-def consume():
+def consume(job_queue=None):
     """Consume action and block if there is not.
+
+    :param job_queue: The queue to consume, default is the queue of the webhook server.
     """
+    if job_queue is None:
+        job_queue = _QUEUE
     while True:
-        body, sdkid, sdkbase, sdk_tag = _QUEUE.get()
-        _LOGGER.info("Pop from queue. Queue size: %d", _QUEUE.qsize())
+        job = job_queue.get()
+        _LOGGER.info("Pop %s (priority %d) from queue. Queue size: %d", job.event_type, job.priority, job_queue.qsize())
+        start_time = time.monotonic()
+        success = True
         try:
-            rest_handle_action(body, sdkid, sdkbase, sdk_tag)
+            handle_job(job)
         except Exception as err:
+            success = False
             _LOGGER.critical("Worked thread issue:\n%s", traceback.format_exc())
+        finally:
+            _JOB_STATS.record(start_time - job.enqueued_at, time.monotonic() - start_time, success, job.sdkid)
+            update_rate_budget()
+            job_queue.task_done(job)
     _LOGGER.info("End of WorkerThread")
 
-_WORKER_THREAD = Thread(
-    target=consume,
-    name="WorkerThread"
-)
+def update_rate_budget():
+    """Update the API quota from the last response of the shared GitHub client."""
+    gh_token = os.environ.get("GH_TOKEN")
+    if not gh_token:
+        return
+    try:
+        _RATE_BUDGET.update_from_client(get_github_client(gh_token))
+    except Exception as err:
+        _LOGGER.warning("Unable to get the GitHub API quota: %s", err)
+
+_WORKER_THREADS = []
+_WORKER_THREADS_LOCK = Lock()
+
+def start_workers():
+    """Start the worker threads, if not started yet.
+
+    With a shared broker, this server only queues the jobs: "python -m swaggertosdk worker" consumes them.
+    """
+    if os.environ.get(BROKER_ENV):
+        return
+    with _WORKER_THREADS_LOCK:
+        if _WORKER_THREADS:
+            return
+        for index in range(int(os.environ.get(WORKERS_ENV, 1))):
+            worker_thread = Thread(
+                target=consume,
+                name="WorkerThread-{}".format(index),
+                daemon=True
+            )
+            worker_thread.start()
+            _WORKER_THREADS.append(worker_thread)
@@ -9,10 +9,16 @@ from github import UnknownObjectException, GithubException
 from swaggertosdk.SwaggerToSdkCore import (
     get_context_tag_from_git_object,
 )
-from swaggertosdk.SwaggerToSdkNewCLI import generate_sdk_from_git_object
+from swaggertosdk.autorest_tools import GenerationCancelled
+from swaggertosdk.SwaggerToSdkNewCLI import (
+    SdkTarget,
+    generate_sdks_from_git_object,
+)
+from swaggertosdk.generation_ledger import GenerationLedger
 from azure_devtools.ci_tools.github_tools import (
     get_or_create_pull,
     DashboardCommentableObject,
+    exception_to_github,
     manage_git_folder,
     configure_user,
     user_from_token
@@ -20,6 +26,9 @@ from azure_devtools.ci_tools.github_tools import (
 
 from git import Repo
 
+from .api_fanout import ApiFanOut
+from .graphql_snapshot import load_pull_request_snapshot, load_sdk_snapshot
+
 _LOGGER = logging.getLogger("swaggertosdk.restapi.github_handler")
 
 # How many context tag I authorize in a PR to accept it
@@ -41,7 +50,19 @@ class SwaggerToSdkLabels(Enum):
     in_progress = "RestPRInProgress", "fbca04"
     service_pr = "ServicePR", "1d76db"
 
-def get_or_create_label(sdk_pr_target_repo, label_enum):
+def get_or_create_label(sdk_pr_target_repo, label_enum, repo_labels=None):
+    """Get the label, create it if needed.
+
+    If repo_labels (names of the labels of the repo) is known, the label name is returned
+    without calling GitHub if it exists.
+    """
+    if repo_labels is not None:
+        if label_enum.value[0] in repo_labels:
+            return label_enum.value[0]
+        try:
+            return sdk_pr_target_repo.create_label(*label_enum.value)
+        except GithubException:
+            pass  # Created meanwhile
     try:
         return sdk_pr_target_repo.get_label(label_enum.value[0])
     except UnknownObjectException:
@@ -55,21 +76,30 @@ def safe_remove_label(issue, label):
     except GithubException:
         pass
 
-def manage_labels(issue, to_add=None, to_remove=None):
+def manage_labels(issue, to_add=None, to_remove=None, current_labels=None, repo_labels=None):
+    """Add and remove these labels.
+
+    If the names of the labels of the issue (current_labels) or of the repo (repo_labels) are known,
+    calls that would do nothing are skipped.
+    """
     if not to_add:
         to_add = []
     if not to_remove:
         to_remove = []
+    if current_labels is not None:
+        to_remove = [label for label in to_remove if label.value[0] in current_labels]
+        to_add = [label for label in to_add if label.value[0] not in current_labels]
     for label_remove in to_remove:
-        safe_remove_label(issue, get_or_create_label(issue.repository, label_remove))
+        safe_remove_label(issue, get_or_create_label(issue.repository, label_remove, repo_labels))
     for label_add in to_add:
         try:
-            issue.add_to_labels(get_or_create_label(issue.repository, label_add))
+            issue.add_to_labels(get_or_create_label(issue.repository, label_add, repo_labels))
         except Exception as err:
             # Never fail is adding a label was impossible
             _LOGGER.warning("Unable to add label: %s", label_add)
 
-def rest_pr_management(rest_pr, sdk_repo, sdk_tag, sdk_default_base=_DEFAULT_SDK_BRANCH):
+def rest_pr_management(rest_pr, sdk_repo, sdk_tag, sdk_default_base=_DEFAULT_SDK_BRANCH, *,
+                       plan=False, cancel_token=None, graphql_client=None):
     """What to do when something happen to a PR in the Rest repo.
 
     :param restpr: a PyGithub pull object
@@ -78,29 +108,68 @@ def rest_pr_management(rest_pr, sdk_repo, sdk_tag, sdk_default_base=_DEFAULT_SDK
     :type sdk_repo: github.Repository.Repository
     :param str sdk_tag: repotag to use to filter SwaggerToSDK conf
     :param str sdk_default_base: Default SDK branch.
+    :param bool plan: If True, do not generate nor touch GitHub, return the list of ProjectPlan instead.
+    :param CancellationToken cancel_token: If cancelled, generation stops with GenerationCancelled.
+    :param GraphqlClient graphql_client: If given, SDK PRs and labels are loaded in one GraphQL query.
     """
+    return rest_pr_management_targets(
+        rest_pr,
+        [(sdk_repo, sdk_tag, sdk_default_base)],
+        plan=plan,
+        cancel_token=cancel_token,
+        graphql_client=graphql_client
+    )[0]
+
+def rest_pr_management_targets(rest_pr, targets, *, plan=False, cancel_token=None, graphql_client=None):
+    """What to do when something happen to a PR in the Rest repo, for several SDKs at once.
+
+    Context is detected once and the RestAPI repo is cloned once, then the SDKs are generated in
+    parallel (see generate_sdks_from_git_object). With several targets, the failure of one SDK is
+    reported in its own dashboard and does not stop the others.
+
+    :param restpr: a PyGithub pull object
+    :type restpr: github.PullRequest.PullRequest
+    :param list targets: list of (sdk_repo, sdk_tag, sdk_default_base), see rest_pr_management
+    :param bool plan: If True, do not generate nor touch GitHub, return the lists of ProjectPlan instead.
+    :param CancellationToken cancel_token: If cancelled, generation stops with GenerationCancelled.
+    :param GraphqlClient graphql_client: If given, SDK PRs and labels are loaded in one GraphQL query.
+    :returns: A list with one result per target, in the same order.
+    """
+    # Files and commits of the PR are read several times, load them once
+    if graphql_client:
+        rest_pr = load_pull_request_snapshot(graphql_client, rest_pr)
+
     # Extract some metadata as variables
     rest_repo = rest_pr.base.repo
     # "repo" can be None if fork has been deleted.
     is_from_a_fork = rest_pr.head.repo is None or rest_pr.head.repo.full_name != rest_repo.full_name
 
     # THE comment were we put everything
-    dashboard = DashboardCommentableObject(rest_pr, "# Automation for {}".format(sdk_tag))
+    dashboards = [
+        DashboardCommentableObject(rest_pr, "# Automation for {}".format(sdk_tag))
+        for _, sdk_tag, _ in targets
+    ]
 
     #
     # Work on context, ext if context is not good
     #
     context_tags = list(get_context_tag_from_git_object(rest_pr))
     if not context_tags:
-        dashboard.create_comment("Unable to detect any generation context from this PR.")
-        return
+        if plan:
+            return [[] for _ in targets]
+        for dashboard in dashboards:
+            dashboard.create_comment("Unable to detect any generation context from this PR.")
+        return [None for _ in targets]
     if len(context_tags) > _CONTEXT_TAG_LIMITS:
-        dashboard.create_comment(
-            "This PR contains more than {} context, SDK generation is not enabled. Contexts found:\n{}".format(
-                _CONTEXT_TAG_LIMITS,
-                "\n".join(["- {}".format(ctxt) for ctxt in context_tags])
-            ))
-        return
+        if plan:
+            return [[] for _ in targets]
+        for dashboard in dashboards:
+            dashboard.create_comment(
+                "This PR contains more than {} context, SDK generation is not enabled. Contexts found:\n{}".format(
+                    _CONTEXT_TAG_LIMITS,
+                    "\n".join(["- {}".format(ctxt) for ctxt in context_tags])
+                ))
+        return [None for _ in targets]
 
     #
     # Decide if this PR will use a context branch
@@ -127,9 +196,8 @@ def rest_pr_management(rest_pr, sdk_repo, sdk_tag, sdk_default_base=_DEFAULT_SDK
     # branch to that list.
     #
     sdk_checkout_bases = []
-    if rest_pr.base.ref == _DEFAULT_REST_BRANCH:
-        sdk_pr_base = sdk_default_base
-    else:
+    sdk_pr_base = None  # SDK default base, that depends on the target
+    if rest_pr.base.ref != _DEFAULT_REST_BRANCH:
         sdk_pr_base = _SDK_PR_TEMPLATE.format(rest_pr.base.ref)
         sdk_checkout_bases.append(sdk_pr_base)
 
@@ -141,105 +209,181 @@ def rest_pr_management(rest_pr, sdk_repo, sdk_tag, sdk_default_base=_DEFAULT_SDK
     #
     # Try to generate on "head", whatever the state of the PR.
     #
-    generate_sdk_from_git_object(
+    multi_targets = len(targets) > 1
+    results = generate_sdks_from_git_object(
         rest_pr,
-        sdk_pr_head,
+        [
+            SdkTarget(sdk_repo.full_name, sdk_pr_head, sdk_checkout_bases, sdk_default_base, sdk_tag)
+            for sdk_repo, sdk_tag, sdk_default_base in targets
+        ],
         None,  # We don't need repo id if it's a PR, infer from PR itself.
-        sdk_repo.full_name,
-        sdk_checkout_bases,
-        fallback_base_branch_name=sdk_default_base,
-        sdk_tag=sdk_tag
+        plan=plan,
+        cancel_token=cancel_token,
+        return_exceptions=multi_targets and not plan
     )
+    if plan:
+        return [generation_plan or [] for generation_plan in results]
+    for result in results:
+        if isinstance(result, GenerationCancelled):
+            raise result
 
+    for (sdk_repo, sdk_tag, sdk_default_base), dashboard, result in zip(targets, dashboards, results):
+        if not multi_targets:
+            sdk_pr_management(rest_pr, sdk_repo, sdk_tag, sdk_default_base, dashboard, context_tags,
+                              sdk_pr_head, sdk_pr_base or sdk_default_base, is_pushed_to_context_branch, graphql_client)
+            continue
+        with exception_to_github(dashboard, sdk_tag):
+            if isinstance(result, Exception):
+                raise result
+            sdk_pr_management(rest_pr, sdk_repo, sdk_tag, sdk_default_base, dashboard, context_tags,
+                              sdk_pr_head, sdk_pr_base or sdk_default_base, is_pushed_to_context_branch, graphql_client)
+    return [None for _ in targets]
+
+def sdk_pr_management(rest_pr, sdk_repo, sdk_tag, sdk_default_base, dashboard, context_tags,
+                      sdk_pr_head, sdk_pr_base, is_pushed_to_context_branch, graphql_client=None):
+    """Create or update the SDK PR of this Rest PR, once the SDK is generated on sdk_pr_head."""
     #
     # Try to create/get a SDK PR.
     #
     # There is a lot of reasons why a SDK PR could not exist even on a "close" event, so don't assume this exists.
     #
+    sdk_snapshot = None
+    if graphql_client:
+        sdk_snapshot = load_sdk_snapshot(graphql_client, sdk_repo.full_name, sdk_pr_head)
     try:
-        sdk_pr = get_or_create_pull(
-            sdk_repo,
-            title='[AutoPR {}] {}'.format("/".join(context_tags), rest_pr.title),
-            body="Created to sync {}".format(rest_pr.html_url),
-            head=sdk_repo.owner.login+":"+sdk_pr_head,
-            base=sdk_pr_base,
-        )
+        existing_sdk_pr = sdk_snapshot.get_open_pull(sdk_pr_base) if sdk_snapshot else None
+        if existing_sdk_pr:
+            sdk_pr = sdk_repo.get_pull(existing_sdk_pr.number)
+        else:
+            sdk_pr = get_or_create_pull(
+                sdk_repo,
+                title='[AutoPR {}] {}'.format("/".join(context_tags), rest_pr.title),
+                body="Created to sync {}".format(rest_pr.html_url),
+                head=sdk_repo.owner.login+":"+sdk_pr_head,
+                base=sdk_pr_base,
+            )
     except Exception as err:
         _LOGGER.warning("Unable to create SDK PR: %s", err)
         dashboard.create_comment("Nothing to generate for {}".format(sdk_tag))
         return
 
-    # Replace whatever message it was if we were able to do a PR
-    dashboard.create_comment("A PR has been created for you:\n{}".format(sdk_pr.html_url))
-
     #
-    # Manage labels/state on this SDK PR.
+    # Everything else only depends on the SDK PR: run the API calls concurrently, in dependency order.
     #
-    sdk_pr_as_issue = sdk_repo.get_issue(sdk_pr.number)
-    sdk_pr_merged = False
-    if rest_pr.closed_at:  # If there is a date, this is closed
-        head_ref = sdk_repo.get_git_ref("heads/{}".format(sdk_pr_head))
-        if rest_pr.merged:
-            manage_labels(sdk_pr_as_issue,
-                          to_add=[SwaggerToSdkLabels.merged],
-                          to_remove=[SwaggerToSdkLabels.in_progress])
-            if sdk_pr.base.ref.startswith(_SDK_PR_PREFIX):
-                try:
-                    # Merge "single context PRs" automatically
-                    sdk_pr.merge(merge_method="squash")
-                    sdk_pr_merged = True
-                    # Delete branch from merged PR
-                    head_ref.delete()
-                except Exception as err:
-                    _LOGGER.warning("Was unable to merge: %s", err)
-        else:
-            manage_labels(sdk_pr_as_issue,
-                          to_add=[SwaggerToSdkLabels.refused],
-                          to_remove=[SwaggerToSdkLabels.in_progress])
-            sdk_pr.edit(state="closed")
-            # Delete branch from closed PR
-            head_ref.delete()
-    else:
-        # Try to remove "refused", if it was re-opened
-        manage_labels(sdk_pr_as_issue,
-                      to_add=[SwaggerToSdkLabels.in_progress],
-                      to_remove=[SwaggerToSdkLabels.refused])
+    with ApiFanOut() as api_operations:
+        # Replace whatever message it was if we were able to do a PR
+        dashboard_done = api_operations.submit(
+            dashboard.create_comment,
+            "A PR has been created for you:\n{}".format(sdk_pr.html_url)
+        )
 
-    #
-    # Extra work: if this was a context branch
-    #
-    if is_pushed_to_context_branch:
-        try:
-            context_pr = get_or_create_pull(
-                sdk_repo,
-                title='[AutoPR] {}'.format("/".join(context_tags)),
-                body="Created to accumulate context: {}".format(context_tags[0]),
-                head=sdk_repo.owner.login+":"+sdk_pr_base,
-                base=sdk_default_base,
-            )
-        except Exception as err:
-            _LOGGER.warning("Unable to create context PR: %s", err)
-            return
-        # We got the context PR!
-        context_pr_as_issue = sdk_repo.get_issue(context_pr.number)
-        manage_labels(context_pr_as_issue, [SwaggerToSdkLabels.service_pr])
-        # Put a link into the SDK single PR
-        if sdk_pr_merged:
-            sdk_pr.create_issue_comment("This PR has been merged into {}".format(context_pr.html_url))
-        # Update dashboar to talk about this PR
-        if sdk_pr.merged:
-            msg = "The initial [PR]({}) has been merged into your service PR:\n{}".format(
-                sdk_pr.html_url,
-                context_pr.html_url
-            )
+        #
+        # Manage labels/state on this SDK PR.
+        #
+        sdk_pr_as_issue = api_operations.submit(sdk_repo.get_issue, sdk_pr.number)
+        known_labels = {}
+        if sdk_snapshot:
+            known_labels = {
+                # Not in the snapshot: just created, no labels. None if too many labels to be loaded.
+                "current_labels": sdk_snapshot.get_pull_labels(sdk_pr.number) if existing_sdk_pr else set(),
+                "repo_labels": sdk_snapshot.labels,
+            }
+        sdk_pr_merged = None
+        if rest_pr.closed_at:  # If there is a date, this is closed
+            head_ref = api_operations.submit(sdk_repo.get_git_ref, "heads/{}".format(sdk_pr_head))
+            if rest_pr.merged:
+                api_operations.submit(
+                    lambda: manage_labels(sdk_pr_as_issue.result(),
+                                          to_add=[SwaggerToSdkLabels.merged],
+                                          to_remove=[SwaggerToSdkLabels.in_progress],
+                                          **known_labels),
+                    after=[sdk_pr_as_issue]
+                )
+                if sdk_pr.base.ref.startswith(_SDK_PR_PREFIX):
+                    def merge_sdk_pr():
+                        try:
+                            # Merge "single context PRs" automatically
+                            sdk_pr.merge(merge_method="squash")
+                            # Delete branch from merged PR
+                            head_ref.result().delete()
+                        except Exception as err:
+                            _LOGGER.warning("Was unable to merge: %s", err)
+                            return False
+                        return True
+                    sdk_pr_merged = api_operations.submit(merge_sdk_pr, after=[head_ref])
+            else:
+                api_operations.submit(
+                    lambda: manage_labels(sdk_pr_as_issue.result(),
+                                          to_add=[SwaggerToSdkLabels.refused],
+                                          to_remove=[SwaggerToSdkLabels.in_progress],
+                                          **known_labels),
+                    after=[sdk_pr_as_issue]
+                )
+                sdk_pr_closed = api_operations.submit(sdk_pr.edit, state="closed")
+                # Delete branch from closed PR
+                api_operations.submit(lambda: head_ref.result().delete(), after=[head_ref, sdk_pr_closed])
         else:
-            msg = "A [PR]({}) has been created for you based on this PR content.\n\n".format(
-                sdk_pr.html_url
+            # Try to remove "refused", if it was re-opened
+            api_operations.submit(
+                lambda: manage_labels(sdk_pr_as_issue.result(),
+                                      to_add=[SwaggerToSdkLabels.in_progress],
+                                      to_remove=[SwaggerToSdkLabels.refused],
+                                      **known_labels),
+                after=[sdk_pr_as_issue]
             )
-            msg += "Once this PR will be merged, content will be added to your service PR:\n{}".format(
-                context_pr.html_url
-            )
-        dashboard.create_comment(msg)
+
+        #
+        # Extra work: if this was a context branch
+        #
+        if is_pushed_to_context_branch:
+            def get_context_pr():
+                try:
+                    return get_or_create_pull(
+                        sdk_repo,
+                        title='[AutoPR] {}'.format("/".join(context_tags)),
+                        body="Created to accumulate context: {}".format(context_tags[0]),
+                        head=sdk_repo.owner.login+":"+sdk_pr_base,
+                        base=sdk_default_base,
+                    )
+                except Exception as err:
+                    _LOGGER.warning("Unable to create context PR: %s", err)
+                    return None
+            # The context branch might be empty until the SDK PR is merged into it
+            context_pr = api_operations.submit(get_context_pr, after=[sdk_pr_merged] if sdk_pr_merged else [])
+
+            def context_pr_labels():
+                if context_pr.result():
+                    manage_labels(sdk_repo.get_issue(context_pr.result().number), [SwaggerToSdkLabels.service_pr],
+                                  repo_labels=known_labels.get("repo_labels"))
+            api_operations.submit(context_pr_labels, after=[context_pr])
+
+            # Put a link into the SDK single PR
+            if sdk_pr_merged:
+                def comment_sdk_pr():
+                    if context_pr.result() and sdk_pr_merged.result():
+                        sdk_pr.create_issue_comment(
+                            "This PR has been merged into {}".format(context_pr.result().html_url)
+                        )
+                api_operations.submit(comment_sdk_pr, after=[context_pr])
+
+            # Update dashboard to talk about this PR, after the first dashboard message
+            def context_pr_dashboard():
+                if not context_pr.result():
+                    return
+                if sdk_pr.merged:
+                    msg = "The initial [PR]({}) has been merged into your service PR:\n{}".format(
+                        sdk_pr.html_url,
+                        context_pr.result().html_url
+                    )
+                else:
+                    msg = "A [PR]({}) has been created for you based on this PR content.\n\n".format(
+                        sdk_pr.html_url
+                    )
+                    msg += "Once this PR will be merged, content will be added to your service PR:\n{}".format(
+                        context_pr.result().html_url
+                    )
+                dashboard.create_comment(msg)
+            api_operations.submit(context_pr_dashboard, after=[context_pr, dashboard_done])
 
 def clean_sdk_pr(rest_pr, sdk_repo):
     """Look for the SDK pr created by this RestPR and wipe it.
@@ -257,6 +401,9 @@ def clean_sdk_pr(rest_pr, sdk_repo):
     else:
         sdk_pr_head = _SDK_PR_TEMPLATE.format(rest_pr.head.ref)
 
+    # Next generation of this branch must not reuse a previous result
+    GenerationLedger().invalidate(sdk_repo.full_name, sdk_pr_head)
+
     #
     # Close all PRs from this branch
     #
@@ -0,0 +1,177 @@
+"""Load with GitHub GraphQL what the REST PR management needs, instead of many REST calls.
+
+One query loads the files (100 per page) and the last commit of the RestAPI PR, that are otherwise
+fetched page by page several times per event. A second query loads the SDK PRs of the SDK branch and
+the labels, so that the SDK PR is not searched with a failing create, and label calls that would do
+nothing are skipped. Labels of the SDK repo are paginated; labels of a SDK PR are unknown (None) if it
+has more than one page of them, so that the label calls are done.
+
+This is optional, enabled if SWAGGER_TO_SDK_GRAPHQL is set. The fake GitHub serves these queries.
+"""
+from collections import namedtuple
+import logging
+
+import requests
+
+_LOGGER = logging.getLogger(__name__)
+
+# If set, use GraphQL snapshots in the REST PR management
+GRAPHQL_ENV = "SWAGGER_TO_SDK_GRAPHQL"
+
+PULL_REQUEST_QUERY = """
+query PullRequestSnapshot($owner: String!, $name: String!, $number: Int!, $filesCursor: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      files(first: 100, after: $filesCursor) {
+        nodes { path }
+        pageInfo { hasNextPage endCursor }
+      }
+      commits(last: 1) {
+        nodes { commit { oid message } }
+      }
+    }
+  }
+}
+"""
+
+SDK_QUERY = """
+query SdkSnapshot($owner: String!, $name: String!, $head: String!) {
+  repository(owner: $owner, name: $name) {
+    labels(first: 100) {
+      nodes { name }
+      pageInfo { hasNextPage endCursor }
+    }
+    pullRequests(headRefName: $head, first: 20, orderBy: {field: CREATED_AT, direction: DESC}) {
+      nodes {
+        number
+        state
+        baseRefName
+        headRepositoryOwner { login }
+        labels(first: 100) {
+          nodes { name }
+          pageInfo { hasNextPage }
+        }
+      }
+    }
+  }
+}
+"""
+
+LABELS_QUERY = """
+query SdkLabels($owner: String!, $name: String!, $labelsCursor: String) {
+  repository(owner: $owner, name: $name) {
+    labels(first: 100, after: $labelsCursor) {
+      nodes { name }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+
+SnapshotFile = namedtuple("SnapshotFile", ["filename"])
+SnapshotGitCommit = namedtuple("SnapshotGitCommit", ["sha", "message"])
+SnapshotCommit = namedtuple("SnapshotCommit", ["sha", "commit"])
+SnapshotPull = namedtuple("SnapshotPull", ["number", "state", "base_ref", "labels"])
+
+
+class GraphqlClient:
+    """Minimal GitHub GraphQL client."""
+    def __init__(self, gh_token, base_url="https://api.github.com"):
+        self.url = base_url.rstrip("/") + "/graphql"
+        self._session = requests.Session()
+        self._session.headers["Authorization"] = "bearer {}".format(gh_token)
+
+    def query(self, query, **variables):
+        """Execute this query and return its "data"."""
+        response = self._session.post(self.url, json={"query": query, "variables": variables})
+        response.raise_for_status()
+        result = response.json()
+        if result.get("errors"):
+            raise ValueError("GraphQL query failed: {}".format(result["errors"]))
+        return result["data"]
+
+
+class PullRequestSnapshot:
+    """A PyGithub PullRequest whose files and commits come from a GraphQL snapshot.
+
+    Everything else is the PyGithub object.
+    """
+    def __init__(self, pull, files, last_commit):
+        self._pull = pull
+        self._files = files
+        self._last_commit = last_commit
+
+    def __getattr__(self, name):
+        return getattr(self._pull, name)
+
+    def get_files(self):
+        return list(self._files)
+
+    def get_commits(self):
+        return [self._last_commit]
+
+
+class SdkSnapshot:
+    """Labels of the SDK repo and the SDK PRs of a branch."""
+    def __init__(self, labels, pulls):
+        self.labels = labels
+        self.pulls = pulls
+
+    def get_open_pull(self, base_ref):
+        """The open SDK PR to this base branch, or None."""
+        for pull in self.pulls:
+            if pull.state == "OPEN" and pull.base_ref == base_ref:
+                return pull
+        return None
+
+    def get_pull_labels(self, number):
+        """Labels of this SDK PR, or None if unknown (not in the snapshot, or too many labels)."""
+        for pull in self.pulls:
+            if pull.number == number:
+                return pull.labels
+        return None
+
+
+def load_pull_request_snapshot(client, pull):
+    """Wrap this PyGithub PullRequest in a PullRequestSnapshot."""
+    owner, name = pull.base.repo.full_name.split("/")
+    files = []
+    files_cursor = None
+    while True:
+        data = client.query(PULL_REQUEST_QUERY, owner=owner, name=name, number=pull.number, filesCursor=files_cursor)
+        pull_data = data["repository"]["pullRequest"]
+        files += [SnapshotFile(node["path"]) for node in pull_data["files"]["nodes"]]
+        if not pull_data["files"]["pageInfo"]["hasNextPage"]:
+            break
+        files_cursor = pull_data["files"]["pageInfo"]["endCursor"]
+    commit_data = pull_data["commits"]["nodes"][-1]["commit"]
+    last_commit = SnapshotCommit(commit_data["oid"], SnapshotGitCommit(commit_data["oid"], commit_data["message"]))
+    _LOGGER.info("GraphQL snapshot of PR %s: %d files", pull.number, len(files))
+    return PullRequestSnapshot(pull, files, last_commit)
+
+
+def load_sdk_snapshot(client, sdk_full_name, head_ref):
+    """SdkSnapshot of the PRs from this branch of the SDK repo."""
+    owner, name = sdk_full_name.split("/")
+    data = client.query(SDK_QUERY, owner=owner, name=name, head=head_ref)["repository"]
+    labels = {node["name"] for node in data["labels"]["nodes"]}
+    labels_page = data["labels"]["pageInfo"]
+    while labels_page["hasNextPage"]:
+        labels_data = client.query(
+            LABELS_QUERY, owner=owner, name=name, labelsCursor=labels_page["endCursor"]
+        )["repository"]["labels"]
+        labels |= {node["name"] for node in labels_data["nodes"]}
+        labels_page = labels_data["pageInfo"]
+    pulls = [
+        SnapshotPull(
+            node["number"],
+            node["state"],
+            node["baseRefName"],
+            # Truncated labels are not trusted
+            None if node["labels"]["pageInfo"]["hasNextPage"] else {label["name"] for label in node["labels"]["nodes"]}
+        )
+        for node in data["pullRequests"]["nodes"]
+        # Same branch name in a fork is not ours
+        if (node["headRepositoryOwner"] or {}).get("login") == owner
+    ]
+    return SdkSnapshot(labels, pulls)
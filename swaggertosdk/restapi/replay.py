@@ -0,0 +1,167 @@
+"""Replay recorded webhooks against the bot, to load-test it without GitHub.
+
+Webhooks are recorded by the bot itself if SWAGGER_TO_SDK_RECORD_WEBHOOKS is set to a file path.
+At replay, GitHub is a local fake (see fake_github.py) seeded from the payloads, and SDK generation
+is replaced by a sleep of the given duration, since it clones with git and not with the API.
+Only "pull_request" and "push" webhooks are replayed: bot commands use the bot framework,
+that always talks to api.github.com.
+
+Usage: python -m swaggertosdk.restapi.replay webhooks.jsonl --rate 10 --generation-time 2
+"""
+import argparse
+import json
+import logging
+import os
+import time
+import unittest.mock
+from urllib.parse import urlencode
+
+from . import app
+from . import github, github_handler
+from .fake_github import FakeGithubServer
+from .graphql_snapshot import GRAPHQL_ENV
+from .scheduler import JobStats, percentiles
+
+_LOGGER = logging.getLogger(__name__)
+
+# Events that can be replayed
+REPLAYED_EVENTS = ["pull_request", "push"]
+
+# Files of the PR, if the record does not provide them
+DEFAULT_PR_FILES = ["specification/replay/resource-manager/Microsoft.Replay/stable/2018-01-01/replay.json"]
+
+
+def load_records(record_path):
+    with open(record_path, "r", encoding="utf-8") as record_fd:
+        records = [json.loads(line) for line in record_fd if line.strip()]
+    replayed_records = [record for record in records if record["event"] in REPLAYED_EVENTS]
+    if len(replayed_records) != len(records):
+        _LOGGER.warning("Skipping %d webhooks that cannot be replayed", len(records) - len(replayed_records))
+    return replayed_records
+
+
+def seed_fake_github(fake_github, records):
+    """Add the repositories, PRs and commits of these webhooks to the fake GitHub."""
+    for record in records:
+        body = record["body"]
+        if "repository" not in body:
+            continue
+        fake_github.add_repository(body["repository"])
+        full_name = body["repository"]["full_name"]
+        files = record.get("files", DEFAULT_PR_FILES)
+        if "pull_request" in body:
+            fake_github.add_pull(full_name, dict(body["pull_request"]), files)
+        elif record["event"] == "push":
+            fake_github.add_commit(full_name, body["after"], files)
+
+
+def replay(records, rate=1., generation_time=0., graphql=False, sequential=False):
+    """Send these webhooks to the bot at "rate" webhooks per second, and wait for the end of the jobs.
+
+    :param bool graphql: Use GraphQL snapshots (see graphql_snapshot.py)
+    :param bool sequential: Wait for the jobs of a webhook before sending the next one. Nothing is
+     superseded and the API calls do not depend on timing.
+    :returns: A report dict
+    """
+    def generations_stub(git_object, targets, *args, **kwargs):
+        time.sleep(generation_time)
+        return [None for _ in targets]
+
+    job_stats = JobStats()
+    with FakeGithubServer() as server, \
+            unittest.mock.patch.dict(os.environ, {"GH_TOKEN": "replay", github.GITHUB_API_URL_ENV: server.base_url}), \
+            unittest.mock.patch.dict(os.environ, {GRAPHQL_ENV: "1"} if graphql else {}), \
+            unittest.mock.patch.object(github, "_JOB_STATS", job_stats), \
+            unittest.mock.patch.object(github, "generate_sdks_from_git_object", generations_stub), \
+            unittest.mock.patch.object(github_handler, "generate_sdks_from_git_object", generations_stub):
+        seed_fake_github(server.fake_github, records)
+        job_queue = github.get_job_queue()
+        superseded = job_queue.superseded
+        client = app.test_client()
+        webhook_durations = []
+        start_time = time.monotonic()
+        for index, record in enumerate(records):
+            time.sleep(max(0, start_time + index / rate - time.monotonic()))
+            sent_at = time.monotonic()
+            client.post(
+                record["path"] + "?" + urlencode(record["args"]),
+                json=record["body"],
+                headers={
+                    "X-GitHub-Event": record["event"],
+                    "X-GitHub-Delivery": record.get("delivery") or str(index),
+                }
+            )
+            webhook_durations.append(time.monotonic() - sent_at)
+            if sequential:
+                job_queue.join()
+        job_queue.join()
+        elapsed = time.monotonic() - start_time
+        api_calls = dict(server.fake_github.calls)
+
+    report = job_stats.as_dict()
+    report.update({
+        "webhooks": len(records),
+        "webhook_duration": percentiles(webhook_durations),
+        "superseded": job_queue.superseded - superseded,
+        "elapsed": elapsed,
+        "throughput": report["processed"] / elapsed if elapsed else 0,
+        "api_calls": api_calls,
+        "api_calls_total": sum(api_calls.values()),
+    })
+    return report
+
+
+def format_report(report):
+    """Human readable version of a replay report."""
+    def format_percentiles(values):
+        if not values:
+            return "n/a"
+        return "p50 {p50:.3f}s, p95 {p95:.3f}s, max {max:.3f}s".format(**values)
+
+    lines = [
+        "Webhooks sent: {}".format(report["webhooks"]),
+        "Jobs processed: {} ({} failed, {} superseded) in {:.1f}s, {:.2f} jobs/s".format(
+            report["processed"], report["failed"], report["superseded"], report["elapsed"], report["throughput"]
+        ),
+        "Webhook answer: " + format_percentiles(report["webhook_duration"]),
+        "Queue wait: " + format_percentiles(report["queue_wait"]),
+        "Job duration: " + format_percentiles(report["duration"]),
+        "End-to-end latency: " + format_percentiles(report["latency"]),
+        "GitHub API calls: {}".format(report["api_calls_total"]),
+    ]
+    for call, count in sorted(report["api_calls"].items(), key=lambda item: -item[1]):
+        lines.append("  {:5d} {}".format(count, call))
+    return "\n".join(lines)
+
+
+def replay_main():
+    """Main method"""
+    parser = argparse.ArgumentParser(
+        description='Replay recorded webhooks against the bot, with a fake GitHub.')
+    parser.add_argument('record_path',
+                        help='JSON lines file recorded with SWAGGER_TO_SDK_RECORD_WEBHOOKS.')
+    parser.add_argument('--rate',
+                        dest='rate', type=float, default=1.,
+                        help='Webhooks sent per second. [default: %(default)s]')
+    parser.add_argument('--generation-time',
+                        dest='generation_time', type=float, default=0.,
+                        help='Simulated duration of one SDK generation, in seconds. [default: %(default)s]')
+    parser.add_argument('--graphql',
+                        dest='graphql', action='store_true',
+                        help='Use GraphQL snapshots instead of some REST calls.')
+    parser.add_argument('--sequential',
+                        dest='sequential', action='store_true',
+                        help='Wait for the jobs of a webhook before sending the next one.')
+    parser.add_argument("-v", "--verbose",
+                        dest="verbose", action="store_true",
+                        help="Verbosity in INFO mode")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    report = replay(load_records(args.record_path), args.rate, args.generation_time, args.graphql, args.sequential)
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    replay_main()
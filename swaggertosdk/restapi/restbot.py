@@ -4,6 +4,7 @@ import logging
 from github import Github
 
 from azure_devtools.ci_tools.bot_framework import order
+from ..SwaggerToSdkNewCLI import format_plan
 from .github_handler import rest_pr_management, clean_sdk_pr
 
 _LOGGER = logging.getLogger("swaggertosdk.restapi.restbot")
@@ -52,3 +53,29 @@ class RestAPIRepoHandler:
 
         clean_sdk_pr(rest_pr, sdk_repo)
         return self.rebuild(issue, repotag)
+
+    @order
+    def plan(self, issue, repotag=None):
+        if not issue.pull_request:
+            return "Plan makes no sense if not a PR"
+        if repotag and self.repotag != repotag:
+            _LOGGER.info("Skipping plan from bot, since repotag doesn't match: %s %s",
+                         self.repotag,
+                         repotag)
+            return # Do NOT return a string, I don't want to talk in the PR
+
+        rest_pr = issue.repository.get_pull(issue.number)
+        github_con = Github(self.gh_token)
+        sdk_repo = github_con.get_repo(self.sdkid)
+
+        generation_plan = rest_pr_management(
+            rest_pr,
+            sdk_repo,
+            repotag or self.repotag,
+            self.sdk_default_base,
+            plan=True
+        )
+        return "Generation plan for {}:\n```\n{}\n```".format(
+            repotag or self.repotag,
+            format_plan(generation_plan)
+        )
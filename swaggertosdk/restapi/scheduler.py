@@ -0,0 +1,392 @@
+"""Scheduling of the jobs received by the REST bot webhook.
+
+One server can serve several SDK repos (tenants, identified by sdkid). Tenants share the workers
+fairly: the next tenant served is the one that got the least service relative to its weight,
+and a tenant never runs more than its cap of jobs at once.
+
+Inside a tenant, jobs are served by priority (merged/closed PRs and bot commands first, then opened
+PRs, then synchronized PRs and pushes on RestAPI branches), with aging so that a low priority job
+cannot wait forever.
+
+A new event on a PR supersedes the older jobs of this PR: queued ones are dropped, and running
+ones are cancelled using their CancellationToken.
+
+When the GitHub API quota is low, jobs that cannot be afforded are deferred until the quota resets,
+instead of failing halfway after the generation. A share of the quota is kept for urgent jobs.
+"""
+from collections import namedtuple, defaultdict, deque
+import logging
+import os
+from threading import Condition, Lock
+import time
+
+from ..autorest_tools import CancellationToken
+
+_LOGGER = logging.getLogger(__name__)
+
+# Priorities, lower is served first
+PRIORITY_URGENT = 0  # Merged/closed PR (auto-merge of context PRs), and bot commands
+PRIORITY_OPENED = 1
+PRIORITY_SYNC = 2
+
+# A job gains one priority level each time it waits this long, in seconds
+AGING_SECONDS = 300
+
+# Tenant weights, i.e. "Azure/azure-sdk-for-java=2,Azure/azure-sdk-for-go=1". Default weight is 1.
+TENANT_WEIGHTS_ENV = "SWAGGER_TO_SDK_TENANT_WEIGHTS"
+# Max jobs running at once for one tenant. Default is no limit.
+TENANT_MAX_RUNNING_ENV = "SWAGGER_TO_SDK_TENANT_MAX_RUNNING"
+
+# Share of the GitHub API quota kept for urgent jobs, between 0 and 1
+RATE_RESERVE_ENV = "SWAGGER_TO_SDK_RATE_RESERVE"
+_DEFAULT_RATE_RESERVE = 0.2
+
+# Estimated GitHub API calls of one job, by event type (see the replay benchmark)
+JOB_API_COSTS = {
+    "pull_request": 30,
+    "issue_comment": 15,
+    "issues": 10,
+    "push": 10,
+}
+_DEFAULT_JOB_API_COST = 20
+
+# Max seconds a scheduler waits before checking again the deferred jobs
+_DEFERRED_POLL_SECONDS = 60
+
+Job = namedtuple("Job", ["event_type", "body", "sdkid", "sdkbase", "sdk_tag", "priority", "enqueued_at", "cancel_token"])
+
+
+def get_priority(event_type, body):
+    """Priority of this webhook."""
+    if event_type in ["issue_comment", "issues"]:
+        return PRIORITY_URGENT
+    action = body.get("action")
+    if action == "closed":
+        return PRIORITY_URGENT
+    if action in ["opened", "reopened"]:
+        return PRIORITY_OPENED
+    return PRIORITY_SYNC
+
+
+def create_job(event_type, body, sdkid, sdkbase, sdk_tag):
+    return Job(event_type, body, sdkid, sdkbase, sdk_tag, get_priority(event_type, body), time.monotonic(), CancellationToken())
+
+
+def generates(job):
+    """True if this job runs the generation of its PR (see rest_handle_action).
+
+    Other PR actions (labeled, edited, etc.) do nothing, like synchronize events with no new commit
+    or on a branch of the RestAPI repo (handled by the "push" event).
+    """
+    if job.event_type != "pull_request":
+        return False
+    action = job.body.get("action")
+    if action in ["opened", "reopened", "closed"]:
+        return True
+    if action != "synchronize" or job.body.get("before") == job.body.get("after"):
+        return False
+    head_repo = job.body.get("pull_request", {}).get("head", {}).get("repo")
+    # Deleted fork is still a fork
+    return head_repo is None or head_repo.get("full_name") != job.body.get("repository", {}).get("full_name")
+
+
+def supersedes(new_job, old_job):
+    """True if new_job makes old_job useless: a newer generation of the same PR, for the same SDK.
+
+    A "closed" job is never superseded, since it merges the context PRs.
+    """
+    if old_job.body.get("action") == "closed" or not generates(new_job):
+        return False
+    new_pr = _get_pull_request_key(new_job)
+    return new_pr is not None and new_pr == _get_pull_request_key(old_job)
+
+
+def _get_pull_request_key(job):
+    """(sdkid, RestAPI repo, PR number) of a pull_request job, or None."""
+    if job.event_type != "pull_request" or "repository" not in job.body or "number" not in job.body:
+        return None
+    return (job.sdkid, job.body["repository"]["full_name"], job.body["number"])
+
+
+def estimate_api_cost(job):
+    """Estimated GitHub API calls to run this job."""
+    return JOB_API_COSTS.get(job.event_type, _DEFAULT_JOB_API_COST)
+
+
+class RateBudget:
+    """Remaining GitHub API quota, fed by the rate limit headers of the GitHub client responses.
+
+    The quota is unknown until the first update, and every job can run.
+    """
+    def __init__(self, reserve=None):
+        if reserve is None:
+            reserve = float(os.environ.get(RATE_RESERVE_ENV, _DEFAULT_RATE_RESERVE))
+        self.reserve = reserve
+        self._lock = Lock()
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+
+    def update(self, remaining, limit, reset_at):
+        """:param float reset_at: Unix timestamp of the quota reset"""
+        with self._lock:
+            self.remaining, self.limit, self.reset_at = remaining, limit, reset_at
+
+    def update_from_client(self, github_client):
+        """Update from the last response of this PyGithub client."""
+        remaining, limit = github_client.rate_limiting
+        if limit > 0:
+            self.update(remaining, limit, github_client.rate_limiting_resettime)
+
+    def get_remaining(self, now=None):
+        """Remaining calls, None if unknown."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.remaining is None:
+                return None
+            if now >= self.reset_at:
+                return self.limit
+            return self.remaining
+
+    def can_run(self, job, now=None):
+        """True if there is enough quota for this job. Only urgent jobs can use the reserve."""
+        remaining = self.get_remaining(now)
+        if remaining is None:
+            return True
+        reserve = 0 if job.priority == PRIORITY_URGENT else self.reserve * self.limit
+        return remaining - estimate_api_cost(job) >= reserve
+
+    def spend(self, job):
+        """Book the estimated cost of a job starting, until the next update."""
+        with self._lock:
+            if self.remaining is None:
+                return
+            if time.time() >= self.reset_at:
+                # Quota has been reset, the next update gives the new reset time
+                self.remaining, self.reset_at = self.limit, float("inf")
+            self.remaining -= estimate_api_cost(job)
+
+    def as_dict(self):
+        remaining = self.get_remaining()
+        with self._lock:
+            reset_in = None
+            if self.reset_at is not None and self.reset_at != float("inf"):
+                reset_in = max(0, self.reset_at - time.time())
+            return {"remaining": remaining, "limit": self.limit, "reset_in": reset_in}
+
+
+def effective_priority(job, now):
+    """Priority of this job, once aging is applied."""
+    return job.priority - (now - job.enqueued_at) / AGING_SECONDS
+
+
+def parse_tenant_weights(weights_string):
+    """Parse "sdkid=weight,sdkid=weight"."""
+    weights = {}
+    for tenant_weight in (weights_string or "").split(","):
+        if not tenant_weight.strip():
+            continue
+        sdkid, weight = tenant_weight.rsplit("=", 1)
+        weights[sdkid.strip()] = float(weight)
+    return weights
+
+
+def select_job(jobs, now, running=None, served=None, weights=None, max_running=None, rate_budget=None):
+    """Index in jobs of the next job to run, or None if no job can run.
+
+    :param dict running: sdkid -> number of jobs running
+    :param dict served: sdkid -> service already received (see JobScheduler)
+    :param dict weights: sdkid -> weight, default 1
+    :param int max_running: max jobs running at once for one tenant, None for no limit
+    :param RateBudget rate_budget: if given, jobs that cannot be afforded are deferred
+
+    A tenant at its cap is not eligible. Among eligible tenants, the one with the least
+    served/weight is chosen. Inside a tenant, lowest effective priority first, then oldest.
+    """
+    running = running or {}
+    served = served or {}
+    weights = weights or {}
+
+    best_jobs = {}
+    for index, job in enumerate(jobs):
+        if max_running is not None and running.get(job.sdkid, 0) >= max_running:
+            continue
+        if rate_budget is not None and not rate_budget.can_run(job):
+            continue
+        job_key = (effective_priority(job, now), job.enqueued_at)
+        if job.sdkid not in best_jobs or job_key < best_jobs[job.sdkid][0]:
+            best_jobs[job.sdkid] = (job_key, index)
+    if not best_jobs:
+        return None
+    sdkid = min(
+        best_jobs,
+        key=lambda tenant: (served.get(tenant, 0) / weights.get(tenant, 1), best_jobs[tenant][0])
+    )
+    return best_jobs[sdkid][1]
+
+
+class JobScheduler:
+    """A thread-safe queue of Job, with the same API as queue.Queue, served with select_job.
+
+    task_done takes the job, to release the tenant slot.
+    put drops the queued jobs superseded by the new job (the new job keeps their priority and age),
+    and cancels the running ones.
+    """
+    def __init__(self, maxsize=0, weights=None, max_running=None, rate_budget=None):
+        self.maxsize = maxsize
+        if weights is None:
+            weights = parse_tenant_weights(os.environ.get(TENANT_WEIGHTS_ENV))
+        self.weights = weights
+        if max_running is None and os.environ.get(TENANT_MAX_RUNNING_ENV):
+            max_running = int(os.environ[TENANT_MAX_RUNNING_ENV])
+        self.max_running = max_running
+        self.rate_budget = rate_budget
+        self._jobs = []
+        self._running_jobs = []
+        self._running = defaultdict(int)
+        self.superseded = 0
+        self._served = {}
+        self._unfinished_tasks = 0
+        self._condition = Condition()
+
+    def qsize(self):
+        with self._condition:
+            return len(self._jobs)
+
+    def put(self, job):
+        """Add a job, block while the scheduler is full."""
+        with self._condition:
+            while self.maxsize > 0 and len(self._jobs) >= self.maxsize:
+                self._condition.wait()
+            if not self._is_active(job.sdkid):
+                # An idle tenant does not bank service: start from the least served active tenant
+                active_served = [
+                    served / self.weights.get(sdkid, 1) for sdkid, served in self._served.items()
+                    if self._is_active(sdkid)
+                ]
+                self._served[job.sdkid] = min(active_served, default=0) * self.weights.get(job.sdkid, 1)
+            job = self._supersede(job)
+            self._jobs.append(job)
+            self._unfinished_tasks += 1
+            self._condition.notify_all()
+
+    def _supersede(self, job):
+        """Drop or cancel the jobs superseded by this one, return the job to queue."""
+        for running_job in self._running_jobs:
+            if supersedes(job, running_job) and not running_job.cancel_token.is_cancelled():
+                _LOGGER.info("Cancel running %s job of PR %s", running_job.body.get("action"), running_job.body["number"])
+                running_job.cancel_token.cancel()
+                self.superseded += 1
+        superseded_jobs = [queued_job for queued_job in self._jobs if supersedes(job, queued_job)]
+        if superseded_jobs:
+            _LOGGER.info("Drop %d queued job(s) of PR %s", len(superseded_jobs), job.body["number"])
+            self._jobs = [queued_job for queued_job in self._jobs if not supersedes(job, queued_job)]
+            self._unfinished_tasks -= len(superseded_jobs)
+            self.superseded += len(superseded_jobs)
+            job = job._replace(
+                priority=min([job.priority] + [old_job.priority for old_job in superseded_jobs]),
+                enqueued_at=min([job.enqueued_at] + [old_job.enqueued_at for old_job in superseded_jobs]),
+            )
+        return job
+
+    def _is_active(self, sdkid):
+        return self._running[sdkid] > 0 or any(job.sdkid == sdkid for job in self._jobs)
+
+    def get(self):
+        """Remove and return the next job, block while there is none that can run."""
+        with self._condition:
+            while True:
+                index = select_job(self._jobs, time.monotonic(), self._running, self._served, self.weights, self.max_running, self.rate_budget)
+                if index is not None:
+                    break
+                # Deferred jobs become eligible when the quota resets, without notification
+                self._condition.wait(_DEFERRED_POLL_SECONDS if self.rate_budget and self._jobs else None)
+            job = self._jobs.pop(index)
+            if self.rate_budget:
+                self.rate_budget.spend(job)
+            self._running_jobs.append(job)
+            self._running[job.sdkid] += 1
+            self._served[job.sdkid] = self._served.get(job.sdkid, 0) + 1
+            self._condition.notify_all()
+            return job
+
+    def task_done(self, job):
+        with self._condition:
+            self._unfinished_tasks -= 1
+            if self._unfinished_tasks < 0:
+                raise ValueError('task_done() called too many times')
+            self._running[job.sdkid] -= 1
+            self._running_jobs.remove(job)
+            self._condition.notify_all()
+
+    def join(self):
+        """Block until every job has been got and processed."""
+        with self._condition:
+            while self._unfinished_tasks:
+                self._condition.wait()
+
+    def tenants_status(self):
+        """sdkid -> queued and running jobs."""
+        with self._condition:
+            status = defaultdict(lambda: {"queued": 0, "running": 0})
+            for job in self._jobs:
+                status[job.sdkid]["queued"] += 1
+            for sdkid, running in self._running.items():
+                if running:
+                    status[sdkid]["running"] = running
+            return dict(status)
+
+
+def percentiles(values):
+    """p50, p95 and max of these durations, empty dict if none."""
+    if not values:
+        return {}
+    values = sorted(values)
+    return {
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+        "max": values[-1],
+    }
+
+
+class JobStats:
+    """Timing of the jobs: queue wait, processing duration and latency of the last ones, per tenant too."""
+    def __init__(self, size=1000, per_tenant=True):
+        self._lock = Lock()
+        self._size = size
+        self.started_at = time.monotonic()
+        self.processed = 0
+        self.failed = 0
+        self.queue_waits = deque(maxlen=size)
+        self.durations = deque(maxlen=size)
+        self.latencies = deque(maxlen=size)
+        self.tenants = {} if per_tenant else None
+
+    def record(self, queue_wait, duration, success=True, sdkid=None):
+        with self._lock:
+            self.processed += 1
+            if not success:
+                self.failed += 1
+            self.queue_waits.append(queue_wait)
+            self.durations.append(duration)
+            self.latencies.append(queue_wait + duration)
+            if sdkid and self.tenants is not None:
+                tenant_stats = self.tenants.setdefault(sdkid, JobStats(self._size, per_tenant=False))
+        if sdkid and self.tenants is not None:
+            tenant_stats.record(queue_wait, duration, success)
+
+    def as_dict(self):
+        with self._lock:
+            uptime = time.monotonic() - self.started_at
+            result = {
+                "processed": self.processed,
+                "failed": self.failed,
+                "throughput_per_hour": self.processed * 3600 / uptime if uptime else 0,
+                "queue_wait": percentiles(self.queue_waits),
+                "duration": percentiles(self.durations),
+                "latency": percentiles(self.latencies),
+            }
+            tenants = dict(self.tenants or {})
+        if self.tenants is not None:
+            result["tenants"] = {sdkid: stats.as_dict() for sdkid, stats in tenants.items()}
+        return result
@@ -1,24 +1,23 @@
 import logging
 import os
-from pathlib import Path
 import tempfile
 
-from git import Repo
+from git import Repo, GitCommandError
+from github import GithubException
 
 from swaggertosdk.SwaggerToSdkCore import (
     CONFIG_FILE,
     read_config_from_github,
     build_swaggertosdk_conf_from_json_readme,
 )
-from azure_devtools.ci_tools.git_tools import (
-    do_commit,
-)
 from azure_devtools.ci_tools.github_tools import (
     configure_user,
-    manage_git_folder,
     GithubLink
 )
 from swaggertosdk.python_sdk_tools import build_installation_message
+from swaggertosdk.SwaggerToSdkNewCLI import do_scoped_commit, push_branches
+from swaggertosdk.branch_locks import BranchLockManager
+from swaggertosdk.workspace_pool import get_workspace_pool
 from azure_devtools.ci_tools.bot_framework import (
     order
 )
@@ -52,16 +51,32 @@ class GithubHandler:
         upstream_url = 'https://github.com/{}.git'.format(pr.base.repo.full_name)
         upstream_base = pr.base.ref if not branch else branch
 
-        with tempfile.TemporaryDirectory() as temp_dir, \
-                manage_git_folder(self.gh_token, Path(temp_dir) / Path("sdk"), branched_sdk_id) as sdk_folder:
+        # Fast path: ask Github first if there is something to rebase
+        try:
+            comparison = pr.base.repo.compare(
+                upstream_base,
+                "{}:{}".format(pr.head.repo.owner.login, branch_name)
+            )
+            if comparison.behind_by == 0:
+                return "Nothing to rebase, this branch is already based on {}".format(upstream_base)
+        except GithubException as err:
+            _LOGGER.info("Unable to compare branches, do the rebase anyway: %s", err)
+
+        with BranchLockManager().lock(pr.head.repo.full_name, [branch_name]), \
+                get_workspace_pool().lease(self.gh_token, branched_sdk_id) as sdk_folder:
 
             sdk_repo = Repo(str(sdk_folder))
             configure_user(self.gh_token, sdk_repo)
 
             upstream = sdk_repo.create_remote('upstream', url=upstream_url)
-            upstream.fetch()
-
-            msg = sdk_repo.git.rebase('upstream/{}'.format(upstream_base))
+            upstream.fetch(upstream_base)  # Workspace is warm, only the base branch is needed
+
+            try:
+                msg = sdk_repo.git.rebase('upstream/{}'.format(upstream_base))
+            except GitCommandError:
+                # Leave the workspace clean for the next command
+                sdk_repo.git.rebase('--abort')
+                raise
             _LOGGER.debug(msg)
             msg = sdk_repo.git.push(force=True)
             _LOGGER.debug(msg)
@@ -78,8 +93,8 @@ class GithubHandler:
         branch_name = pr_obj.head.ref
         branched_sdk_id = pr_obj.head.repo.full_name+'@'+branch_name
 
-        with tempfile.TemporaryDirectory() as temp_dir, \
-                manage_git_folder(self.gh_token, Path(temp_dir) / Path("sdk"), branched_sdk_id) as sdk_folder:
+        with BranchLockManager().lock(pr_obj.head.repo.full_name, [branch_name]), \
+                get_workspace_pool().lease(self.gh_token, branched_sdk_id) as sdk_folder:
 
             sdk_repo = Repo(str(sdk_folder))
             configure_user(self.gh_token, sdk_repo)
@@ -124,9 +139,11 @@ class GithubHandler:
 
         config = read_config_from_github(pr.head.repo.full_name, branch_name, token)
 
-        with tempfile.TemporaryDirectory() as temp_dir, \
-                manage_git_folder(token, Path(temp_dir) / Path("rest"), branched_rest_api_id) as restapi_git_folder, \
-                manage_git_folder(self.gh_token, Path(temp_dir) / Path("sdk"), branched_sdk_id) as sdk_folder:
+        workspace_pool = get_workspace_pool()
+        with BranchLockManager().lock(pr.head.repo.full_name, [branch_name]), \
+                tempfile.TemporaryDirectory() as temp_dir, \
+                workspace_pool.lease(token, branched_rest_api_id) as restapi_git_folder, \
+                workspace_pool.lease(self.gh_token, branched_sdk_id) as sdk_folder:
 
             sdk_repo = Repo(str(sdk_folder))
             configure_user(self.gh_token, sdk_repo)
@@ -143,13 +160,13 @@ class GithubHandler:
                     return False
 
             from swaggertosdk import SwaggerToSdkNewCLI
-            SwaggerToSdkNewCLI.build_libraries(config, skip_callback, restapi_git_folder,
-                                               sdk_repo, temp_dir, autorest_bin)
+            written_paths = SwaggerToSdkNewCLI.build_libraries(config, skip_callback, restapi_git_folder,
+                                                               sdk_repo, temp_dir, autorest_bin)
             new_comment.edit("End of generation, doing commit")
-            commit_sha = do_commit(sdk_repo, message, branch_name, "")
+            commit_sha = do_scoped_commit(sdk_repo, message, branch_name, "", written_paths)
             if commit_sha:
                 new_comment.edit("Pushing")
-                sdk_repo.git.push('origin', branch_name, set_upstream=True)
+                push_branches(sdk_repo, [branch_name])
                 new_comment.delete()
             else:
                 new_comment.delete()
@@ -0,0 +1,69 @@
+"""Worker process, consuming the jobs queued by the webhook server in a shared broker (see broker.py).
+
+Usage: python -m swaggertosdk worker --broker /shared/jobs.sqlite --threads 2
+
+Add worker processes (or replicas) to scale the generation, the webhook server is not impacted.
+"""
+import argparse
+import json
+import logging
+import os
+from threading import Thread
+import time
+
+from . import github
+from .broker import BROKER_ENV, SqliteBroker
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds between two logs of the job stats
+STATS_LOG_SECONDS = 600
+
+
+def start_worker_threads(broker, threads):
+    """Start "threads" daemon threads consuming this broker, and return them."""
+    worker_threads = []
+    for index in range(threads):
+        worker_thread = Thread(
+            target=github.consume,
+            args=(broker,),
+            name="WorkerThread-{}".format(index),
+            daemon=True
+        )
+        worker_thread.start()
+        worker_threads.append(worker_thread)
+    return worker_threads
+
+
+def worker_main(argv=None):
+    """Main method"""
+    parser = argparse.ArgumentParser(
+        prog='python -m swaggertosdk worker',
+        description='Consume the jobs queued by the webhook server in the shared broker.')
+    parser.add_argument('--broker',
+                        dest='broker', default=os.environ.get(BROKER_ENV),
+                        help='SQLite file of the broker. [default: ${}]'.format(BROKER_ENV))
+    parser.add_argument('--threads',
+                        dest='threads', type=int, default=int(os.environ.get(github.WORKERS_ENV, 1)),
+                        help='Jobs run at once by this worker. [default: ${} or 1]'.format(github.WORKERS_ENV))
+    parser.add_argument("-v", "--verbose",
+                        dest="verbose", action="store_true",
+                        help="Verbosity in INFO mode")
+    parser.add_argument("--debug",
+                        dest="debug", action="store_true",
+                        help="Verbosity in DEBUG mode")
+
+    args = parser.parse_args(argv)
+    if not args.broker:
+        parser.error("--broker or {} is required".format(BROKER_ENV))
+
+    main_logger = logging.getLogger()
+    logging.basicConfig()
+    main_logger.setLevel(logging.DEBUG if args.debug else logging.INFO if args.verbose else logging.WARNING)
+
+    broker = SqliteBroker(args.broker, rate_budget=github.get_rate_budget())
+    _LOGGER.info("Worker %s consuming %s with %d thread(s)", broker.worker_id, args.broker, args.threads)
+    worker_threads = start_worker_threads(broker, args.threads)
+    while all(worker_thread.is_alive() for worker_thread in worker_threads):
+        time.sleep(STATS_LOG_SECONDS)
+        _LOGGER.info("Job stats: %s", json.dumps(github.get_job_stats().as_dict()))
@@ -0,0 +1,341 @@
+"""Dependency graph of the Swagger files of a RestAPI repo, based on "$ref".
+
+Used to know precisely which Readme (and which tag in this Readme) is impacted
+by a change in a Swagger file, including shared files like common-types.
+"""
+from collections import defaultdict
+import json
+import logging
+import os
+from pathlib import Path, PurePosixPath
+import re
+from threading import Lock
+
+from git import Repo, InvalidGitRepositoryError, NoSuchPathError, GitCommandError
+
+from .SwaggerToSdkCore import (
+    get_cache_dir,
+    get_readme_files_from_file_list,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+# External part of a "$ref": "../common/types.json#/definitions/Resource" gives "../common/types.json"
+_REF_REGEX = re.compile(rb'"\$ref"\s*:\s*"([^"#]+)')
+
+_YAML_BLOCK_REGEX = re.compile(r"^```\s*yaml(.*?)$(.*?)^```", re.M | re.S)
+_TAG_CONDITION_REGEX = re.compile(r"\$\(tag\)\s*==\s*['\"]([^'\"]+)['\"]")
+_INPUT_FILE_REGEX = re.compile(r"^input-file\s*:\s*(.*)$")
+_DEFAULT_TAG_REGEX = re.compile(r"^tag\s*:\s*['\"]?([^'\"\s]+)", re.M)
+_THIS_FOLDER = "$(this-folder)/"
+_README_REGEX = re.compile(r"readme.\w*.?md", re.I)
+# A YAML key that chooses the tag(s) to generate
+_TAG_SETTING_REGEX = re.compile(r"^\s*(?:tag|batch)\s*:", re.M)
+
+_CACHE_LOCK = Lock()
+
+
+def _clean_yaml_value(value):
+    value = value.split(" #")[0].strip().strip("'\"")
+    if value.startswith(_THIS_FOLDER):
+        value = value[len(_THIS_FOLDER):]
+    return value
+
+
+def _parse_input_files(yaml_content):
+    """Extract the input-file list of a YAML block, without a YAML parser."""
+    input_files = []
+    in_input_file = False
+    for line in yaml_content.splitlines():
+        stripped_line = line.strip()
+        match = _INPUT_FILE_REGEX.match(stripped_line)
+        if match:
+            in_input_file = True
+            value = match.group(1).strip()
+            if value.startswith("["):  # Flow style: input-file: [a.json, b.json]
+                input_files += [_clean_yaml_value(v) for v in value.strip("[]").split(",") if v.strip()]
+                in_input_file = False
+            elif value:
+                input_files.append(_clean_yaml_value(value))
+                in_input_file = False
+        elif in_input_file and stripped_line.startswith("-"):
+            input_files.append(_clean_yaml_value(stripped_line[1:]))
+        elif in_input_file and stripped_line and not stripped_line.startswith("#"):
+            in_input_file = False
+    return input_files
+
+
+def get_readme_tags(readme_path):
+    """Parse a Readme and return the default tag and the input files of each tag.
+
+    Input files of YAML blocks without condition are stored with the tag None, and apply to
+    every tag. YAML blocks with a condition that is not about tag (i.e. language) are ignored.
+
+    :returns: A tuple (default tag or None, dict tag -> list of input files relative to the Readme folder)
+    """
+    content = Path(readme_path).read_text(encoding="utf-8", errors="replace")
+    default_tag = None
+    tags = defaultdict(list)
+    for condition, yaml_content in _YAML_BLOCK_REGEX.findall(content):
+        condition = condition.strip()
+        if not condition:
+            match = _DEFAULT_TAG_REGEX.search(yaml_content)
+            if match and default_tag is None:
+                default_tag = match.group(1)
+            tags[None] += _parse_input_files(yaml_content)
+            continue
+        for tag in _TAG_CONDITION_REGEX.findall(condition):
+            tags[tag] += _parse_input_files(yaml_content)
+    return default_tag, dict(tags)
+
+
+def is_default_tag_conditional(readme_path):
+    """True if the tag used without explicit tag might not be the default tag of this Readme.
+
+    This is the case if a "batch" is defined, or if a tag or a batch is set in a YAML block with a
+    condition that is not about tag (i.e. $(python)), or in a language Readme of the same folder.
+    """
+    readme_path = Path(readme_path)
+    for condition, yaml_content in _YAML_BLOCK_REGEX.findall(readme_path.read_text(encoding="utf-8", errors="replace")):
+        if re.search(r"^\s*batch\s*:", yaml_content, re.M):
+            return True
+        if condition.strip() and not _TAG_CONDITION_REGEX.search(condition) and _TAG_SETTING_REGEX.search(yaml_content):
+            return True
+    for other_readme in readme_path.parent.iterdir():
+        if other_readme == readme_path or not other_readme.is_file() or not _README_REGEX.match(other_readme.name):
+            continue
+        if _TAG_SETTING_REGEX.search(other_readme.read_text(encoding="utf-8", errors="replace")):
+            return True
+    return False
+
+
+def get_tag_input_files(readme_path, tag, base_dir=Path('.')):
+    """Input files of this tag (default tag if None), as Paths relative to base_dir.
+
+    Returns None if the tag cannot be solved, or if the default tag depends on the language.
+    """
+    default_tag, tags = get_readme_tags(Path(base_dir, readme_path))
+    if tag is None and is_default_tag_conditional(Path(base_dir, readme_path)):
+        return None
+    tag = tag or default_tag
+    if tag is None or tag not in tags:
+        return None
+    readme_folder = PurePosixPath(Path(readme_path).as_posix()).parent
+    return {
+        Path(_normalize(readme_folder / input_file))
+        for input_file in tags.get(None, []) + tags[tag]
+    }
+
+
+def _normalize(posix_path):
+    return PurePosixPath(os.path.normpath(str(posix_path)).replace(os.path.sep, "/"))
+
+
+def _get_blob_shas(base_dir):
+    """Map relative path -> git blob SHA of the JSON files in the specification folder.
+
+    Empty if base_dir is not a git repo.
+    """
+    try:
+        repo = Repo(str(base_dir))
+        output = repo.git.ls_files("-s", "--", "specification")
+    except (InvalidGitRepositoryError, NoSuchPathError, GitCommandError):
+        return {}
+    blob_shas = {}
+    for line in output.splitlines():
+        # <mode> <sha> <stage>\t<path>
+        metadata, path = line.split("\t", 1)
+        if path.endswith(".json"):
+            blob_shas[path] = metadata.split()[1]
+    # ls-files knows the content in the index, not local changes
+    modified = set(repo.git.diff("--name-only", "--", "specification").splitlines())
+    return {path: sha for path, sha in blob_shas.items() if path not in modified}
+
+
+class SwaggerGraph:
+    """The "$ref" graph of the Swagger files of a RestAPI folder.
+
+    Refs of each file are cached by git blob SHA, so a file is scanned only once whatever the clone.
+    The cache keeps only the blobs of the last tree built, so it does not grow with the history.
+    """
+    def __init__(self, base_dir, cache_path=None):
+        self.base_dir = Path(base_dir)
+        self.cache_path = Path(cache_path or get_cache_dir() / "swagger_refs.json")
+        self.refs = {}  # Relative posix path -> set of relative posix paths
+        self.referenced_by = defaultdict(set)
+        self._readme_inputs = None
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, 'r') as cache_fd:
+                return json.load(cache_fd)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache):
+        with _CACHE_LOCK:
+            temp_path = self.cache_path.with_suffix(".{}.tmp".format(os.getpid()))
+            with open(temp_path, 'w') as cache_fd:
+                json.dump(cache, cache_fd)
+            temp_path.replace(self.cache_path)
+
+    @staticmethod
+    def scan_refs(file_path):
+        """External refs of this JSON file, as written in the file."""
+        with open(file_path, 'rb') as file_fd:
+            content = file_fd.read()
+        return sorted({ref.decode("utf-8", errors="replace") for ref in _REF_REGEX.findall(content)})
+
+    def build(self):
+        blob_shas = _get_blob_shas(self.base_dir)
+        cache = self._load_cache()
+        cache_updated = False
+        used_shas = set()
+        for file_path in Path(self.base_dir, "specification").rglob("*.json"):
+            relative_path = PurePosixPath(file_path.relative_to(self.base_dir).as_posix())
+            if "examples" in relative_path.parts:
+                continue  # Examples are not part of the SDK
+            blob_sha = blob_shas.get(str(relative_path))
+            if blob_sha:
+                used_shas.add(blob_sha)
+            if blob_sha and blob_sha in cache:
+                raw_refs = cache[blob_sha]
+            else:
+                raw_refs = self.scan_refs(file_path)
+                if blob_sha:
+                    cache[blob_sha] = raw_refs
+                    cache_updated = True
+            refs = {_normalize(relative_path.parent / raw_ref) for raw_ref in raw_refs if not raw_ref.startswith("http")}
+            self.refs[relative_path] = refs
+            for ref in refs:
+                self.referenced_by[ref].add(relative_path)
+        if used_shas and (cache_updated or len(used_shas) != len(cache)):
+            # Blobs no longer in the tree are dropped
+            self._save_cache({blob_sha: cache[blob_sha] for blob_sha in used_shas})
+        _LOGGER.info("Swagger graph built with %d files", len(self.refs))
+        return self
+
+    def closure(self, files):
+        """All the files these files depend on, including themselves."""
+        result = set()
+        to_visit = [PurePosixPath(Path(f).as_posix()) for f in files]
+        while to_visit:
+            current = to_visit.pop()
+            if current in result:
+                continue
+            result.add(current)
+            to_visit += self.refs.get(current, [])
+        return result
+
+    def dependents(self, files):
+        """All the files that depend on these files, including themselves."""
+        result = set()
+        to_visit = [PurePosixPath(Path(f).as_posix()) for f in files]
+        while to_visit:
+            current = to_visit.pop()
+            if current in result:
+                continue
+            result.add(current)
+            to_visit += self.referenced_by.get(current, [])
+        return result
+
+    def _get_readme_inputs(self):
+        """Input files of each tag of each Readme, parsed once."""
+        if self._readme_inputs is None:
+            self._readme_inputs = {}
+            for readme_path in Path(self.base_dir, "specification").rglob("*.md"):
+                if readme_path.name.lower() != "readme.md":
+                    continue
+                relative_readme = readme_path.relative_to(self.base_dir)
+                readme_folder = PurePosixPath(relative_readme.as_posix()).parent
+                try:
+                    _, tags = get_readme_tags(readme_path)
+                except OSError:
+                    continue
+                self._readme_inputs[relative_readme] = {
+                    tag: {_normalize(readme_folder / input_file) for input_file in input_files}
+                    for tag, input_files in tags.items()
+                }
+        return self._readme_inputs
+
+    def get_impacted_tags(self, swagger_files):
+        """Readmes and tags whose input-file closure contains one of these Swagger files.
+
+        :returns: A dict Readme Path (relative to base_dir) -> set of tags. Tag None means input files
+         used by every tag of this Readme.
+        """
+        dependents = self.dependents(swagger_files)
+        impacted = defaultdict(set)
+        for relative_readme, tags in self._get_readme_inputs().items():
+            for tag, input_files in tags.items():
+                if input_files & dependents:
+                    impacted[relative_readme].add(tag)
+        return dict(impacted)
+
+
+def get_impacted_readme_files(files_list, base_dir=Path('.'), swagger_graph=None):
+    """Get readme files impacted by these files.
+
+    - A changed Readme impacts the Readmes of its folder.
+    - A changed Swagger impacts the Readmes whose input files depend on it (using the "$ref" graph).
+    - Anything else uses the context algorithm of get_readme_files_from_file_list.
+    """
+    readme_files = set()
+    swagger_files = []
+    other_files = []
+    for filename in files_list:
+        filepath = Path(filename)
+        if _README_REGEX.match(filepath.name):
+            readme_folder = Path(base_dir, filepath.parent)
+            if readme_folder.is_dir():
+                readme_files |= {
+                    readme.relative_to(base_dir)
+                    for readme in readme_folder.iterdir()
+                    if readme.is_file() and _README_REGEX.match(readme.name)
+                }
+        elif filepath.suffix == ".json" and "examples" not in filepath.parts:
+            swagger_files.append(filepath)
+        elif "examples" not in filepath.parts:
+            other_files.append(filename)
+
+    if swagger_files:
+        if swagger_graph is None:
+            swagger_graph = SwaggerGraph(base_dir).build()
+        for swagger_file in swagger_files:
+            impacted_tags = swagger_graph.get_impacted_tags([swagger_file])
+            if impacted_tags:
+                _LOGGER.info("Readmes impacted by %s: %s", swagger_file, impacted_tags)
+                readme_files |= set(impacted_tags.keys())
+            else:
+                # Not referenced by any Readme yet, fallback on context
+                other_files.append(str(swagger_file))
+    if other_files:
+        readme_files |= get_readme_files_from_file_list(other_files, base_dir)
+    return readme_files
+
+
+def is_tag_impacted(readme_path, tag, files_list, base_dir=Path('.'), swagger_graph=None):
+    """Is this tag (default tag if None) of this Readme impacted by these changed files.
+
+    True if a Readme of the same folder changed, if a changed file is in the "$ref" closure
+    of the input files of this tag, or if a file of the Readme folder that is not a Swagger nor an
+    example changed. When unsure (i.e. the tag cannot be solved), the tag is considered impacted.
+    """
+    readme_folder = PurePosixPath(Path(readme_path).as_posix()).parent
+    changed_files = {PurePosixPath(Path(filename).as_posix()) for filename in files_list}
+    if any(path.parent == readme_folder and _README_REGEX.match(path.name) for path in changed_files):
+        return True
+    if any(
+            readme_folder in path.parents and path.suffix != ".json" and "examples" not in path.parts
+            and not _README_REGEX.match(path.name)
+            for path in changed_files):
+        return True
+    input_files = get_tag_input_files(readme_path, tag, base_dir)
+    if input_files is None:
+        _LOGGER.info("Unable to solve input files of tag %s in %s", tag, readme_path)
+        return True
+    if not any(path.suffix == ".json" for path in changed_files):
+        return False  # Only a Swagger change can be in the closure, no need to build the graph
+    if swagger_graph is None:
+        swagger_graph = SwaggerGraph(base_dir).build()
+    return bool(swagger_graph.closure(input_files) & changed_files)
@@ -0,0 +1,278 @@
+"""Pool of persistent git working copies, to avoid cloning big repos at each command.
+
+The pool folder can be shared by several processes (gunicorn workers, worker processes): a
+workspace is locked with a lock file (flock), so that a process never resets nor evicts a workspace
+used by another one. A repo has several workspaces (slots), so that a short bot command does not wait
+for a long generation on the same repo.
+"""
+from contextlib import contextmanager
+import hashlib
+import logging
+import os
+from pathlib import Path
+import shutil
+from threading import Lock
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows, workspaces are locked for this process only
+    fcntl = None
+
+from git import Repo, GitCommandError
+
+from azure_devtools.ci_tools.github_tools import (
+    clone_to_path,
+    remove_readonly,
+)
+from azure_devtools.ci_tools.git_tools import (
+    checkout_with_fetch,
+)
+
+from .SwaggerToSdkCore import get_cache_dir
+from .SwaggerToSdkNewCLI import tune_git_index
+
+_LOGGER = logging.getLogger(__name__)
+
+# Disk budget of the pool in GB. Can be overriden by this environment variable.
+WORKSPACES_BUDGET_ENV = "SWAGGER_TO_SDK_WORKSPACES_BUDGET_GB"
+_DEFAULT_WORKSPACES_BUDGET_GB = 50
+
+# Max workspaces of one repo, used at the same time
+WORKSPACE_SLOTS_ENV = "SWAGGER_TO_SDK_WORKSPACE_SLOTS"
+_DEFAULT_WORKSPACE_SLOTS = 4
+
+# File touched at each release, used for LRU eviction
+_LAST_USED_MARKER = "swaggertosdk_last_used"
+
+# Folder of the lock files, in the pool folder
+_LOCKS_FOLDER = ".locks"
+
+# Seconds a computed workspace size is used before walking the workspace again
+_SIZE_MAX_AGE_SECONDS = 3600
+
+
+def get_folder_size(folder):
+    total_size = 0
+    for root, _, files in os.walk(str(folder)):
+        for filename in files:
+            try:
+                total_size += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                pass
+    return total_size
+
+
+class WorkspacePool:
+    """Persistent working copies, keyed by repo.
+
+    A workspace is leased to one user at a time, in all the processes, and reset to the
+    required ref using fetch + reset --hard + clean. Least recently used workspaces are removed
+    when the pool is bigger than the disk budget (in bytes).
+
+    If the workspaces of a repo are all in use, a new one is cloned, up to "slots" workspaces
+    and while the pool fits in the disk budget. Otherwise, the lease waits for the first one.
+
+    Walking a big clone is slow: sizes are computed when eviction runs or a new workspace could be
+    cloned, and kept for an hour.
+    """
+    def __init__(self, root=None, disk_budget=None, slots=None):
+        self.root = Path(root or get_cache_dir("workspaces"))
+        Path(self.root, _LOCKS_FOLDER).mkdir(parents=True, exist_ok=True)
+        if disk_budget is None:
+            disk_budget = float(os.environ.get(WORKSPACES_BUDGET_ENV, _DEFAULT_WORKSPACES_BUDGET_GB)) * 1024**3
+        self.disk_budget = disk_budget
+        if slots is None:
+            slots = int(os.environ.get(WORKSPACE_SLOTS_ENV, _DEFAULT_WORKSPACE_SLOTS))
+        self.slots = max(slots, 1)
+        self._lock = Lock()
+        self._workspace_locks = {}
+        self._sizes = {}  # Folder name -> (size, computed at)
+
+    def _workspace_folder(self, repo_id, gh_token, slot=0):
+        folder_name = repo_id.replace("/", "__")
+        if gh_token:
+            # Do not share a workspace cloned with different credentials
+            folder_name += "-" + hashlib.sha1(gh_token.encode()).hexdigest()[:8]
+        if slot:
+            folder_name += ".{}".format(slot)
+        return self.root / folder_name
+
+    def _workspace_lock(self, folder):
+        with self._lock:
+            return self._workspace_locks.setdefault(folder.name, Lock())
+
+    def _lock_file(self, folder, blocking=True):
+        """Open and lock the lock file of this workspace, shared by all the processes.
+
+        Closing the returned file releases the lock. Returns None if not blocking and the lock is busy.
+        """
+        lock_file = open(str(Path(self.root, _LOCKS_FOLDER, folder.name)), "a")
+        if fcntl is None:
+            return lock_file
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _acquire_workspace(self, repo_id, gh_token):
+        """Lock a workspace of this repo: a free one, a new one if possible, or wait for the first one.
+
+        Returns (folder, lock file). The lock of the folder in this process is held.
+        """
+        folders = [self._workspace_folder(repo_id, gh_token, slot) for slot in range(self.slots)]
+        existing_folders = [folder for folder in folders if Path(folder, ".git").is_dir()]
+        candidates = list(existing_folders)
+        if len(existing_folders) < len(folders) and self._get_pool_size() < self.disk_budget:
+            candidates += [folder for folder in folders if folder not in existing_folders]
+        for folder in candidates:
+            workspace_lock = self._workspace_lock(folder)
+            if not workspace_lock.acquire(blocking=False):
+                continue  # In use by this process
+            try:
+                lock_file = self._lock_file(folder, blocking=False)
+            except BaseException:
+                workspace_lock.release()
+                raise
+            if lock_file is not None:
+                return folder, lock_file
+            workspace_lock.release()  # In use by another process
+
+        folder = existing_folders[0] if existing_folders else folders[0]
+        _LOGGER.info("All the workspaces of %s are in use, wait for %s", repo_id, folder)
+        workspace_lock = self._workspace_lock(folder)
+        workspace_lock.acquire()
+        try:
+            return folder, self._lock_file(folder)
+        except BaseException:
+            workspace_lock.release()
+            raise
+
+    @contextmanager
+    def lease(self, gh_token, git_id, *, pr_number=None):
+        """Lease a workspace, same parameters as manage_git_folder.
+
+        If PR number is given, use magic branches "pull" from Github.
+        """
+        split_git_id = git_id.split("@")
+        repo_id = split_git_id[0]
+        ref = split_git_id[1] if len(split_git_id) > 1 else None
+
+        folder, lock_file = self._acquire_workspace(repo_id, gh_token)
+        try:
+            with lock_file:
+                if Path(folder, ".git").is_dir():
+                    try:
+                        self._reset(folder, ref, pr_number)
+                    except GitCommandError:
+                        _LOGGER.warning("Unable to reset workspace %s, clone it again", folder)
+                        shutil.rmtree(str(folder), onerror=remove_readonly)
+                if not Path(folder, ".git").is_dir():
+                    _LOGGER.info("Creating workspace %s for %s", folder, repo_id)
+                    if folder.exists():  # Leftover of an interrupted clone
+                        shutil.rmtree(str(folder), onerror=remove_readonly)
+                    clone_to_path(gh_token, folder, repo_id, branch_or_commit=ref, pr_number=pr_number)
+                    tune_git_index(Repo(str(folder)))
+                try:
+                    yield folder
+                finally:
+                    Path(folder, ".git", _LAST_USED_MARKER).touch()
+        finally:
+            self._workspace_lock(folder).release()
+        self.evict()
+
+    @staticmethod
+    def _reset(folder, ref, pr_number):
+        """Reset this workspace to what a fresh clone would give."""
+        _LOGGER.info("Reset workspace %s", folder)
+        repo = Repo(str(folder))
+        for git_command in [repo.git.rebase, repo.git.merge, repo.git.cherry_pick]:
+            try:
+                git_command("--abort")
+            except GitCommandError:
+                pass  # Nothing in progress
+        for remote in repo.remotes:
+            if remote.name != "origin":
+                repo.delete_remote(remote)
+        repo.git.reset("--hard")
+        repo.git.clean("-ffdx")
+        repo.git.fetch("origin", "--prune", "--tags", "--force")
+
+        if pr_number:
+            try:
+                checkout_with_fetch(folder, "pull/{}/merge".format(pr_number))
+            except GitCommandError:
+                # Assume "merge" doesn't exist anymore, fetch "head"
+                checkout_with_fetch(folder, "pull/{}/head".format(pr_number))
+            if ref:
+                repo.git.checkout(ref)
+        elif ref and "origin/"+ref in [r.name for r in repo.remotes.origin.refs]:
+            repo.git.checkout("-B", ref, "origin/"+ref)
+        elif ref:
+            repo.git.checkout("--detach", ref)
+        else:
+            default_branch = repo.git.rev_parse("--abbrev-ref", "origin/HEAD")  # i.e. "origin/master"
+            repo.git.checkout("-B", default_branch[len("origin/"):], default_branch)
+        repo.git.reset("--hard")
+
+        # Local branches from previous leases are not in a fresh clone
+        current_branch = None if repo.head.is_detached else repo.active_branch.name
+        for head in repo.heads:
+            if head.name != current_branch:
+                repo.delete_head(head, force=True)
+
+    def _get_workspaces_size(self):
+        """Workspace folders and the total size of the pool. Call with self._lock held."""
+        workspaces = [folder for folder in self.root.iterdir() if folder.is_dir() and folder.name != _LOCKS_FOLDER]
+        now = time.time()
+        for folder in workspaces:
+            if folder.name not in self._sizes or now - self._sizes[folder.name][1] > _SIZE_MAX_AGE_SECONDS:
+                self._sizes[folder.name] = (get_folder_size(folder), now)
+        return workspaces, sum(self._sizes[folder.name][0] for folder in workspaces)
+
+    def _get_pool_size(self):
+        with self._lock:
+            return self._get_workspaces_size()[1]
+
+    def evict(self):
+        """Remove least recently used workspaces not in use, until the pool fits in the disk budget."""
+        with self._lock:
+            workspaces, total_size = self._get_workspaces_size()
+
+            def last_used(folder):
+                try:
+                    return Path(folder, ".git", _LAST_USED_MARKER).stat().st_mtime
+                except OSError:
+                    return 0
+
+            for folder in sorted(workspaces, key=last_used):
+                if total_size <= self.disk_budget:
+                    break
+                workspace_lock = self._workspace_locks.setdefault(folder.name, Lock())
+                if not workspace_lock.acquire(blocking=False):
+                    continue  # In use by this process
+                try:
+                    lock_file = self._lock_file(folder, blocking=False)
+                    if lock_file is None:
+                        continue  # In use by another process
+                    with lock_file:
+                        _LOGGER.info("Evict workspace %s (unused since %s)", folder, time.ctime(last_used(folder)))
+                        shutil.rmtree(str(folder), onerror=remove_readonly)
+                        total_size -= self._sizes.pop(folder.name)[0]
+                finally:
+                    workspace_lock.release()
+
+
+_WORKSPACE_POOL = None
+_WORKSPACE_POOL_LOCK = Lock()
+
+
+def get_workspace_pool():
+    """The workspace pool of this process."""
+    global _WORKSPACE_POOL
+    with _WORKSPACE_POOL_LOCK:
+        if _WORKSPACE_POOL is None:
+            _WORKSPACE_POOL = WorkspacePool()
+        return _WORKSPACE_POOL
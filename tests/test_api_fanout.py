@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from swaggertosdk.restapi.api_fanout import ApiFanOut
+
+
+def test_api_fanout():
+    calls = []
+
+    def api_call(name, duration=0.):
+        calls.append(name)
+        time.sleep(duration)
+        return name
+
+    with ApiFanOut(max_workers=4) as api_operations:
+        sdk_pr = api_operations.submit(api_call, "sdk_pr", 0.2)
+        issue = api_operations.submit(api_call, "issue")
+        merge = api_operations.submit(lambda: api_call("merge " + sdk_pr.result()), after=[sdk_pr])
+        context_pr = api_operations.submit(api_call, "context_pr", after=[merge, issue])
+    # Independent calls did not wait for each other
+    assert calls.index("issue") < calls.index("merge sdk_pr") < calls.index("context_pr")
+    assert context_pr.result() == "context_pr"
+
+
+def test_api_fanout_failure():
+    def fail():
+        raise ValueError("Bad call")
+
+    calls = []
+    with pytest.raises(ValueError):
+        with ApiFanOut() as api_operations:
+            failed = api_operations.submit(fail)
+            dependent = api_operations.submit(calls.append, "dependent", after=[failed])
+            api_operations.submit(calls.append, "independent")
+    assert calls == ["independent"]
+    assert isinstance(dependent.exception(), ValueError)
+
+
+def test_api_fanout_cancel():
+    calls = []
+
+    def api_call(name, duration=0.):
+        calls.append(name)
+        time.sleep(duration)
+        return name
+
+    with pytest.raises(ValueError):
+        with ApiFanOut(max_workers=1) as api_operations:
+            running = api_operations.submit(api_call, "running", 0.2)
+            queued = api_operations.submit(api_call, "queued")
+            dependent = api_operations.submit(api_call, "dependent", after=[queued])
+            time.sleep(0.05)
+            raise ValueError("Job failed")
+    # Running call is done before leaving, pending ones never run
+    assert running.result() == "running"
+    assert queued.cancelled()
+    assert dependent.cancelled()
+    assert calls == ["running"]
@@ -3,6 +3,8 @@ from pathlib import Path
 import shutil
 import tempfile
 from subprocess import CalledProcessError
+from threading import Timer
+import time
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -13,6 +15,8 @@ from swaggertosdk.autorest_tools import (
     generate_code,
     autorest_swagger_to_sdk_conf,
     execute_simple_command,
+    CancellationToken,
+    GenerationCancelled,
 )
 
 CWD = os.path.dirname(os.path.realpath(__file__))
@@ -34,6 +38,22 @@ def test_execute_simple_command():
     except CalledProcessError as err:
         assert "python -h" in err.output
 
+def test_execute_simple_command_cancelled():
+    cancel_token = CancellationToken()
+    output = execute_simple_command(["python", "--version"], cancel_token=cancel_token)
+    assert "Python" in output
+
+    timer = Timer(0.5, cancel_token.cancel)
+    timer.start()
+    start_time = time.monotonic()
+    with pytest.raises(GenerationCancelled):
+        execute_simple_command(["python", "-c", "import time; time.sleep(30)"], cancel_token=cancel_token)
+    assert time.monotonic() - start_time < 10
+
+    # Already cancelled, the process is killed as soon as started
+    with pytest.raises(GenerationCancelled):
+        execute_simple_command(["python", "-c", "import time; time.sleep(30)"], cancel_token=cancel_token)
+
 def test_build_autorest_options():
     line = build_autorest_options({"autorest_options": {"A": "value"}}, {"autorest_options": {"B": "value value"}})
     assert line == ["--a=value", "--b='value value'"]
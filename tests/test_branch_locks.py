@@ -0,0 +1,53 @@
+from pathlib import Path
+import tempfile
+from threading import Thread, Timer
+
+import pytest
+
+from swaggertosdk.autorest_tools import CancellationToken, GenerationCancelled
+from swaggertosdk.branch_locks import BranchLockManager
+
+SDK = "Azure/azure-sdk-for-python"
+
+
+def test_branch_locks():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        locks = BranchLockManager(Path(temp_dir, "locks.sqlite"), poll_seconds=0.01)
+
+        with locks.lock(SDK, ["restapi_auto_1", "restapi_auto_network"]):
+            # Another branch, or the same branch name in another repo, is not blocked
+            assert locks.try_acquire(SDK, ["restapi_auto_2"], "other")
+            assert locks.try_acquire("Azure/azure-sdk-for-go", ["restapi_auto_1"], "other")
+            locks.release("other")
+            # All or nothing
+            assert not locks.try_acquire(SDK, ["restapi_auto_3", "restapi_auto_network"], "other")
+            assert locks.try_acquire(SDK, ["restapi_auto_3"], "other")
+            locks.release("other")
+
+            # Same branch waits for the release
+            events = []
+            def generate():
+                with locks.lock(SDK, ["restapi_auto_network"]):
+                    events.append("second generation")
+            waiting_thread = Thread(target=generate)
+            waiting_thread.start()
+            waiting_thread.join(timeout=0.2)
+            assert waiting_thread.is_alive()
+            events.append("first generation")
+        waiting_thread.join(timeout=10)
+        assert events == ["first generation", "second generation"]
+
+
+def test_branch_locks_lease_and_cancel():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dead_process_locks = BranchLockManager(Path(temp_dir, "locks.sqlite"), lease_seconds=0)
+        assert dead_process_locks.try_acquire(SDK, ["restapi_auto_1"], "dead")
+
+        locks = BranchLockManager(Path(temp_dir, "locks.sqlite"), poll_seconds=0.01)
+        # Lease of the dead process expired
+        with locks.lock(SDK, ["restapi_auto_1"]):
+            cancel_token = CancellationToken()
+            Timer(0.1, cancel_token.cancel).start()
+            with pytest.raises(GenerationCancelled):
+                with locks.lock(SDK, ["restapi_auto_1"], cancel_token):
+                    pytest.fail("Lock should not be acquired")
@@ -0,0 +1,127 @@
+from pathlib import Path
+import tempfile
+from threading import Thread
+import time
+
+from swaggertosdk.restapi.broker import SqliteBroker
+from swaggertosdk.restapi.scheduler import PRIORITY_OPENED, PRIORITY_URGENT, create_job
+
+
+def make_pr_job(number, action, sdkid="Azure/azure-sdk-for-python"):
+    body = {
+        "action": action,
+        "number": number,
+        "repository": {"full_name": "Azure/azure-rest-api-specs"},
+        "pull_request": {"head": {"repo": {"full_name": "fork/azure-rest-api-specs"}}},
+        "before": "old_sha",
+        "after": "new_sha",
+    }
+    return create_job("pull_request", body, sdkid, "master", sdkid.split("/")[-1])
+
+
+def test_sqlite_broker():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        broker_path = Path(temp_dir, "jobs.sqlite")
+        # Webhook server and two workers, as they would be in different processes
+        ingest = SqliteBroker(broker_path, weights={})
+        worker1 = SqliteBroker(broker_path, weights={}, poll_seconds=0.01)
+        worker2 = SqliteBroker(broker_path, weights={}, poll_seconds=0.01)
+
+        ingest.put(make_pr_job(1, "synchronize"))
+        ingest.put(make_pr_job(2, "opened"))
+        ingest.put(make_pr_job(3, "closed"))
+        assert ingest.qsize() == 3
+
+        job = worker1.get()
+        assert (job.body["number"], job.priority) == (3, PRIORITY_URGENT)
+        assert job.enqueued_at <= time.monotonic()
+        other_job = worker2.get()
+        assert other_job.body["number"] == 2
+        assert ingest.tenants_status() == {"Azure/azure-sdk-for-python": {"queued": 1, "running": 2}}
+
+        # A new event on PR 2 cancels the running job, and one on PR 1 replaces the queued job
+        ingest.put(make_pr_job(2, "synchronize"))
+        ingest.put(make_pr_job(1, "synchronize"))
+        assert ingest.superseded == 2
+        worker2.refresh_leases()
+        assert other_job.cancel_token.is_cancelled()
+        assert not job.cancel_token.is_cancelled()
+
+        worker1.task_done(job)
+        worker2.task_done(other_job)
+        numbers = []
+        while ingest.qsize():
+            job = worker1.get()
+            numbers.append(job.body["number"])
+            worker1.task_done(job)
+        assert sorted(numbers) == [1, 2]
+        ingest.join()
+
+
+def test_sqlite_broker_labeled_event():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        broker_path = Path(temp_dir, "jobs.sqlite")
+        ingest = SqliteBroker(broker_path, weights={})
+        worker = SqliteBroker(broker_path, weights={}, poll_seconds=0.01)
+
+        ingest.put(make_pr_job(1, "synchronize"))
+        running = worker.get()
+        ingest.put(make_pr_job(2, "opened"))
+        ingest.put(make_pr_job(1, "labeled"))
+        ingest.put(make_pr_job(2, "labeled"))
+        # Running synchronize and queued "opened" are kept
+        assert ingest.superseded == 0
+        assert ingest.qsize() == 3
+        worker.refresh_leases()
+        assert not running.cancel_token.is_cancelled()
+        worker.task_done(running)
+
+        jobs = []
+        while ingest.qsize():
+            job = worker.get()
+            jobs.append((job.body["number"], job.body["action"]))
+            worker.task_done(job)
+        assert (2, "opened") in jobs
+        assert len(jobs) == 3
+
+
+def test_sqlite_broker_lease():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        broker_path = Path(temp_dir, "jobs.sqlite")
+        dead_worker = SqliteBroker(broker_path, weights={}, lease_seconds=0)
+        worker = SqliteBroker(broker_path, weights={})
+
+        dead_worker.put(make_pr_job(1, "opened"))
+        dead_job = dead_worker.get()
+        assert dead_job.priority == PRIORITY_OPENED
+        time.sleep(0.01)
+
+        # The lease of the dead worker expired, the job is run again
+        job = worker.get_nowait()
+        assert job.body["number"] == 1
+        # The dead worker coming back does not remove the job run by the other worker
+        dead_worker.task_done(dead_job)
+        assert worker.tenants_status()["Azure/azure-sdk-for-python"]["running"] == 1
+        worker.task_done(job)
+        assert worker.get_nowait() is None
+
+
+def test_sqlite_broker_maxsize():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        broker_path = Path(temp_dir, "jobs.sqlite")
+        ingest = SqliteBroker(broker_path, maxsize=1, weights={}, poll_seconds=0.01)
+        worker = SqliteBroker(broker_path, weights={})
+
+        ingest.put(make_pr_job(1, "opened"))
+        put_thread = Thread(target=ingest.put, args=(make_pr_job(2, "opened"),), daemon=True)
+        put_thread.start()
+        put_thread.join(0.2)
+        # Broker is full, until a worker gets a job
+        assert put_thread.is_alive()
+        assert ingest.qsize() == 1
+
+        job = worker.get_nowait()
+        put_thread.join(5)
+        assert not put_thread.is_alive()
+        assert ingest.qsize() == 1
+        worker.task_done(job)
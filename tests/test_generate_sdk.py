@@ -0,0 +1,117 @@
+import json
+from pathlib import Path
+import tempfile
+from threading import Lock
+import time
+
+from git import Repo
+import pytest
+
+from swaggertosdk.generate_sdk import (
+    generate,
+    generate_main,
+    get_files_changed_since,
+    is_project_impacted,
+)
+
+
+def test_get_files_changed_since():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo = Repo.init(temp_dir)
+        repo.git.config('user.email', 'test@example.com')
+        repo.git.config('user.name', 'Test')
+        for filename in ["committed.json", "uncommitted.json", "untouched.json"]:
+            Path(temp_dir, filename).write_text("{}")
+        Path(temp_dir, ".gitignore").write_text("ignored.json\n")
+        repo.git.add(temp_dir)
+        repo.index.commit("Initial commit")
+        repo.create_tag("base")
+
+        Path(temp_dir, "committed.json").write_text('{"committed": true}')
+        repo.git.add(temp_dir)
+        repo.index.commit("Change")
+        Path(temp_dir, "uncommitted.json").write_text('{"uncommitted": true}')
+        Path(temp_dir, "untracked.json").write_text("{}")
+        Path(temp_dir, "ignored.json").write_text("{}")
+
+        changed_files = get_files_changed_since(temp_dir, "base")
+        assert sorted(changed_files) == ["committed.json", "uncommitted.json", "untracked.json"]
+
+        changed_files = {Path(f) for f in changed_files}
+        global_conf = {}
+        assert is_project_impacted(global_conf, {"markdown": "untracked.json"}, changed_files)
+        assert is_project_impacted(global_conf, {"markdown": "uncommitted.json"}, changed_files)
+        assert not is_project_impacted(global_conf, {"markdown": "untouched.json"}, changed_files)
+
+
+@pytest.mark.parametrize("jobs", [1, 8])
+def test_generate(monkeypatch, jobs):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        restapi_folder = Path(temp_dir, "rest")
+        for service in ["a", "b", "c"]:
+            Path(restapi_folder, "specification", service).mkdir(parents=True)
+            Path(restapi_folder, "specification", service, "readme.md").write_text("")
+        sdk_folder = Path(temp_dir, "sdk")
+        sdk_folder.mkdir()
+        Path(sdk_folder, "swagger_to_sdk_config.json").write_text(json.dumps({
+            "meta": {"repotag": "azure-sdk-for-python"},
+            "projects": {
+                # Replaced by the Readme conf
+                "specification/a/readme.md": {"markdown": "specification/a/readme.md", "output_dir": "static_a"},
+                # Readme without conf, the static project is used
+                "specification/b/readme.md": {"markdown": "specification/b/readme.md", "output_dir": "sdk/b"},
+                "other": {"markdown": "other.md", "output_dir": "sdk/other"},
+                # Inside the output_dir of Readme "c"
+                "nested": {"markdown": "nested.md", "output_dir": "sdk/c/nested"},
+                # After scripts can write anywhere in the SDK
+                "scripted": {"markdown": "scripted.md", "output_dir": "sdk/scripted", "after_scripts": ["make"]},
+            }
+        }))
+
+        def extract_conf_from_readmes(swagger_files_in_pr, restapi_git_folder, sdk_git_id, config):
+            for readme_file in swagger_files_in_pr:
+                service = Path(readme_file).parent.name
+                if service == "b":
+                    continue
+                config.setdefault("projects", {})[str(readme_file)] = {
+                    "markdown": str(readme_file), "output_dir": "sdk/" + service
+                }
+        monkeypatch.setattr('swaggertosdk.generate_sdk.extract_conf_from_readmes', extract_conf_from_readmes)
+
+        built_projects = []
+        running_output_dirs = []
+        lock = Lock()
+        def build_project(temp_dir, project, absolute_markdown_path, sdk_folder, global_conf, local_conf, autorest_bin):
+            output_dir = local_conf["output_dir"]
+            written_dir = "." if local_conf.get("after_scripts") else output_dir
+            with lock:
+                assert not any(
+                    "." in (written_dir, running)
+                    or written_dir.startswith(running + "/") or running.startswith(written_dir + "/")
+                    for running in running_output_dirs
+                ), "Overlapping output dirs generated at the same time"
+                running_output_dirs.append(written_dir)
+                built_projects.append(output_dir)
+            time.sleep(0.05)
+            with lock:
+                running_output_dirs.remove(written_dir)
+            return True
+        monkeypatch.setattr('swaggertosdk.generate_sdk.build_project', build_project)
+
+        meta_output_dirs = []
+        monkeypatch.setattr(
+            'swaggertosdk.generate_sdk.execute_meta_after_script',
+            lambda sdk_root, global_conf, output_dirs: meta_output_dirs.append(output_dirs)
+        )
+
+        generate("swagger_to_sdk_config.json", sdk_folder, [], None, restapi_folder, jobs=jobs)
+
+        assert sorted(built_projects) == ["sdk/a", "sdk/b", "sdk/c", "sdk/c/nested", "sdk/other", "sdk/scripted"]
+        assert meta_output_dirs == [["sdk/a", "sdk/b", "sdk/c", "sdk/c/nested", "sdk/other", "sdk/scripted"]]
+
+
+def test_generate_main_negative_jobs(monkeypatch, capsys):
+    monkeypatch.setattr('sys.argv', ["generate_sdk", "--jobs", "-1"])
+    with pytest.raises(SystemExit):
+        generate_main()
+    assert "--jobs" in capsys.readouterr().err
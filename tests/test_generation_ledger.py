@@ -0,0 +1,57 @@
+from pathlib import Path
+from subprocess import CalledProcessError
+import tempfile
+from types import SimpleNamespace
+
+from github import UnknownObjectException
+
+from swaggertosdk.generation_ledger import GenerationLedger, get_ledger_key
+from swaggertosdk.SwaggerToSdkNewCLI import get_generation_key
+
+SDK = "Azure/azure-sdk-for-python"
+
+
+def test_generation_ledger():
+    config = {"meta": {"autorest_options": {"version": "preview"}}, "projects": {}}
+    key = get_ledger_key("rest_sha", config, "azure-sdk-for-python", "base_sha", "toolchain")
+    assert key == get_ledger_key("rest_sha", dict(config), "azure-sdk-for-python", "base_sha", "toolchain")
+    assert key != get_ledger_key("rest_sha", config, "azure-sdk-for-python", "new_base_sha", "toolchain")
+    assert key != get_ledger_key("rest_sha", config, "azure-sdk-for-python", "base_sha", "new_toolchain")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        ledger = GenerationLedger(Path(temp_dir, "ledger.sqlite"))
+        assert ledger.lookup(key) is None
+
+        ledger.record(key, SDK, "restapi_auto_1", "https://github.com/{}/commit/sdk_sha".format(SDK), "sdk_sha")
+        ledger.record("other_key", SDK, "restapi_auto_2", None, None)
+        entry = GenerationLedger(Path(temp_dir, "ledger.sqlite")).lookup(key)
+        assert entry.result.endswith("sdk_sha")
+        assert entry.branch_sha == "sdk_sha"
+
+        assert ledger.invalidate(SDK, "restapi_auto_1") == 1
+        assert ledger.lookup(key) is None
+        assert ledger.lookup("other_key") is not None
+
+
+def test_get_generation_key(monkeypatch):
+    monkeypatch.setattr("swaggertosdk.SwaggerToSdkNewCLI.get_toolchain_fingerprint", lambda: "toolchain")
+
+    def get_branch(branch_name):
+        if branch_name == "master":
+            return SimpleNamespace(commit=SimpleNamespace(sha="master_sha"))
+        raise UnknownObjectException(404, {"message": "Branch not found"}, {})
+    sdk_github_repo = SimpleNamespace(get_branch=get_branch)
+
+    pull = SimpleNamespace(merge_commit_sha="merge_sha")
+    # Base branch does not exist yet, key uses master
+    key = get_generation_key(pull, {}, "tag", sdk_github_repo, ["restapi_auto_base", "master"])
+    assert key == get_ledger_key("merge_sha", {}, "tag", "master_sha", "toolchain")
+
+    # A PR that is not mergeable has no key
+    assert get_generation_key(SimpleNamespace(merge_commit_sha=None), {}, "tag", sdk_github_repo, ["master"]) is None
+
+    # Broken autorest, generation runs without the ledger
+    def broken_autorest():
+        raise CalledProcessError(1, "autorest")
+    monkeypatch.setattr("swaggertosdk.SwaggerToSdkNewCLI.get_toolchain_fingerprint", broken_autorest)
+    assert get_generation_key(pull, {}, "tag", sdk_github_repo, ["master"]) is None
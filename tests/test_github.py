@@ -0,0 +1,151 @@
+from types import SimpleNamespace
+import unittest.mock
+
+import pytest
+
+from swaggertosdk.restapi import app
+from swaggertosdk.restapi import github
+from swaggertosdk.restapi.scheduler import create_job
+
+
+def _comment_event(login, text):
+    return {
+        "action": "created",
+        "sender": {"login": login},
+        "comment": {"body": text},
+        "issue": {"number": 1},
+        "repository": {"full_name": "Azure/azure-rest-api-specs"},
+    }
+
+
+def test_is_bot_command():
+    assert github.is_bot_command(_comment_event("someone", "@Swagger-To-Sdk rebase"), "swagger-to-sdk")
+    assert not github.is_bot_command(_comment_event("someone", "LGTM"), "swagger-to-sdk")
+    assert not github.is_bot_command(_comment_event("someone", "cc @swagger-to-sdk-team rebase"), "swagger-to-sdk")
+    # The bot mentions itself in its own help messages
+    assert not github.is_bot_command(_comment_event("swagger-to-sdk", "@swagger-to-sdk help"), "swagger-to-sdk")
+
+
+def test_rest_notify_issue_comment(monkeypatch):
+    monkeypatch.setattr(github, "start_workers", lambda: None)
+    monkeypatch.setattr(github, "get_robot_name", lambda gh_token: "swagger-to-sdk")
+    monkeypatch.setenv("GH_TOKEN", "token")
+    queued_jobs = []
+    monkeypatch.setattr(github, "queue_job", lambda event_type, body: queued_jobs.append(body) or {"message": "queued"})
+
+    client = app.test_client()
+    for login, text in [("someone", "LGTM"), ("swagger-to-sdk", "@swagger-to-sdk help"), ("someone", "@swagger-to-sdk rebase")]:
+        response = client.post(
+            "/github/rest?sdkid=Azure/azure-sdk-for-python",
+            json=_comment_event(login, text),
+            headers={"X-GitHub-Event": "issue_comment"}
+        )
+        assert response.status_code == 200
+
+    assert [body["comment"]["body"] for body in queued_jobs] == ["@swagger-to-sdk rebase"]
+
+
+def test_rest_notify_issues(monkeypatch):
+    monkeypatch.setattr(github, "start_workers", lambda: None)
+    monkeypatch.setattr(github, "get_robot_name", lambda gh_token: "swagger-to-sdk")
+    monkeypatch.setenv("GH_TOKEN", "token")
+    queued_jobs = []
+    monkeypatch.setattr(github, "queue_job", lambda event_type, body: queued_jobs.append((event_type, body)))
+
+    client = app.test_client()
+    for text in ["New service", None, "@swagger-to-sdk rebuild"]:
+        event = {"action": "opened", "sender": {"login": "someone"}, "issue": {"number": 1, "body": text}}
+        response = client.post(
+            "/github/rest?sdkid=Azure/azure-sdk-for-python",
+            json=event,
+            headers={"X-GitHub-Event": "issues"}
+        )
+        assert response.status_code == 200
+
+    assert [(event_type, body["issue"]["body"]) for event_type, body in queued_jobs] == [
+        ("issues", "@swagger-to-sdk rebuild")
+    ]
+
+
+def test_get_sdk_targets():
+    assert github.get_sdk_targets("Azure/azure-sdk-for-python", "master", "azure-sdk-for-python") == [
+        ("Azure/azure-sdk-for-python", "master", "azure-sdk-for-python")
+    ]
+    sdkid = "Azure/azure-sdk-for-python,Azure/azure-sdk-for-go"
+    assert github.get_default_sdk_tag(sdkid) == "azure-sdk-for-python,azure-sdk-for-go"
+    assert github.get_sdk_targets(sdkid, "master", github.get_default_sdk_tag(sdkid)) == [
+        ("Azure/azure-sdk-for-python", "master", "azure-sdk-for-python"),
+        ("Azure/azure-sdk-for-go", "master", "azure-sdk-for-go"),
+    ]
+    with pytest.raises(ValueError):
+        github.get_sdk_targets(sdkid, "master,dev,other", "python")
+
+
+def test_rest_handle_action_targets(monkeypatch):
+    monkeypatch.setenv("GH_TOKEN", "token")
+    github_client = unittest.mock.MagicMock()
+    github_client.get_repo.side_effect = lambda full_name: SimpleNamespace(
+        full_name=full_name,
+        get_pull=unittest.mock.MagicMock()
+    )
+    monkeypatch.setattr(github, "get_github_client", lambda gh_token: github_client)
+    monkeypatch.setattr(github, "get_graphql_client", lambda gh_token: None)
+    mocked_management = unittest.mock.MagicMock()
+    monkeypatch.setattr(github, "rest_pr_management_targets", mocked_management)
+
+    body = {"action": "opened", "number": 12, "repository": {"full_name": "Azure/azure-rest-api-specs"}}
+    github.rest_handle_action(body, "Azure/azure-sdk-for-python,Azure/azure-sdk-for-go", "master", "python,go")
+
+    # One job, the SDKs are generated from the same RestAPI clone
+    mocked_management.assert_called_once()
+    _, targets = mocked_management.call_args[0]
+    assert [(sdk_repo.full_name, sdk_tag, sdkbase) for sdk_repo, sdk_tag, sdkbase in targets] == [
+        ("Azure/azure-sdk-for-python", "python", "master"),
+        ("Azure/azure-sdk-for-go", "go", "master"),
+    ]
+
+
+def _push_event(ref, deleted=False):
+    return {"ref": ref, "deleted": deleted, "after": "abc", "repository": {"full_name": "Azure/azure-rest-api-specs"}}
+
+
+def test_rest_notify_push(monkeypatch):
+    monkeypatch.setattr(github, "start_workers", lambda: None)
+    queued_jobs = []
+    monkeypatch.setattr(
+        github, "queue_job", lambda event_type, body: queued_jobs.append(event_type) or {"message": "queued"}
+    )
+    mocked_generation = unittest.mock.MagicMock()
+    monkeypatch.setattr(github, "generate_sdks_from_git_object", mocked_generation)
+
+    client = app.test_client()
+    for ref, deleted in [("refs/heads/master", False), ("refs/heads/feature", True), ("refs/heads/feature", False)]:
+        response = client.post(
+            "/github/rest?sdkid=Azure/azure-sdk-for-python",
+            json=_push_event(ref, deleted),
+            headers={"X-GitHub-Event": "push"}
+        )
+        assert response.status_code == 200
+
+    # Generation is done by the worker, not in the webhook request
+    assert queued_jobs == ["push"]
+    mocked_generation.assert_not_called()
+
+
+def test_handle_job_push(monkeypatch):
+    monkeypatch.setenv("GH_TOKEN", "token")
+    github_client = unittest.mock.MagicMock()
+    monkeypatch.setattr(github, "get_github_client", lambda gh_token: github_client)
+    mocked_generation = unittest.mock.MagicMock(return_value=[None])
+    monkeypatch.setattr(github, "generate_sdks_from_git_object", mocked_generation)
+
+    job = create_job("push", _push_event("refs/heads/feature"), "Azure/azure-sdk-for-python", "master", "python")
+    github.handle_job(job)
+
+    github_client.get_repo.return_value.get_commit.assert_called_once_with("abc")
+    commit_obj, targets, restapi_git_id = mocked_generation.call_args[0]
+    assert restapi_git_id == "Azure/azure-rest-api-specs"
+    assert [(target.sdk_git_id, target.branch_name) for target in targets] == [
+        ("Azure/azure-sdk-for-python", "restapi_auto_feature")
+    ]
+    assert mocked_generation.call_args[1]["cancel_token"] is job.cancel_token
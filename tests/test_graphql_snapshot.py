@@ -0,0 +1,59 @@
+import pytest
+
+from swaggertosdk.restapi.fake_github import FakeGithubServer
+from swaggertosdk.restapi.graphql_snapshot import GraphqlClient, load_sdk_snapshot, load_pull_request_snapshot
+from swaggertosdk.SwaggerToSdkCore import get_context_tag_from_git_object
+
+
+class FakePull:
+    """What load_pull_request_snapshot needs from a PyGithub PullRequest."""
+    class base:
+        class repo:
+            full_name = "Azure/azure-rest-api-specs"
+    number = 1
+    title = "My PR"
+
+
+def test_graphql_snapshot():
+    with FakeGithubServer() as server:
+        fake = server.fake_github
+        files = ["specification/compute/resource-manager/Microsoft.Compute/stable/2018-01-01/file{}.json".format(index)
+                 for index in range(150)]
+        fake.add_pull("Azure/azure-rest-api-specs", {
+            "number": 1,
+            "title": "My PR",
+            "state": "open",
+            "head": {"ref": "feature", "label": "contributor:feature", "sha": "abc"},
+            "base": {"ref": "master", "label": "Azure:master", "repo": {"full_name": "Azure/azure-rest-api-specs"}},
+        }, files)
+        sdk_pull = fake.create_pull("Azure/azure-sdk-for-python", "SDK PR", "", "Azure:restapi_auto_1", "master")
+        fake.issue_labels[("Azure/azure-sdk-for-python", sdk_pull["number"])] = {"RestPRInProgress"}
+        fake.labels["Azure/azure-sdk-for-python"] = {"RestPRInProgress": {}}
+
+        client = GraphqlClient("token", server.base_url)
+        pull = load_pull_request_snapshot(client, FakePull())
+        # Two pages of files, and the PyGithub object is still there
+        assert len(pull.get_files()) == 150
+        assert get_context_tag_from_git_object(pull) == {"compute/resource-manager"}
+        assert pull.get_commits()[-1].commit.sha == "abc"
+        assert pull.title == "My PR"
+        assert fake.calls["POST /graphql"] == 2
+
+        sdk_snapshot = load_sdk_snapshot(client, "Azure/azure-sdk-for-python", "restapi_auto_1")
+        assert sdk_snapshot.labels == {"RestPRInProgress"}
+        assert sdk_snapshot.get_open_pull("master").number == sdk_pull["number"]
+        assert sdk_snapshot.get_open_pull("restapi_auto_compute") is None
+        assert sdk_snapshot.get_pull_labels(sdk_pull["number"]) == {"RestPRInProgress"}
+
+        # More than one page of labels: repo labels are paginated, PR labels are unknown
+        many_labels = {"Label{}".format(index): {} for index in range(150)}
+        fake.labels["Azure/azure-sdk-for-python"].update(many_labels)
+        fake.issue_labels[("Azure/azure-sdk-for-python", sdk_pull["number"])] |= set(many_labels)
+        calls = fake.calls["POST /graphql"]
+        sdk_snapshot = load_sdk_snapshot(client, "Azure/azure-sdk-for-python", "restapi_auto_1")
+        assert sdk_snapshot.labels == {"RestPRInProgress"} | set(many_labels)
+        assert sdk_snapshot.get_pull_labels(sdk_pull["number"]) is None
+        assert fake.calls["POST /graphql"] == calls + 2
+
+        with pytest.raises(ValueError):
+            client.query("query Unknown { viewer { login } }")
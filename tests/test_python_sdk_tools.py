@@ -1,10 +1,17 @@
+import os
 from pathlib import Path
 from subprocess import CalledProcessError
 import tempfile
 
+from git import Repo
 import pytest
 
-from swaggertosdk.python_sdk_tools import build_package_from_pr_number
+from swaggertosdk.python_sdk_tools import (
+    build_package_from_pr_number,
+    build_package,
+    evict_packages,
+    get_package_names_from_git,
+)
 
 
 def test_build_package_from_pr_number(github_token):
@@ -22,4 +29,88 @@ def test_build_package_from_pr_number(github_token):
     # This PR is broken and can't be built: 2040
     with tempfile.TemporaryDirectory() as temp_dir, pytest.raises(CalledProcessError):
         build_package_from_pr_number(github_token, "Azure/azure-sdk-for-python", 2040, temp_dir)
-    
\ No newline at end of file
+    
+def test_build_package(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        monkeypatch.setenv("SWAGGER_TO_SDK_CACHE_DIR", str(temp_dir / "cache"))
+
+        sdk_folder = temp_dir / "sdk"
+        package_folder = sdk_folder / "azure-mgmt-myservice"
+        package_folder.mkdir(parents=True)
+        Path(package_folder, "setup.py").write_text("version = '1.0.0'")
+        # Fake build script, count the number of builds
+        Path(sdk_folder, "build_package.py").write_text(
+            "import sys, pathlib\n"
+            "dest = pathlib.Path(sys.argv[2])\n"
+            "pathlib.Path(dest, sys.argv[3] + '.whl').write_text('wheel')\n"
+            "with open('build_count', 'a') as fd: fd.write('.')\n"
+        )
+
+        output_folder = temp_dir / "output"
+        output_folder.mkdir()
+        build_package(sdk_folder, "azure-mgmt-myservice", output_folder)
+        build_package(sdk_folder, "azure-mgmt-myservice", output_folder)
+        assert Path(output_folder, "azure-mgmt-myservice.whl").exists()
+        assert Path(sdk_folder, "build_count").read_text() == "."
+
+        # Content changed, should build again
+        Path(package_folder, "setup.py").write_text("version = '1.0.1'")
+        build_package(sdk_folder, "azure-mgmt-myservice", output_folder)
+        assert Path(sdk_folder, "build_count").read_text() == ".."
+
+        # Another setuptools, should build again
+        monkeypatch.setattr(
+            'swaggertosdk.python_sdk_tools.get_build_versions',
+            lambda: {"python": "3.6.5", "setuptools": "39.0.1", "wheel": "0.31.0"}
+        )
+        build_package(sdk_folder, "azure-mgmt-myservice", output_folder)
+        assert Path(sdk_folder, "build_count").read_text() == "..."
+
+        package_cache_folder = temp_dir / "cache" / "packages" / "azure-mgmt-myservice"
+        assert len(list(package_cache_folder.iterdir())) == 3
+
+def test_evict_packages(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        monkeypatch.setenv("SWAGGER_TO_SDK_CACHE_DIR", str(temp_dir / "cache"))
+        package_cache_folder = temp_dir / "cache" / "packages" / "azure-mgmt-myservice"
+        builds = []
+        for index, used_at in enumerate([3000, 1000, 2000]):
+            build_folder = package_cache_folder / (str(index) * 64)
+            build_folder.mkdir(parents=True)
+            Path(build_folder, "azure-mgmt-myservice.whl").write_text("x" * 100)
+            os.utime(str(build_folder), (used_at, used_at))
+            builds.append(build_folder)
+        # Build in progress
+        Path(package_cache_folder, "tmpbuild").mkdir()
+
+        evict_packages(disk_budget=250)
+        assert sorted(folder.name for folder in package_cache_folder.iterdir()) == [
+            "0" * 64, "2" * 64, "tmpbuild"
+        ]
+
+        # Never evict the build being used
+        evict_packages(disk_budget=0, keep=builds[2])
+        assert sorted(folder.name for folder in package_cache_folder.iterdir()) == ["2" * 64, "tmpbuild"]
+
+def test_get_package_names_from_git():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo = Repo.init(temp_dir)
+        repo.git.config('user.email', 'test@example.com')
+        repo.git.config('user.name', 'Test')
+
+        Path(temp_dir, "README.md").write_text("readme")
+        Path(temp_dir, "azure-mgmt-unchanged").mkdir()
+        Path(temp_dir, "azure-mgmt-unchanged", "setup.py").write_text("setup")
+        repo.git.add(temp_dir)
+        repo.index.commit("Initial commit")
+        repo.git.branch("base")
+
+        Path(temp_dir, "azure-mgmt-myservice").mkdir()
+        Path(temp_dir, "azure-mgmt-myservice", "setup.py").write_text("setup")
+        Path(temp_dir, "README.md").write_text("new readme")
+        repo.git.add(temp_dir)
+        repo.index.commit("PR commit")
+
+        assert get_package_names_from_git(temp_dir, "base") == {"azure-mgmt-myservice"}
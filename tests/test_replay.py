@@ -0,0 +1,62 @@
+from swaggertosdk.restapi.replay import replay, format_report
+
+
+def pull_request_record(number, action="opened"):
+    rest_repo = {
+        "full_name": "Azure/azure-rest-api-specs",
+        "name": "azure-rest-api-specs",
+        "owner": {"login": "Azure"},
+        "url": "https://api.github.com/repos/Azure/azure-rest-api-specs",
+    }
+    fork_repo = dict(rest_repo, full_name="contributor/azure-rest-api-specs", url="https://api.github.com/repos/contributor/azure-rest-api-specs")
+    return {
+        "path": "/github/rest",
+        "args": {"sdkid": "Azure/azure-sdk-for-python"},
+        "event": "pull_request",
+        "body": {
+            "action": action,
+            "number": number,
+            "repository": rest_repo,
+            "pull_request": {
+                "number": number,
+                "title": "Replay PR {}".format(number),
+                "url": "https://api.github.com/repos/Azure/azure-rest-api-specs/pulls/{}".format(number),
+                "issue_url": "https://api.github.com/repos/Azure/azure-rest-api-specs/issues/{}".format(number),
+                "html_url": "https://github.com/Azure/azure-rest-api-specs/pull/{}".format(number),
+                "state": "open",
+                "merged": False,
+                "closed_at": None,
+                "base": {"ref": "master", "label": "Azure:master", "repo": rest_repo},
+                "head": {"ref": "feature", "label": "contributor:feature", "repo": fork_repo},
+            },
+        },
+    }
+
+
+def test_replay():
+    records = [pull_request_record(1), pull_request_record(2), pull_request_record(1, "synchronize")]
+    records[2]["body"].update({"before": "a", "after": "b"})
+    # Sent one after the other: the synchronize does not supersede the first job of PR 1
+    report = replay(records, rate=100, sequential=True)
+
+    assert report["webhooks"] == 3
+    assert report["superseded"] == 0
+    assert report["processed"] == 3
+    assert report["failed"] == 0
+    assert report["latency"]["max"] >= report["duration"]["max"]
+    # One SDK PR and one context PR attempt per job, the context PR and the synchronize find the existing ones
+    assert report["api_calls"]["POST /repos/<owner>/<repo>/pulls"] == 6
+    assert report["api_calls"]["GET /repos/<owner>/<repo>/pulls"] == 3
+    assert "GitHub API calls: {}".format(report["api_calls_total"]) in format_report(report)
+
+
+def test_replay_graphql():
+    records = [pull_request_record(1), pull_request_record(2)]
+    report = replay(records, rate=100, graphql=True, sequential=True)
+
+    assert report["processed"] == 2
+    assert report["failed"] == 0
+    # Files, SDK PR and labels come from the GraphQL snapshots
+    assert report["api_calls"]["POST /graphql"] == 4
+    assert "GET /repos/<owner>/<repo>/pulls/<int:number>/files" not in report["api_calls"]
+    assert "GET /repos/<owner>/<repo>/labels/<name>" not in report["api_calls"]
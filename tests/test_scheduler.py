@@ -0,0 +1,246 @@
+from threading import Thread
+import time
+
+from swaggertosdk.autorest_tools import CancellationToken
+from swaggertosdk.restapi.scheduler import (
+    AGING_SECONDS,
+    Job,
+    JobScheduler,
+    JobStats,
+    PRIORITY_OPENED,
+    PRIORITY_SYNC,
+    PRIORITY_URGENT,
+    RateBudget,
+    estimate_api_cost,
+    get_priority,
+    parse_tenant_weights,
+    select_job,
+    supersedes,
+)
+
+
+def make_job(name, priority, enqueued_at=0., sdkid="Azure/azure-sdk-for-python"):
+    return Job("pull_request", {"name": name}, sdkid, "master", sdkid.split("/")[-1], priority, enqueued_at, CancellationToken())
+
+
+def make_pr_job(number, action, priority=PRIORITY_SYNC, enqueued_at=0.):
+    body = {
+        "action": action,
+        "number": number,
+        "repository": {"full_name": "Azure/azure-rest-api-specs"},
+        "pull_request": {"head": {"repo": {"full_name": "fork/azure-rest-api-specs"}}},
+        "before": "old_sha",
+        "after": "new_sha",
+    }
+    return make_job("", priority, enqueued_at)._replace(body=body)
+
+
+def test_get_priority():
+    assert get_priority("pull_request", {"action": "closed"}) == PRIORITY_URGENT
+    assert get_priority("issue_comment", {"action": "created"}) == PRIORITY_URGENT
+    assert get_priority("pull_request", {"action": "opened"}) == PRIORITY_OPENED
+    assert get_priority("pull_request", {"action": "synchronize"}) == PRIORITY_SYNC
+
+
+def test_select_job():
+    assert select_job([], 0) is None
+
+    jobs = [make_job("sync", PRIORITY_SYNC, 0), make_job("open", PRIORITY_OPENED, 1), make_job("merge", PRIORITY_URGENT, 2)]
+    assert select_job(jobs, 3) == 2
+    assert select_job(jobs[:2], 3) == 1
+    # Same priority, oldest first
+    assert select_job([make_job("new", PRIORITY_SYNC, 5), make_job("old", PRIORITY_SYNC, 4)], 6) == 1
+    # A sync waiting long enough goes before a fresh merge
+    now = 3 * AGING_SECONDS
+    assert select_job([make_job("sync", PRIORITY_SYNC, 0), make_job("merge", PRIORITY_URGENT, now)], now) == 0
+
+
+def test_job_scheduler():
+    scheduler = JobScheduler(maxsize=3)
+    for job in [make_job("sync", PRIORITY_SYNC), make_job("open", PRIORITY_OPENED), make_job("merge", PRIORITY_URGENT)]:
+        scheduler.put(job)
+    assert scheduler.qsize() == 3
+
+    # Scheduler is full, this put blocks until a job is got
+    producer = Thread(target=scheduler.put, args=(make_job("late merge", PRIORITY_URGENT, 1.),))
+    producer.start()
+    jobs = [scheduler.get()]
+    producer.join(timeout=10)
+    assert not producer.is_alive()
+    while scheduler.qsize():
+        jobs.append(scheduler.get())
+
+    assert [job.body["name"] for job in jobs] == ["merge", "late merge", "open", "sync"]
+    for job in jobs:
+        scheduler.task_done(job)
+    scheduler.join()
+
+
+def test_select_job_tenants():
+    java = "Azure/azure-sdk-for-java"
+    jobs = [make_job("java sync", PRIORITY_SYNC, 0, java), make_job("python sync", PRIORITY_SYNC, 1)]
+    # Python got less service, even if Java job is older
+    assert select_job(jobs, 2, served={java: 3, "Azure/azure-sdk-for-python": 1}) == 1
+    # Java has twice the weight
+    assert select_job(jobs, 2, served={java: 3, "Azure/azure-sdk-for-python": 2}, weights={java: 2}) == 0
+    # Java is at its cap
+    assert select_job(jobs[:1], 2, running={java: 1}, max_running=1) is None
+
+    assert parse_tenant_weights("Azure/azure-sdk-for-java=2, Azure/azure-sdk-for-go=0.5") == {
+        java: 2.,
+        "Azure/azure-sdk-for-go": .5,
+    }
+    assert parse_tenant_weights(None) == {}
+
+
+def test_job_scheduler_tenants():
+    java = "Azure/azure-sdk-for-java"
+    scheduler = JobScheduler(weights={}, max_running=1)
+    for index in range(3):
+        scheduler.put(make_job("java {}".format(index), PRIORITY_SYNC, index, java))
+    scheduler.put(make_job("python merge", PRIORITY_URGENT, 10))
+    scheduler.put(make_job("python sync", PRIORITY_SYNC, 11))
+
+    # Round robin between tenants, Java backlog does not delay Python
+    first = scheduler.get()
+    second = scheduler.get()
+    assert {first.sdkid, second.sdkid} == {java, "Azure/azure-sdk-for-python"}
+    assert scheduler.tenants_status()[java] == {"queued": 2, "running": 1}
+
+    scheduler.task_done(first)
+    scheduler.task_done(second)
+    names = []
+    while scheduler.qsize():
+        job = scheduler.get()
+        names.append(job.body["name"])
+        scheduler.task_done(job)
+    assert names.index("python sync") < names.index("java 2")
+
+
+def test_rate_budget():
+    sync_job = make_job("sync", PRIORITY_SYNC)
+    merge_job = make_job("merge", PRIORITY_URGENT)
+    cost = estimate_api_cost(sync_job)
+    budget = RateBudget(reserve=0.2)
+    # Unknown quota, everything can run
+    assert budget.can_run(sync_job)
+
+    budget.update(200 + cost, 1000, time.time() + 3600)
+    assert budget.can_run(sync_job)
+    budget.spend(sync_job)
+    # Quota left is the reserve, only for urgent jobs
+    assert budget.get_remaining() == 200
+    assert not budget.can_run(sync_job)
+    assert budget.can_run(merge_job)
+    # Quota is back after the reset
+    assert budget.can_run(sync_job, now=time.time() + 3601)
+
+    budget.update(200, 1000, time.time() - 1)
+    budget.spend(sync_job)
+    assert budget.get_remaining() == 1000 - cost
+
+
+def test_select_job_rate_budget():
+    budget = RateBudget(reserve=0.2)
+    budget.update(210, 1000, time.time() + 3600)
+    jobs = [make_job("sync", PRIORITY_SYNC, 0), make_job("merge", PRIORITY_URGENT, 1)]
+    assert select_job(jobs[:1], 2, rate_budget=budget) is None
+    assert select_job(jobs, 2, rate_budget=budget) == 1
+    budget.update(10, 1000, time.time() + 3600)
+    assert select_job(jobs, 2, rate_budget=budget) is None
+
+
+def test_job_scheduler_rate_budget():
+    budget = RateBudget(reserve=0.2)
+    scheduler = JobScheduler(rate_budget=budget)
+    budget.update(200, 1000, time.time() + 3600)
+    scheduler.put(make_job("sync", PRIORITY_SYNC))
+    scheduler.put(make_job("merge", PRIORITY_URGENT))
+    job = scheduler.get()
+    assert job.body["name"] == "merge"
+    assert budget.get_remaining() == 200 - estimate_api_cost(job)
+    scheduler.task_done(job)
+    # Sync job is deferred until the quota resets
+    jobs = []
+    consumer = Thread(target=lambda: jobs.append(scheduler.get()))
+    consumer.start()
+    consumer.join(timeout=0.2)
+    assert consumer.is_alive()
+    budget.update(1000, 1000, time.time() + 3600)
+    scheduler.put(make_job("new sync", PRIORITY_SYNC, 1.))  # Wakes up the consumer
+    consumer.join(timeout=10)
+    assert [job.body["name"] for job in jobs] == ["sync"]
+
+
+def test_supersedes():
+    assert supersedes(make_pr_job(1, "synchronize"), make_pr_job(1, "opened"))
+    assert not supersedes(make_pr_job(2, "synchronize"), make_pr_job(1, "opened"))
+    assert not supersedes(make_pr_job(1, "reopened"), make_pr_job(1, "closed"))
+    other_sdk = make_pr_job(1, "synchronize")._replace(sdkid="Azure/azure-sdk-for-java")
+    assert not supersedes(other_sdk, make_pr_job(1, "opened"))
+    # Events that do not generate never supersede
+    assert not supersedes(make_pr_job(1, "labeled"), make_pr_job(1, "opened"))
+    no_new_commit = make_pr_job(1, "synchronize")
+    no_new_commit.body["after"] = no_new_commit.body["before"]
+    assert not supersedes(no_new_commit, make_pr_job(1, "opened"))
+    same_repo = make_pr_job(1, "synchronize")
+    same_repo.body["pull_request"]["head"]["repo"]["full_name"] = "Azure/azure-rest-api-specs"
+    assert not supersedes(same_repo, make_pr_job(1, "opened"))
+    deleted_fork = make_pr_job(1, "synchronize")
+    deleted_fork.body["pull_request"]["head"]["repo"] = None
+    assert supersedes(deleted_fork, make_pr_job(1, "opened"))
+
+
+def test_job_scheduler_supersede():
+    scheduler = JobScheduler(weights={})
+    scheduler.put(make_pr_job(1, "opened", PRIORITY_OPENED, 0))
+    running = scheduler.get()
+    scheduler.put(make_pr_job(1, "synchronize", PRIORITY_SYNC, 1))
+    scheduler.put(make_pr_job(2, "opened", PRIORITY_OPENED, 2))
+    assert running.cancel_token.is_cancelled()
+
+    # Queued sync of PR 1 is dropped by the next one, which keeps its age
+    scheduler.put(make_pr_job(1, "synchronize", PRIORITY_SYNC, 3))
+    assert scheduler.qsize() == 2
+    assert scheduler.superseded == 2
+    scheduler.task_done(running)
+    job = scheduler.get()
+    assert (job.body["number"], job.enqueued_at) == (2, 2)
+    scheduler.task_done(job)
+    job = scheduler.get()
+    assert (job.body["number"], job.enqueued_at) == (1, 1)
+    assert not job.cancel_token.is_cancelled()
+    scheduler.task_done(job)
+    scheduler.join()
+
+
+def test_job_scheduler_labeled_event():
+    scheduler = JobScheduler(weights={})
+    scheduler.put(make_pr_job(1, "synchronize", PRIORITY_SYNC, 0))
+    running = scheduler.get()
+    scheduler.put(make_pr_job(2, "opened", PRIORITY_OPENED, 1))
+    scheduler.put(make_pr_job(1, "labeled", PRIORITY_SYNC, 2))
+    scheduler.put(make_pr_job(2, "labeled", PRIORITY_SYNC, 3))
+    # Running synchronize and queued "opened" are kept
+    assert not running.cancel_token.is_cancelled()
+    assert scheduler.qsize() == 3
+    assert scheduler.superseded == 0
+    scheduler.task_done(running)
+    jobs = []
+    while scheduler.qsize():
+        job = scheduler.get()
+        jobs.append((job.body["number"], job.body["action"]))
+        scheduler.task_done(job)
+    assert jobs == [(2, "opened"), (1, "labeled"), (2, "labeled")]
+
+
+def test_job_stats():
+    job_stats = JobStats()
+    job_stats.record(1, 2, sdkid="Azure/azure-sdk-for-java")
+    job_stats.record(3, 4, False, sdkid="Azure/azure-sdk-for-python")
+    stats = job_stats.as_dict()
+    assert stats["processed"] == 2
+    assert stats["failed"] == 1
+    assert stats["latency"]["max"] == 7
+    assert stats["tenants"]["Azure/azure-sdk-for-java"]["queue_wait"]["max"] == 1
+    assert stats["tenants"]["Azure/azure-sdk-for-python"]["failed"] == 1
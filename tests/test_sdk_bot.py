@@ -1,3 +1,9 @@
+from types import SimpleNamespace
+import unittest.mock
+
+from git import GitCommandError
+import pytest
+
 from swaggertosdk.restapi.sdkbot import GithubHandler
 
 
@@ -9,3 +15,60 @@ def test_sdk_bot_git(github_client, github_token):
 
     output = handler.git(issue, "show", "2a0c2f0285117ccb07b6f9c32749d6c50abed70b")
     assert "commit 2a0c2f0285117ccb07b6f9c32749d6c50abed70b" in output
+
+
+def _mock_rebase_pr(behind_by):
+    pr = unittest.mock.MagicMock()
+    pr.head.ref = "feature"
+    pr.head.repo.full_name = "fork/azure-sdk-for-python"
+    pr.head.repo.owner.login = "fork"
+    pr.base.ref = "master"
+    pr.base.repo.full_name = "Azure/azure-sdk-for-python"
+    pr.base.repo.compare.return_value = SimpleNamespace(behind_by=behind_by)
+    issue = unittest.mock.MagicMock()
+    issue.repository.get_pull.return_value = pr
+    return issue, pr
+
+
+@unittest.mock.patch('swaggertosdk.restapi.sdkbot.BranchLockManager')
+@unittest.mock.patch('swaggertosdk.restapi.sdkbot.configure_user')
+@unittest.mock.patch('swaggertosdk.restapi.sdkbot.Repo')
+@unittest.mock.patch('swaggertosdk.restapi.sdkbot.get_workspace_pool')
+def test_sdk_bot_rebase(mocked_get_workspace_pool, mocked_repo, mocked_configure_user, mocked_branch_lock_manager):
+    handler = GithubHandler("token")
+    sdk_repo = mocked_repo.return_value
+
+    # Already up to date: no clone
+    issue, pr = _mock_rebase_pr(behind_by=0)
+    output = handler.rebase(issue)
+    assert output == "Nothing to rebase, this branch is already based on master"
+    pr.base.repo.compare.assert_called_once_with("master", "fork:feature")
+    mocked_get_workspace_pool.return_value.lease.assert_not_called()
+
+    # Clean rebase, on the asked branch
+    issue, pr = _mock_rebase_pr(behind_by=2)
+    output = handler.rebase(issue, "restapi_auto_123")
+    assert output == "Rebase done and pushed to the branch"
+    pr.base.repo.compare.assert_called_once_with("restapi_auto_123", "fork:feature")
+    mocked_get_workspace_pool.return_value.lease.assert_called_once_with(
+        "token", "fork/azure-sdk-for-python@feature"
+    )
+    mocked_branch_lock_manager.return_value.lock.assert_called_once_with("fork/azure-sdk-for-python", ["feature"])
+    sdk_repo.create_remote.assert_called_once_with(
+        'upstream', url='https://github.com/Azure/azure-sdk-for-python.git'
+    )
+    sdk_repo.create_remote.return_value.fetch.assert_called_once_with("restapi_auto_123")
+    sdk_repo.git.rebase.assert_called_once_with("upstream/restapi_auto_123")
+    sdk_repo.git.push.assert_called_once_with(force=True)
+
+    # Conflict: rebase is aborted, nothing is pushed, and the error is reported
+    sdk_repo.reset_mock()
+    issue, pr = _mock_rebase_pr(behind_by=2)
+    sdk_repo.git.rebase.side_effect = [GitCommandError("rebase", 1, stderr="CONFLICT (content)"), ""]
+    with pytest.raises(GitCommandError):
+        handler.rebase(issue)
+    assert sdk_repo.git.rebase.call_args_list == [
+        unittest.mock.call("upstream/master"),
+        unittest.mock.call("--abort"),
+    ]
+    sdk_repo.git.push.assert_not_called()
@@ -0,0 +1,204 @@
+import json
+from pathlib import Path
+import tempfile
+import unittest.mock
+
+from git import Repo
+
+from swaggertosdk.SwaggerToSdkNewCLI import get_skip_callback
+from swaggertosdk.swagger_graph import (
+    SwaggerGraph,
+    get_impacted_readme_files,
+    get_readme_tags,
+    get_tag_input_files,
+    is_default_tag_conditional,
+    is_tag_impacted,
+)
+
+README = """# Network
+
+``` yaml
+openapi-type: arm
+tag: package-2018-02
+```
+
+``` yaml $(tag) == 'package-2018-02'
+input-file:
+  - Microsoft.Network/stable/2018-02-01/network.json
+  - $(this-folder)/Microsoft.Network/stable/2018-02-01/vnet.json
+```
+
+``` yaml $(tag) == 'package-2017-10'
+input-file:
+- Microsoft.Network/stable/2017-10-01/network.json
+```
+
+``` yaml $(python)
+python:
+  namespace: azure.mgmt.network
+```
+"""
+
+
+def create_spec(folder):
+    network = Path(folder, "specification", "network", "resource-manager")
+    common = Path(folder, "specification", "common-types", "resource-management", "v1")
+    files = {
+        network / "Microsoft.Network/stable/2018-02-01/network.json": {
+            "definitions": {"Vnet": {"$ref": "./vnet.json#/definitions/Vnet"}}
+        },
+        network / "Microsoft.Network/stable/2018-02-01/vnet.json": {
+            "definitions": {"Vnet": {"$ref": "../../../../../common-types/resource-management/v1/types.json#/definitions/Resource"}}
+        },
+        network / "Microsoft.Network/stable/2018-02-01/examples/vnet.json": {
+            "$ref": "../../../../../common-types/resource-management/v1/types.json"
+        },
+        network / "Microsoft.Network/stable/2017-10-01/network.json": {
+            "definitions": {"Local": {"$ref": "#/definitions/Other"}}
+        },
+        common / "types.json": {"definitions": {"Resource": {}}},
+    }
+    for path, content in files.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(content))
+    Path(network, "readme.md").write_text(README)
+    Path(network, "readme.python.md").write_text("Python")
+
+
+def test_get_readme_tags():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_spec(temp_dir)
+        default_tag, tags = get_readme_tags(Path(temp_dir, "specification/network/resource-manager/readme.md"))
+        assert default_tag == "package-2018-02"
+        assert tags["package-2018-02"] == [
+            "Microsoft.Network/stable/2018-02-01/network.json",
+            "Microsoft.Network/stable/2018-02-01/vnet.json",
+        ]
+        assert tags["package-2017-10"] == ["Microsoft.Network/stable/2017-10-01/network.json"]
+        assert tags[None] == []
+
+        input_files = get_tag_input_files(Path("specification/network/resource-manager/readme.md"), None, temp_dir)
+        assert Path("specification/network/resource-manager/Microsoft.Network/stable/2018-02-01/vnet.json") in input_files
+        assert get_tag_input_files(Path("specification/network/resource-manager/readme.md"), "unknown", temp_dir) is None
+
+
+def test_swagger_graph():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        spec_folder = Path(temp_dir, "rest")
+        create_spec(spec_folder)
+        repo = Repo.init(str(spec_folder))
+        repo.git.add("-A")
+        cache_path = Path(temp_dir, "refs.json")
+
+        graph = SwaggerGraph(spec_folder, cache_path).build()
+        common_types = "specification/common-types/resource-management/v1/types.json"
+        network_readme = Path("specification/network/resource-manager/readme.md")
+        assert graph.get_impacted_tags([common_types]) == {network_readme: {"package-2018-02"}}
+        assert len(json.loads(cache_path.read_text())) == 4  # Examples are skipped
+
+        # A new blob is scanned again
+        Path(spec_folder, "specification/network/resource-manager/Microsoft.Network/stable/2018-02-01/vnet.json").write_text("{}")
+        repo.git.add("-A")
+        graph = SwaggerGraph(spec_folder, cache_path).build()
+        assert graph.get_impacted_tags([common_types]) == {}
+        # Blob of the old version is dropped from the cache
+        assert len(json.loads(cache_path.read_text())) == 4
+
+        readme_files = get_impacted_readme_files(
+            [
+                "specification/network/resource-manager/Microsoft.Network/stable/2017-10-01/network.json",
+                "specification/network/resource-manager/Microsoft.Network/stable/2018-02-01/examples/vnet.json",
+            ],
+            spec_folder,
+            graph
+        )
+        assert readme_files == {network_readme}
+
+        readme_files = get_impacted_readme_files(["specification/network/resource-manager/readme.md"], spec_folder)
+        assert readme_files == {network_readme, Path("specification/network/resource-manager/readme.python.md")}
+
+
+def test_swagger_graph_uppercase_readme():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_spec(temp_dir)
+        network = Path(temp_dir, "specification/network/resource-manager")
+        Path(network, "readme.md").rename(Path(network, "README.md"))
+        graph = SwaggerGraph(temp_dir, Path(temp_dir, "refs.json")).build()
+        common_types = "specification/common-types/resource-management/v1/types.json"
+        assert graph.get_impacted_tags([common_types]) == {
+            Path("specification/network/resource-manager/README.md"): {"package-2018-02"}
+        }
+
+
+def test_is_tag_impacted():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_spec(temp_dir)
+        graph = SwaggerGraph(temp_dir, Path(temp_dir, "refs.json")).build()
+        readme = Path("specification/network/resource-manager/readme.md")
+        stable_2017_10 = ["specification/network/resource-manager/Microsoft.Network/stable/2017-10-01/network.json"]
+        common_types = ["specification/common-types/resource-management/v1/types.json"]
+
+        assert is_tag_impacted(readme, None, common_types, temp_dir, graph)
+        assert not is_tag_impacted(readme, "package-2017-10", common_types, temp_dir, graph)
+        assert is_tag_impacted(readme, "package-2017-10", stable_2017_10, temp_dir, graph)
+        assert not is_tag_impacted(readme, "package-2018-02", stable_2017_10, temp_dir, graph)
+        # Readme changes and unknown tags are always impacted
+        assert is_tag_impacted(readme, "package-2018-02", ["specification/network/resource-manager/readme.python.md"], temp_dir, graph)
+        assert is_tag_impacted(readme, "unknown", stable_2017_10, temp_dir, graph)
+        assert not is_tag_impacted(readme, None, ["specification/compute/readme.md"], temp_dir, graph)
+        # Any other input in the Readme folder might be used by the generation
+        assert is_tag_impacted(readme, "package-2018-02", ["specification/network/resource-manager/custom/directive.yaml"], temp_dir, graph)
+        assert not is_tag_impacted(readme, "package-2018-02", ["specification/network/data-plane/directive.yaml"], temp_dir, graph)
+        # No Swagger change, the graph is not needed
+        with unittest.mock.patch("swaggertosdk.swagger_graph.SwaggerGraph.build") as mocked_build:
+            assert not is_tag_impacted(readme, "package-2018-02", ["specification/compute/readme.md"], temp_dir)
+            mocked_build.assert_not_called()
+
+
+def test_language_and_batch_tags():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_spec(temp_dir)
+        graph = SwaggerGraph(temp_dir, Path(temp_dir, "refs.json")).build()
+        readme = Path("specification/network/resource-manager/readme.md")
+        readme_python = Path(temp_dir, "specification/network/resource-manager/readme.python.md")
+        stable_2017_10 = ["specification/network/resource-manager/Microsoft.Network/stable/2017-10-01/network.json"]
+        assert not is_default_tag_conditional(Path(temp_dir, readme))
+        assert not is_tag_impacted(readme, None, stable_2017_10, temp_dir, graph)
+
+        # Python uses another tag: the default tag is unsure
+        readme_python.write_text("``` yaml $(python)\ntag: package-2017-10\n```\n")
+        assert is_default_tag_conditional(Path(temp_dir, readme))
+        assert is_tag_impacted(readme, None, stable_2017_10, temp_dir, graph)
+        # Explicit tag is still solved
+        assert not is_tag_impacted(readme, "package-2018-02", stable_2017_10, temp_dir, graph)
+
+        # Multi API batch
+        readme_python.write_text("``` yaml $(python) && $(multiapi)\nbatch:\n  - tag: package-2017-10\n```\n")
+        assert is_tag_impacted(readme, None, stable_2017_10, temp_dir, graph)
+
+        # Language condition in the main Readme
+        readme_python.write_text("Python")
+        Path(temp_dir, readme).write_text(README + "\n``` yaml $(go)\ntag: package-2017-10\n```\n")
+        assert is_tag_impacted(readme, None, stable_2017_10, temp_dir, graph)
+
+
+def test_skip_callback_tags():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_spec(temp_dir)
+        graph = SwaggerGraph(temp_dir, Path(temp_dir, "refs.json")).build()
+        readme = Path("specification/network/resource-manager/readme.md")
+        stable_2017_10 = ["specification/network/resource-manager/Microsoft.Network/stable/2017-10-01/network.json"]
+        local_conf = {"markdown": str(readme)}
+
+        skip_callback = get_skip_callback({}, {readme}, stable_2017_10, temp_dir, graph)
+        assert skip_callback(str(readme), local_conf)
+        # Tag of the meta conf is used
+        global_conf = {"autorest_options": {"tag": "package-2017-10"}}
+        skip_callback = get_skip_callback(global_conf, {readme}, stable_2017_10, temp_dir, graph)
+        assert not skip_callback(str(readme), local_conf)
+        # Multi API is never skipped
+        global_conf = {"autorest_options": {"multiapi": ""}}
+        skip_callback = get_skip_callback(global_conf, {readme}, stable_2017_10, temp_dir, graph)
+        assert not skip_callback(str(readme), local_conf)
+        skip_callback = get_skip_callback({}, {readme}, stable_2017_10, temp_dir, graph)
+        assert not skip_callback(str(readme), {"markdown": str(readme), "autorest_options": {"batch": [{"tag": "package-2017-10"}]}})
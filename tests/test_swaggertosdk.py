@@ -5,8 +5,12 @@ import logging
 import tempfile
 from pathlib import Path
 
+from git import Repo
+
 from swaggertosdk.SwaggerToSdkCore import (
     build_file_content,
+    clear_toolchain_cache,
+    get_toolchain_fingerprint,
     extract_conf_from_readmes,
     get_context_tag_from_git_object,
     get_readme_files_from_git_object,
@@ -14,6 +18,7 @@ from swaggertosdk.SwaggerToSdkCore import (
     read_config_from_github,
     get_language_from_conf,
     Language,
+    GenerationHistory,
     this_conf_will_generate_for_this_pr
 )
 from swaggertosdk.SwaggerToSdkNewCLI import (
@@ -22,7 +27,18 @@ from swaggertosdk.SwaggerToSdkNewCLI import (
     move_wrapper_files_or_dirs,
     delete_extra_files,
     write_build_file,
-    move_autorest_files
+    move_autorest_files,
+    execute_after_script,
+    execute_meta_after_script,
+    format_plan,
+    plan_project,
+    push_branches,
+    build_project,
+    do_scoped_commit,
+    get_written_paths,
+    tune_git_index,
+    SdkTarget,
+    generate_sdks_from_git_object,
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -154,9 +170,31 @@ def test_get_input_path():
 
 @unittest.mock.patch('swaggertosdk.SwaggerToSdkCore.autorest_latest_version_finder')
 def test_build(mocked_autorest_latest_version_finder):
+    clear_toolchain_cache()
     build = build_file_content()
     assert 'autorest' in build
 
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkCore.autorest_bootstrap_version_finder')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkCore.autorest_latest_version_finder')
+def test_toolchain_cache(mocked_autorest_latest_version_finder, mocked_autorest_bootstrap_version_finder):
+    clear_toolchain_cache()
+    mocked_autorest_latest_version_finder.return_value = '123'
+    mocked_autorest_bootstrap_version_finder.return_value = {}
+
+    fingerprint = get_toolchain_fingerprint()
+    assert build_file_content() == {'autorest': '123', 'autorest_bootstrap': {}}
+    assert get_toolchain_fingerprint() == fingerprint
+    assert mocked_autorest_latest_version_finder.call_count == 1
+
+    # A new autorest in PATH invalidates the cache
+    with unittest.mock.patch('swaggertosdk.SwaggerToSdkCore._autorest_bin_stat') as mocked_stat:
+        mocked_stat.return_value = ('/new/autorest', 42.0)
+        mocked_autorest_latest_version_finder.return_value = '456'
+        assert build_file_content()['autorest'] == '456'
+        assert get_toolchain_fingerprint() != fingerprint
+    assert mocked_autorest_latest_version_finder.call_count == 2
+    clear_toolchain_cache()
+
 def test_move_wrapper_files_or_dirs():
     with tempfile.TemporaryDirectory() as temp_dir:
         output = Path(temp_dir, 'output')
@@ -244,6 +282,7 @@ def test_delete_extra_files():
 
 @unittest.mock.patch('swaggertosdk.SwaggerToSdkCore.autorest_latest_version_finder')
 def test_write_build_file(mocked_autorest_latest_version_finder):
+    clear_toolchain_cache()
     mocked_autorest_latest_version_finder.return_value = '123'
     with tempfile.TemporaryDirectory() as temp_dir:
         write_build_file(
@@ -294,6 +333,107 @@ def test_move_autorest_files():
         assert not Path(output, 'erase.txt').exists()
 
 
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.execute_simple_command')
+def test_execute_after_script(mocked_execute_simple_command):
+    global_conf = {
+        "after_scripts": ["gofmt -w $SWAGGER_TO_SDK_OUTPUT_DIRS"],
+        "envs": {"GOPATH": "/go"}
+    }
+
+    execute_after_script("/sdk", global_conf, {"after_scripts": ["local script"]})
+    assert mocked_execute_simple_command.call_count == 1
+    call_args = mocked_execute_simple_command.call_args
+    assert call_args[0][0] == "local script"
+    assert call_args[1]["env"]["GOPATH"] == "/go"
+
+    mocked_execute_simple_command.reset_mock()
+    execute_after_script("/sdk", global_conf, {})
+    assert not mocked_execute_simple_command.called
+
+    execute_meta_after_script("/sdk", global_conf, ["services/a", "services/b"])
+    assert mocked_execute_simple_command.call_count == 1
+    call_args = mocked_execute_simple_command.call_args
+    assert call_args[0][0] == "gofmt -w $SWAGGER_TO_SDK_OUTPUT_DIRS"
+    assert call_args[1]["cwd"] == "/sdk"
+    assert call_args[1]["env"]["SWAGGER_TO_SDK_OUTPUT_DIRS"] == "services/a services/b"
+    assert call_args[1]["env"]["GOPATH"] == "/go"
+
+
+def test_generation_history():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        history = GenerationHistory(Path(temp_dir, "history.json"))
+        assert history.estimate("myproject") is None
+
+        for duration in [10, 30, 20]:
+            history.record("myproject", duration)
+        assert history.estimate("myproject") == 20
+        assert history.estimate("otherproject") is None
+
+        for duration in range(100, 120):
+            history.record("myproject", duration)
+        assert len(history.load()["myproject"]) == 10
+
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.GenerationHistory')
+def test_plan_project(mocked_history):
+    mocked_history.return_value.estimate.return_value = 42
+    project_plan = plan_project(
+        "myproject",
+        Path("/a/b/readme.md"),
+        {"autorest_options": {"python": ""}},
+        {"output_dir": "azure-mgmt-myproject"},
+        "autorest"
+    )
+    assert project_plan.project == "myproject"
+    assert project_plan.output_dir == "azure-mgmt-myproject"
+    assert project_plan.estimated_duration == 42
+    assert project_plan.cmd_line[0] == "autorest"
+    assert project_plan.cmd_line[-1] == "--python"
+
+    text = format_plan([project_plan, project_plan._replace(estimated_duration=None)])
+    assert "Project myproject" in text
+    assert "Estimated duration: 42s" in text
+    assert "Estimated duration: unknown" in text
+    assert "Total: 2 project(s), estimated duration 42s (1 without history)" in text
+
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkCore.autorest_latest_version_finder')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.GenerationHistory')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.execute_after_script')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.generate_code')
+def test_build_project_no_op(mocked_generate_code, mocked_execute_after_script, mocked_history, mocked_autorest_latest_version_finder):
+    clear_toolchain_cache()
+    mocked_autorest_latest_version_finder.return_value = '123'
+    generated_content = {"value": "v1"}
+    def generate(input_file, global_conf, local_conf, output_dir=None, autorest_bin=None, cancel_token=None):
+        output_dir.mkdir(parents=True)
+        Path(output_dir, "generated.py").write_text(generated_content["value"])
+    mocked_generate_code.side_effect = generate
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        sdk_folder = Path(temp_dir, "sdk")
+        Path(sdk_folder, "output").mkdir(parents=True)
+        local_conf = {"output_dir": "output", "build_dir": "output"}
+
+        def build():
+            with tempfile.TemporaryDirectory() as build_temp_dir:
+                return build_project(build_temp_dir, "myproject", None, sdk_folder, {}, local_conf)
+
+        assert build()
+        assert Path(sdk_folder, "output", "generated.py").read_text() == "v1"
+        assert Path(sdk_folder, "output", "build_manifest.json").exists()
+        assert mocked_execute_after_script.call_count == 1
+
+        # Same generated code, nothing is touched
+        Path(sdk_folder, "output", "build.json").unlink()
+        assert not build()
+        assert not Path(sdk_folder, "output", "build.json").exists()
+        assert mocked_execute_after_script.call_count == 1
+
+        generated_content["value"] = "v2"
+        assert build()
+        assert Path(sdk_folder, "output", "generated.py").read_text() == "v2"
+        assert mocked_execute_after_script.call_count == 2
+
+
 def test_get_language_from_conf():
     conf = {
         "autorest_options":{
@@ -359,6 +499,16 @@ def test_extract_conf_from_readmes(mocked_execute_simple_command):
 
     assert len(config["projects"]) == 2
 
+    # Several SDKs sharing the readme cache call Autorest once per readme
+    mocked_execute_simple_command.reset_mock()
+    readme_confs = {}
+    python_config, java_config = {}, {}
+    extract_conf_from_readmes(swagger_files_in_pr, Path(CWD, "files"), sdk_git_id, python_config, readme_confs)
+    extract_conf_from_readmes(swagger_files_in_pr, Path(CWD, "files"), "Azure/azure-sdk-for-java", java_config, readme_confs)
+    assert mocked_execute_simple_command.call_count == 1
+    assert len(python_config["projects"]) == 1
+    assert "projects" not in java_config
+
 def test_get_configuration_github_path():
     raw_link = str(get_configuration_github_path("Azure/azure-sdk-for-python", "dev"))
     assert raw_link == "https://raw.githubusercontent.com/Azure/azure-sdk-for-python/dev/swagger_to_sdk_config.json"
@@ -375,3 +525,127 @@ def test_read_config_from_github(github_token):
     except Exception:
         # This test might fail on Travis for some reasons....
         pass
+
+def test_push_branches():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        origin = Repo.init(str(Path(temp_dir, "origin")), bare=True)
+
+        def clone(name):
+            repo = Repo.clone_from(origin.working_dir, str(Path(temp_dir, name)))
+            repo.git.config('user.email', 'test@example.com')
+            repo.git.config('user.name', 'Test')
+            return repo
+
+        def commit_file(repo, filename):
+            Path(repo.working_tree_dir, filename).write_text(filename)
+            repo.git.add(repo.working_tree_dir)
+            return repo.index.commit(filename).hexsha
+
+        first = clone("first")
+        commit_file(first, "initial.txt")
+        first.git.push("origin", "HEAD:master")
+        first.git.checkout("-b", "restapi_auto_context")
+        first.git.push("origin", "restapi_auto_context")
+
+        # Generation: base branch + new head branch
+        sdk_repo = clone("sdk")
+        sdk_repo.git.checkout("restapi_auto_context")
+        sdk_repo.git.checkout("-b", "restapi_auto_1234")
+        commit_file(sdk_repo, "generated.txt")
+
+        # Meanwhile, someone pushed to the base branch
+        concurrent_sha = commit_file(first, "concurrent.txt")
+        first.git.push("origin", "restapi_auto_context")
+
+        push_branches(sdk_repo, ["restapi_auto_context", "restapi_auto_1234"])
+
+        pushed_head = origin.commit("restapi_auto_1234")
+        assert pushed_head.message == "generated.txt"
+        assert pushed_head.parents[0].hexsha == concurrent_sha
+        assert origin.commit("restapi_auto_context").hexsha == concurrent_sha
+        assert sdk_repo.active_branch.name == "restapi_auto_1234"
+
+
+def test_do_scoped_commit():
+    assert get_written_paths({"output_dir": "azure-mgmt-a", "build_dir": "azure-mgmt-a/build"}) == ["azure-mgmt-a", "azure-mgmt-a/build"]
+    assert get_written_paths({"output_dir": "azure-mgmt-a", "after_scripts": ["black ."]}) is None
+    assert get_written_paths({}) is None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo = Repo.init(temp_dir)
+        repo.git.config('user.email', 'test@example.com')
+        repo.git.config('user.name', 'Test')
+        tune_git_index(repo)
+        assert repo.git.config("core.untrackedCache") == "true"
+        for folder in ["generated", "other"]:
+            Path(temp_dir, folder).mkdir()
+            Path(temp_dir, folder, "file.txt").write_text("initial")
+        Path(temp_dir, "generated", "deleted.txt").write_text("initial")
+        repo.git.add(temp_dir)
+        repo.index.commit("Initial")
+
+        Path(temp_dir, "generated", "file.txt").write_text("new")
+        Path(temp_dir, "generated", "deleted.txt").unlink()
+        Path(temp_dir, "other", "file.txt").write_text("new")
+        assert not do_scoped_commit(repo, "Nothing {hexsha}", "master", "123", [])
+
+        commit_sha = do_scoped_commit(repo, "Generated from {hexsha}", "master", "123", ["generated"])
+        assert commit_sha
+        commit = repo.commit(commit_sha)
+        assert commit.message == "Generated from 123"
+        assert sorted(commit.stats.files) == ["generated/deleted.txt", "generated/file.txt"]
+        assert repo.is_dirty(path="other")
+
+        assert do_scoped_commit(repo, "All", "master", "123")
+        assert not repo.is_dirty()
+
+
+@unittest.mock.patch.dict(os.environ, {"GH_TOKEN": "token"})
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.get_github_client')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.generate_sdk_target')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.extract_conf_from_readmes')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.get_impacted_readme_files')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.get_files')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.manage_git_folder')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.get_generation_key')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.GenerationLedger')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.this_conf_will_generate_for_this_pr')
+@unittest.mock.patch('swaggertosdk.SwaggerToSdkNewCLI.read_target_config')
+def test_generate_sdks_from_git_object(mocked_read_target_config, mocked_will_generate, mocked_ledger,
+                                       mocked_get_generation_key, mocked_manage_git_folder, mocked_get_files,
+                                       mocked_get_impacted_readme_files, mocked_extract_conf, mocked_generate_sdk_target,
+                                       mocked_get_github_client):
+    mocked_read_target_config.side_effect = lambda target, gh_token: {"meta": {}, "projects": {}}
+    mocked_will_generate.return_value = True
+    mocked_get_generation_key.return_value = None
+    mocked_get_files.return_value = []
+    mocked_get_impacted_readme_files.return_value = {Path("specification/dns/resource-manager/readme.md")}
+    def generate(git_object, target, *args):
+        if target.sdk_tag == "azure-sdk-for-ruby":
+            raise ValueError("Generation failed")
+        return "https://github.com/{}/commit/sha".format(target.sdk_git_id)
+    mocked_generate_sdk_target.side_effect = generate
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        mocked_manage_git_folder.return_value.__enter__.return_value = Path(temp_dir)
+        targets = [
+            SdkTarget("Azure/azure-sdk-for-{}".format(lang), "restapi_auto_1", [], "master", "azure-sdk-for-{}".format(lang))
+            for lang in ["go", "java", "ruby"]
+        ]
+        rest_pr = unittest.mock.Mock(merge_commit_sha="merge_sha", number=1, spec=["merge_commit_sha", "number", "base"])
+        rest_pr.base.repo.full_name = "Azure/azure-rest-api-specs"
+        results = generate_sdks_from_git_object(rest_pr, targets, None, return_exceptions=True)
+
+    # RestAPI repo is cloned once, for all the targets
+    assert mocked_manage_git_folder.call_count == 1
+    assert mocked_get_impacted_readme_files.call_count == 1
+    # Readme extraction shares the same cache
+    assert len({id(call[0][4]) for call in mocked_extract_conf.call_args_list}) == 1
+    assert results[0] == "https://github.com/Azure/azure-sdk-for-go/commit/sha"
+    assert results[1] == "https://github.com/Azure/azure-sdk-for-java/commit/sha"
+    assert isinstance(results[2], ValueError)
+    # Ledger lookups use the shared GitHub client
+    mocked_get_github_client.assert_called_with("token")
+    assert [call[0][0] for call in mocked_get_github_client.return_value.get_repo.call_args_list] == [
+        "Azure/azure-sdk-for-go", "Azure/azure-sdk-for-java", "Azure/azure-sdk-for-ruby"
+    ]
@@ -0,0 +1,144 @@
+from pathlib import Path
+import tempfile
+from threading import Thread
+
+from git import Repo
+
+from swaggertosdk.workspace_pool import WorkspacePool
+
+
+def create_origin(folder):
+    origin = Repo.init(str(folder))
+    origin.git.config('user.email', 'test@example.com')
+    origin.git.config('user.name', 'Test')
+    Path(folder, "file.txt").write_text("master")
+    origin.git.add(str(folder))
+    origin.index.commit("Initial commit")
+    origin.git.checkout("-b", "feature")
+    Path(folder, "file.txt").write_text("feature")
+    origin.git.add(str(folder))
+    origin.index.commit("Feature commit")
+    origin.git.checkout("master")
+    return origin
+
+
+def test_workspace_pool(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        origin_folder = Path(temp_dir, "origin")
+        create_origin(origin_folder)
+
+        clones = []
+        def local_clone(gh_token, folder, sdk_git_id, branch_or_commit=None, *, pr_number=None):
+            clones.append(sdk_git_id)
+            repo = Repo.clone_from(str(origin_folder), str(folder))
+            if branch_or_commit:
+                repo.git.checkout(branch_or_commit)
+        monkeypatch.setattr('swaggertosdk.workspace_pool.clone_to_path', local_clone)
+
+        pool = WorkspacePool(Path(temp_dir, "pool"), disk_budget=10 * 1024**3)
+
+        with pool.lease(None, "Azure/myrepo@feature") as folder:
+            assert Path(folder, "file.txt").read_text() == "feature"
+            # Make a mess, next lease should not see it
+            Path(folder, "file.txt").write_text("dirty")
+            Path(folder, "untracked.txt").write_text("untracked")
+            Repo(str(folder)).create_remote("upstream", url=str(origin_folder))
+
+        with pool.lease(None, "Azure/myrepo@master") as folder:
+            repo = Repo(str(folder))
+            assert Path(folder, "file.txt").read_text() == "master"
+            assert not Path(folder, "untracked.txt").exists()
+            assert [r.name for r in repo.remotes] == ["origin"]
+            assert repo.active_branch.name == "master"
+
+        with pool.lease(None, "Azure/myrepo") as folder:
+            assert Path(folder, "file.txt").read_text() == "master"
+
+        assert clones == ["Azure/myrepo"]
+
+        # Budget of 0, everything not used is evicted
+        pool.disk_budget = 0
+        pool.evict()
+        assert [folder.name for folder in Path(temp_dir, "pool").iterdir()] == [".locks"]
+
+
+def test_workspace_pool_shared(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        origin_folder = Path(temp_dir, "origin")
+        create_origin(origin_folder)
+        monkeypatch.setattr(
+            'swaggertosdk.workspace_pool.clone_to_path',
+            lambda gh_token, folder, sdk_git_id, branch_or_commit=None, *, pr_number=None: Repo.clone_from(str(origin_folder), str(folder))
+        )
+        sizes_computed = []
+        def get_folder_size(folder):
+            sizes_computed.append(folder.name)
+            return 1
+        monkeypatch.setattr('swaggertosdk.workspace_pool.get_folder_size', get_folder_size)
+
+        # Two pools on the same folder, as two processes would have
+        pool = WorkspacePool(Path(temp_dir, "pool"), disk_budget=10)
+        other_process_pool = WorkspacePool(Path(temp_dir, "pool"), disk_budget=0)
+
+        with pool.lease(None, "Azure/myrepo") as folder:
+            # In use by the other pool, not evicted
+            other_process_pool.evict()
+            assert Path(folder, ".git").is_dir()
+        with pool.lease(None, "Azure/myrepo"):
+            pass
+        # Size is computed once, not at each release
+        assert sizes_computed == ["Azure__myrepo", "Azure__myrepo"]  # Once per pool
+
+        other_process_pool.evict()
+        assert not folder.exists()
+
+
+def test_workspace_pool_slots(monkeypatch):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        origin_folder = Path(temp_dir, "origin")
+        create_origin(origin_folder)
+        clones = []
+        def local_clone(gh_token, folder, sdk_git_id, branch_or_commit=None, *, pr_number=None):
+            clones.append(folder.name)
+            repo = Repo.clone_from(str(origin_folder), str(folder))
+            if branch_or_commit:
+                repo.git.checkout(branch_or_commit)
+        monkeypatch.setattr('swaggertosdk.workspace_pool.clone_to_path', local_clone)
+
+        pool = WorkspacePool(Path(temp_dir, "pool"), disk_budget=10 * 1024**3, slots=2)
+        with pool.lease(None, "Azure/myrepo") as folder:
+            # A command during a long generation gets its own workspace
+            with pool.lease(None, "Azure/myrepo@feature") as other_folder:
+                assert other_folder != folder
+                assert Path(other_folder, "file.txt").read_text() == "feature"
+        with pool.lease(None, "Azure/myrepo"):
+            pass
+        assert clones == ["Azure__myrepo", "Azure__myrepo.1"]
+
+        # All the slots in use: wait for the first one
+        leased = []
+        def lease_in_thread():
+            with pool.lease(None, "Azure/myrepo") as thread_folder:
+                leased.append(thread_folder)
+        with pool.lease(None, "Azure/myrepo"), pool.lease(None, "Azure/myrepo"):
+            lease_thread = Thread(target=lease_in_thread, daemon=True)
+            lease_thread.start()
+            lease_thread.join(0.2)
+            assert not leased
+        lease_thread.join(5)
+        assert leased == [folder]
+        assert len(clones) == 2
+
+        # No disk budget left, no new workspace
+        full_pool = WorkspacePool(Path(temp_dir, "full_pool"), disk_budget=1, slots=2)
+        leased = []
+        def lease_full_pool():
+            with full_pool.lease(None, "Azure/myrepo") as thread_folder:
+                leased.append(thread_folder.name)
+        with full_pool.lease(None, "Azure/myrepo"):
+            lease_thread = Thread(target=lease_full_pool, daemon=True)
+            lease_thread.start()
+            lease_thread.join(0.2)
+            assert not leased
+        lease_thread.join(5)
+        assert leased == ["Azure__myrepo"]